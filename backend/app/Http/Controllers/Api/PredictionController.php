@@ -12,6 +12,7 @@
 use App\Models\Inspection;
 use Carbon\Carbon;
 use Illuminate\Support\Facades\DB;
+use Illuminate\Support\Facades\Redis;
 
 class PredictionController extends Controller
 {
@@ -24,9 +25,26 @@ public function __construct(PredictionService $predictionService)
 
     public function demandForecast(Request $request): JsonResponse
     {
+        $request->validate([
+            'months' => 'sometimes|integer|min:1|max:60',
+        ]);
+
         $organizationId = $request->get('organization_id');
         $productId = $request->get('product_id');
-        $months = $request->get('months', 6);
+        $months = (int) $request->get('months', 6);
+
+        $cached = $this->getCachedForecast('demand', $organizationId, $productId, 'forecast', $months);
+        if ($cached !== null) {
+            return response()->json([
+                'success' => true,
+                'data' => [
+                    'historical' => $cached['historical'],
+                    'forecast' => $cached['forecast'],
+                    'confidence_interval' => $cached['confidence_interval'],
+                    'generated_at' => $cached['generated_at'],
+                ],
+            ]);
+        }
 
         $historicalData = $this->getHistoricalSales($organizationId, $productId, $months * 2);
         $forecast = $this->predictionService->forecastDemand($historicalData, $months);
@@ -69,8 +87,25 @@ public function inventoryOptimization(Request $request): JsonResponse
 
     public function productionPrediction(Request $request): JsonResponse
     {
+        $request->validate([
+            'days' => 'sometimes|integer|min:1|max:365',
+        ]);
+
         $organizationId = $request->get('organization_id');
-        $days = $request->get('days', 30);
+        $days = (int) $request->get('days', 30);
+
+        $cached = $this->getCachedForecast('production', $organizationId, null, 'prediction', $days);
+        if ($cached !== null) {
+            return response()->json([
+                'success' => true,
+                'data' => [
+                    'historical' => $cached['historical'],
+                    'prediction' => $cached['prediction'],
+                    'capacity_utilization' => $this->calculateCapacityUtilization($organizationId),
+                    'generated_at' => $cached['generated_at'],
+                ],
+            ]);
+        }
 
         $historicalProduction = $this->getHistoricalProduction($organizationId, $days * 2);
         $prediction = $this->predictionService->predictProduction($historicalProduction, $days);
@@ -163,6 +198,32 @@ public function salesTrend(Request $request): JsonResponse
         ]);
     }
 
+    private function getCachedForecast(string $kind, $organizationId, $entityId, string $key, int $horizon): ?array
+    {
+        if (!$organizationId) {
+            return null;
+        }
+
+        try {
+            $payload = Redis::get("forecast:{$kind}:{$organizationId}:" . ($entityId ?: 'all'));
+        } catch (\Throwable $e) {
+            return null;
+        }
+
+        $cached = $payload ? json_decode($payload, true) : null;
+        if (!is_array($cached) || count($cached[$key] ?? []) < $horizon) {
+            return null;
+        }
+
+        $cached[$key] = array_slice($cached[$key], 0, $horizon);
+        $cached['confidence_interval'] = [
+            'lower' => array_slice($cached['confidence_interval']['lower'] ?? [], 0, $horizon),
+            'upper' => array_slice($cached['confidence_interval']['upper'] ?? [], 0, $horizon),
+        ];
+
+        return $cached;
+    }
+
     private function getHistoricalSales($organizationId, $productId, $months): array
     {
         $query = SalesOrder::where('organization_id', $organizationId)
@@ -23,6 +23,7 @@ class KpiValue extends Model
         'achievement_percentage',
         'status',
         'trend',
+        'rolling_trend',
         'notes',
         'calculated_at',
     ];
@@ -0,0 +1,187 @@
+import gzip
+import json
+import logging
+import os
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+ACTIVITY_ARCHIVE_KEY = "erp:activity_archive"
+ARCHIVE_CHUNK_ROWS = 1000
+
+
+def as_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value))
+
+
+def json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, bytes):
+        return value.decode("utf-8", "replace")
+    raise TypeError(f"Cannot archive {type(value).__name__}")
+
+
+def partition_dir(root, day):
+    return os.path.join(root, f"{day:%Y}", f"{day:%m}", f"{day:%d}")
+
+
+class ActivityLogArchiver:
+    # Rows are archived whole with SELECT *, so the job works on both the
+    # original activity_log columns and the Spatie ones; it relies only on
+    # the id primary key and created_at.
+    def __init__(
+        self,
+        db_connection,
+        storage_path,
+        redis_client=None,
+        retention_days=365,
+        chunk_rows=ARCHIVE_CHUNK_ROWS,
+        table="activity_log",
+    ):
+        self.db_connection = db_connection
+        self.storage_path = storage_path
+        self.redis_client = redis_client
+        self.retention_days = retention_days
+        self.chunk_rows = chunk_rows
+        self.table = table
+
+    def fetch_chunk(self, last_id):
+        # A primary key range scan; created_at is checked by the caller, so
+        # the last chunk never scans forward through the recent rows.
+        with self.db_connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT * FROM {self.table} WHERE id > %s ORDER BY id LIMIT %s",
+                (last_id, self.chunk_rows),
+            )
+            rows = cursor.fetchall()
+        self.db_connection.rollback()
+        return rows
+
+    def write_chunk(self, rows):
+        # One file per day in the chunk, named after the chunk's id range, so
+        # rewriting a chunk after a failed delete replaces its file instead of
+        # duplicating it.
+        by_day = {}
+        for row in rows:
+            by_day.setdefault(as_datetime(row["created_at"]).date(), []).append(row)
+
+        written = 0
+        for day, day_rows in by_day.items():
+            directory = partition_dir(self.storage_path, day)
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(
+                directory,
+                f"{self.table}_{day_rows[0]['id']}_{day_rows[-1]['id']}.jsonl.gz",
+            )
+            partial_path = f"{path}.part"
+            with gzip.open(partial_path, "wt", encoding="utf-8", compresslevel=6) as fh:
+                for row in day_rows:
+                    fh.write(json.dumps(row, default=json_default))
+                    fh.write("\n")
+            os.replace(partial_path, path)
+            written += os.path.getsize(path)
+        return len(by_day), written
+
+    def delete_chunk(self, ids):
+        try:
+            with self.db_connection.cursor() as cursor:
+                deleted = cursor.execute(
+                    f"DELETE FROM {self.table} WHERE id IN ({', '.join(['%s'] * len(ids))})",
+                    ids,
+                )
+            self.db_connection.commit()
+        except Exception:
+            self.db_connection.rollback()
+            raise
+        return deleted
+
+    def run(self, cutoff=None):
+        cutoff = cutoff or datetime.now() - timedelta(days=self.retention_days)
+        started = time.perf_counter()
+        totals = {"rows": 0, "files": 0, "bytes": 0}
+        last_id = 0
+
+        # ids follow insertion time, so the scan stops at the first row inside
+        # the retention window; a straggler archives on the next run.
+        while True:
+            rows = self.fetch_chunk(last_id)
+            expired = []
+            for row in rows:
+                if as_datetime(row["created_at"]) >= cutoff:
+                    break
+                expired.append(row)
+            if not expired:
+                break
+
+            files, written = self.write_chunk(expired)
+            # The files are in place before their rows go, and each delete
+            # is one short transaction over at most chunk_rows ids.
+            deleted = self.delete_chunk([row["id"] for row in expired])
+            if deleted != len(expired):
+                logging.warning(
+                    f"Archived {len(expired)} activity_log rows but deleted {deleted}"
+                )
+            totals["rows"] += len(expired)
+            totals["files"] += files
+            totals["bytes"] += written
+            last_id = expired[-1]["id"]
+            if len(expired) < len(rows) or len(rows) < self.chunk_rows:
+                break
+
+        elapsed = time.perf_counter() - started
+        totals["seconds"] = round(elapsed, 3)
+        totals["rows_per_sec"] = round(totals["rows"] / elapsed, 1) if elapsed else 0.0
+        if self.redis_client:
+            self.redis_client.hset(
+                ACTIVITY_ARCHIVE_KEY,
+                mapping={
+                    **totals,
+                    "cutoff": cutoff.isoformat(sep=" "),
+                    "archived_at": datetime.now().isoformat(),
+                },
+            )
+        logging.info(
+            f"Activity log archived: {totals['rows']} rows older than {cutoff:%Y-%m-%d} "
+            f"into {totals['files']} files ({totals['bytes']} bytes) in "
+            f"{elapsed * 1000:.1f} ms ({totals['rows_per_sec']:.0f} rows/sec)"
+        )
+        return totals
+
+
+class ActivityArchiveReader:
+    def __init__(self, storage_path):
+        self.storage_path = storage_path
+
+    def files(self, date_from, date_to):
+        # Only the day directories inside the range are listed, so a narrow
+        # query never touches the rest of the archive.
+        day = date_from
+        while day <= date_to:
+            directory = partition_dir(self.storage_path, day)
+            if os.path.isdir(directory):
+                names = sorted(
+                    (name for name in os.listdir(directory) if name.endswith(".gz")),
+                    key=lambda name: int(name.rsplit("_", 2)[1]),
+                )
+                for name in names:
+                    yield os.path.join(directory, name)
+            day += timedelta(days=1)
+
+    def read(self, start, end, **filters):
+        """Yields archived rows with start <= created_at < end, oldest first."""
+        start, end = as_datetime(start), as_datetime(end)
+        for path in self.files(start.date(), end.date()):
+            with gzip.open(path, "rt", encoding="utf-8") as fh:
+                for line in fh:
+                    row = json.loads(line)
+                    if not start <= as_datetime(row["created_at"]) < end:
+                        continue
+                    if all(row.get(field) == value for field, value in filters.items()):
+                        yield row
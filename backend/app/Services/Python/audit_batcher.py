@@ -0,0 +1,232 @@
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+
+from metrics import NullMetrics
+
+AUDIT_INSERT_QUERY = """
+INSERT INTO activity_log
+(log_name, description, subject_type, subject_id, causer_type, causer_id, properties, event, batch_uuid, created_at, updated_at)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+"""
+USER_MODEL = "App\\Models\\User"
+
+
+def audit_row(data):
+    # Jobs may carry Spatie's own field names or the older action/module/
+    # record ones; the request context those lack columns for goes into
+    # properties alongside the details.
+    properties = data.get("properties") or data.get("details") or {}
+    properties = (
+        dict(properties) if isinstance(properties, dict) else {"details": properties}
+    )
+    for field in ("org_id", "ip_address", "user_agent"):
+        if data.get(field) is not None:
+            properties.setdefault(field, data[field])
+    causer_id = data.get("causer_id", data.get("user_id"))
+
+    # Stamped with the time the job was queued, so buffered rows keep the
+    # time of the action rather than the time of the flush.
+    try:
+        created_at = datetime.fromtimestamp(float(data["queued_at"]))
+    except (KeyError, TypeError, ValueError, OverflowError, OSError):
+        created_at = datetime.now()
+    created_at = created_at.replace(microsecond=0)
+    return (
+        data.get("log_name") or data.get("module") or "default",
+        data.get("description") or data.get("action") or "",
+        data.get("subject_type") or data.get("record_type"),
+        data.get("subject_id", data.get("record_id")),
+        data.get("causer_type") or (USER_MODEL if causer_id is not None else None),
+        causer_id,
+        json.dumps(properties),
+        data.get("event") or data.get("action"),
+        data.get("batch_uuid"),
+        created_at,
+        created_at,
+    )
+
+
+class AuditLogBatcher:
+    job_type = "audit_log"
+
+    def __init__(
+        self, db_pool, max_rows=500, max_delay=0.2, on_flush=None, metrics=None
+    ):
+        self.db_pool = db_pool
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        # Called with (written, failed) receipts once a batch is settled, so
+        # queued jobs are only acknowledged after their rows are committed.
+        self.on_flush = on_flush
+        self.metrics = metrics or NullMetrics()
+        self.buffer = []
+        self.receipts = []
+        self.oldest_at = None
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.flusher_thread = None
+
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.flush_count = 0
+        self.flush_seconds = 0.0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.started_at = time.monotonic()
+
+    def start(self):
+        self.stop_event.clear()
+        self.flusher_thread = threading.Thread(target=self._run_flusher, daemon=True)
+        self.flusher_thread.start()
+
+    def add(self, data, receipt=None):
+        self.add_many([data], [receipt])
+
+    def add_many(self, items, receipts=None):
+        # A job that can't be turned into a row fails on its own instead of
+        # taking the rest of the batch down with it.
+        rows, kept, rejected = [], [], []
+        for data, receipt in zip(items, receipts or [None] * len(items)):
+            try:
+                rows.append(audit_row(data))
+                kept.append(receipt)
+            except Exception as e:
+                logging.error(f"Dropping malformed audit log job: {e}")
+                rejected.append(receipt)
+        if rejected:
+            self.rows_dropped += len(rejected)
+            self._settle([], rejected)
+        if not rows:
+            return
+
+        with self.lock:
+            if not self.buffer:
+                self.oldest_at = time.monotonic()
+            self.buffer.extend(rows)
+            self.receipts.extend(kept)
+            full = len(self.buffer) >= self.max_rows
+
+        if full:
+            self.flush()
+
+    def _take_buffer(self):
+        with self.lock:
+            rows, receipts = self.buffer, self.receipts
+            self.buffer, self.receipts = [], []
+            self.oldest_at = None
+        return rows, receipts
+
+    def _run_flusher(self):
+        while not self.stop_event.wait(self.max_delay / 2):
+            with self.lock:
+                due = (
+                    self.oldest_at is not None
+                    and time.monotonic() - self.oldest_at >= self.max_delay
+                )
+            if due:
+                self.flush()
+
+    def flush(self):
+        with self.flush_lock:
+            rows, receipts = self._take_buffer()
+            if not rows:
+                return 0
+
+            started = time.perf_counter()
+            with self.metrics.flush(self.job_type, len(rows)):
+                try:
+                    with self.db_pool.connection() as connection:
+                        with connection.cursor() as cursor:
+                            # pymysql rewrites executemany on INSERT ... VALUES
+                            # into multi-row INSERT statements.
+                            cursor.executemany(AUDIT_INSERT_QUERY, rows)
+                        connection.commit()
+                    failed = set()
+                except Exception as e:
+                    logging.error(
+                        f"Audit log batch insert failed, retrying row by row: {e}"
+                    )
+                    failed = self._insert_rows_individually(rows)
+
+            elapsed = time.perf_counter() - started
+            written = len(rows) - len(failed)
+            self._record_flush(written, len(failed), elapsed)
+            self._settle(
+                [r for i, r in enumerate(receipts) if i not in failed],
+                [receipts[i] for i in sorted(failed)],
+            )
+            return written
+
+    def _insert_rows_individually(self, rows):
+        # Returns the positions of the rows that could not be written.
+        failed = set()
+        for i, row in enumerate(rows):
+            try:
+                with self.db_pool.connection() as connection:
+                    with connection.cursor() as cursor:
+                        cursor.execute(AUDIT_INSERT_QUERY, row)
+                    connection.commit()
+            except Exception as e:
+                logging.error(f"Audit log creation failed: {e}")
+                failed.add(i)
+        return failed
+
+    def _settle(self, written, failed):
+        self.metrics.settled(self.job_type, len(written), len(failed))
+        written = [receipt for receipt in written if receipt is not None]
+        failed = [receipt for receipt in failed if receipt is not None]
+        if not self.on_flush or not (written or failed):
+            return
+        try:
+            self.on_flush(written, failed)
+        except Exception as e:
+            # Unacknowledged jobs are redelivered, which at worst writes a
+            # duplicate audit row.
+            logging.error(f"Settling flushed audit log jobs failed: {e}")
+
+    def _record_flush(self, written, dropped, elapsed):
+        self.rows_written += written
+        self.rows_dropped += dropped
+        self.flush_count += 1
+        self.flush_seconds += elapsed
+        self.last_flush_ms = elapsed * 1000
+        self.max_flush_ms = max(self.max_flush_ms, self.last_flush_ms)
+
+        rate = written / elapsed if elapsed > 0 else 0.0
+        logging.info(
+            f"Flushed {written} audit logs in {self.last_flush_ms:.1f} ms ({rate:.0f} rows/sec)"
+        )
+
+    def stats(self):
+        uptime = time.monotonic() - self.started_at
+        return {
+            "rows_written": self.rows_written,
+            "rows_dropped": self.rows_dropped,
+            "rows_buffered": len(self.buffer),
+            "flush_count": self.flush_count,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "max_flush_ms": round(self.max_flush_ms, 3),
+            "avg_flush_ms": (
+                round(self.flush_seconds * 1000 / self.flush_count, 3)
+                if self.flush_count
+                else 0.0
+            ),
+            "insert_rows_per_sec": (
+                round(self.rows_written / self.flush_seconds, 1)
+                if self.flush_seconds
+                else 0.0
+            ),
+            "rows_per_sec": round(self.rows_written / uptime, 1) if uptime else 0.0,
+        }
+
+    def close(self):
+        self.stop_event.set()
+        if self.flusher_thread:
+            self.flusher_thread.join(timeout=self.max_delay * 5)
+            self.flusher_thread = None
+        self.flush()
+        logging.info(f"Audit log batcher stopped: {self.stats()}")
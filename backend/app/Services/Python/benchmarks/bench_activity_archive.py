@@ -0,0 +1,109 @@
+import argparse
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import fakeredis
+from bench_audit_log import make_job
+from sqlite_db import ACTIVITY_LOG_DDL, SQLiteConnection
+
+from activity_archiver import ActivityArchiveReader, ActivityLogArchiver
+from audit_batcher import AUDIT_INSERT_QUERY, audit_row
+
+
+def seed(db, rows, days, now):
+    # Evenly spread over the last `days` days in id order, as the batcher
+    # would have inserted them.
+    step = timedelta(days=days) / rows
+    started = now - timedelta(days=days)
+    batch = []
+    with db.cursor() as cursor:
+        for i in range(rows):
+            row = audit_row(make_job(i))
+            created_at = (started + step * i).replace(microsecond=0)
+            batch.append(row[:-2] + (created_at, created_at))
+            if len(batch) == 50000:
+                cursor.executemany(AUDIT_INSERT_QUERY, batch)
+                batch = []
+        if batch:
+            cursor.executemany(AUDIT_INSERT_QUERY, batch)
+    db.commit()
+
+
+def count_rows(db):
+    with db.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) AS count FROM activity_log")
+        return cursor.fetchone()["count"]
+
+
+def timed_read(reader, start, end, **filters):
+    started = time.perf_counter()
+    rows = sum(1 for _ in reader.read(start, end, **filters))
+    seconds = time.perf_counter() - started
+    return {
+        "rows": rows,
+        "seconds": round(seconds, 3),
+        "rows_per_sec": round(rows / seconds, 1) if seconds else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Activity log archival benchmark")
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--days", type=int, default=400)
+    parser.add_argument("--retention-days", type=int, default=90)
+    parser.add_argument("--chunk-rows", type=int, default=1000)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    random.seed(7)
+    now = datetime.now().replace(microsecond=0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = SQLiteConnection(os.path.join(tmp, "erp.db"), synchronous="OFF")
+        db.executescript(ACTIVITY_LOG_DDL)
+        seed(db, args.rows, args.days, now)
+        storage_path = os.path.join(tmp, "archive")
+
+        archiver = ActivityLogArchiver(
+            db,
+            storage_path,
+            fakeredis.FakeRedis(decode_responses=True),
+            retention_days=args.retention_days,
+            chunk_rows=args.chunk_rows,
+        )
+        cutoff = now - timedelta(days=args.retention_days)
+        archived = archiver.run(cutoff=cutoff)
+        remaining = count_rows(db)
+        # A second run finds nothing left to move.
+        rerun = archiver.run(cutoff=cutoff)
+        db.close()
+
+        reader = ActivityArchiveReader(storage_path)
+        oldest = now - timedelta(days=args.days)
+        week = oldest + timedelta(days=args.days // 2 - args.retention_days)
+        report = {
+            "rows": args.rows,
+            "archive": archived,
+            "rerun_rows": rerun["rows"],
+            "remaining_rows": remaining,
+            "bytes_per_row": round(archived["bytes"] / max(archived["rows"], 1), 1),
+            "read_week": timed_read(reader, week, week + timedelta(days=7)),
+            "read_week_one_user": timed_read(
+                reader, week, week + timedelta(days=7), causer_id=1
+            ),
+            "read_all": timed_read(reader, oldest, cutoff),
+        }
+        report["all_rows_accounted_for"] = (
+            report["read_all"]["rows"] + remaining == args.rows
+        )
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
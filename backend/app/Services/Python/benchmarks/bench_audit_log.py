@@ -0,0 +1,89 @@
+import argparse
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+
+from sqlite_db import ACTIVITY_LOG_DDL, SQLiteConnection
+
+from audit_batcher import AUDIT_INSERT_QUERY, AuditLogBatcher, audit_row
+from db_pool import ConnectionPool
+
+
+def make_job(i):
+    return {
+        "job_type": "audit_log",
+        "org_id": 1 + i % 5,
+        "user_id": 1 + i % 50,
+        "action": random.choice(["created", "updated", "deleted", "viewed"]),
+        "module": random.choice(["sales", "inventory", "production", "qa"]),
+        "record_type": "order",
+        "record_id": i,
+        "details": {"field": "status", "from": "draft", "to": "approved"},
+        "ip_address": "10.0.0.1",
+        "user_agent": "bench",
+    }
+
+
+def open_db(path):
+    db = SQLiteConnection(path)
+    db.executescript(ACTIVITY_LOG_DDL)
+    return db
+
+
+def run_per_row(db, jobs):
+    started = time.perf_counter()
+    for job in jobs:
+        with db.cursor() as cursor:
+            cursor.execute(AUDIT_INSERT_QUERY, audit_row(job))
+        db.commit()
+    return time.perf_counter() - started
+
+
+def run_batched(db, jobs, max_rows, max_delay):
+    pool = ConnectionPool(lambda: db, min_size=1, max_size=1, name="audit_bench")
+    pool.start()
+    batcher = AuditLogBatcher(pool, max_rows=max_rows, max_delay=max_delay)
+    batcher.start()
+    started = time.perf_counter()
+    for job in jobs:
+        batcher.add(job)
+    batcher.close()
+    return time.perf_counter() - started, batcher.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Audit log batching benchmark")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--batch-delay-ms", type=int, default=200)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    jobs = [make_job(i) for i in range(args.rows)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        per_row_db = open_db(os.path.join(tmp, "per_row.db"))
+        per_row_seconds = run_per_row(per_row_db, jobs)
+        per_row_db.close()
+
+        batched_db = open_db(os.path.join(tmp, "batched.db"))
+        batched_seconds, stats = run_batched(
+            batched_db, jobs, args.batch_size, args.batch_delay_ms / 1000
+        )
+        batched_db.close()
+
+    result = {
+        "rows": args.rows,
+        "per_row_rows_per_sec": round(args.rows / per_row_seconds, 1),
+        "batched_rows_per_sec": round(args.rows / batched_seconds, 1),
+        "speedup": round(per_row_seconds / batched_seconds, 2),
+        "batcher": stats,
+    }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
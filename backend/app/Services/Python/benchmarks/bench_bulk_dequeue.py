@@ -0,0 +1,92 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import fakeredis
+import redis
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from job_queue import ReliableJobQueue, SimpleJobQueue
+
+QUEUE = "bench_jobs_queue"
+
+
+def fill(client, jobs):
+    client.delete(QUEUE)
+    pipe = client.pipeline(transaction=False)
+    for i in range(jobs):
+        job_type = "audit_log" if i % 3 else "email_notification"
+        pipe.lpush(QUEUE, json.dumps({"job_type": job_type, "seq": i}))
+    pipe.execute()
+
+
+def drain(queue, jobs, batch_size):
+    consumed = 0
+    started = time.perf_counter()
+    while consumed < jobs:
+        if batch_size == 1:
+            raw_job = queue.fetch(timeout=1)
+            raw_jobs = [raw_job] if raw_job else []
+            for raw_job in raw_jobs:
+                queue.ack(raw_job)
+        else:
+            raw_jobs = queue.fetch_many(batch_size, timeout=1)
+            queue.ack_many(raw_jobs)
+        if not raw_jobs:
+            break
+        consumed += len(raw_jobs)
+    return consumed / (time.perf_counter() - started)
+
+
+def make_queue(client, mode):
+    if mode == "reliable":
+        queue = ReliableJobQueue(client, QUEUE, "bench-worker")
+        queue.redis_client.delete(queue.processing_key)
+        return queue
+    return SimpleJobQueue(client, QUEUE)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk dequeue benchmark")
+    parser.add_argument("--jobs", type=int, default=20000)
+    parser.add_argument("--batch-sizes", default="1,10,50,100")
+    parser.add_argument("--mode", choices=["simple", "reliable"], default="simple")
+    parser.add_argument(
+        "--redis-url", help="benchmark a real Redis instead of fakeredis"
+    )
+    args = parser.parse_args()
+
+    if args.redis_url:
+        client = redis.Redis.from_url(args.redis_url, decode_responses=True)
+    else:
+        client = fakeredis.FakeRedis(decode_responses=True)
+
+    results = {}
+    for batch_size in [int(size) for size in args.batch_sizes.split(",")]:
+        fill(client, args.jobs)
+        queue = make_queue(client, args.mode)
+        results[batch_size] = round(drain(queue, args.jobs, batch_size), 1)
+
+    baseline = results.get(1)
+    print(
+        json.dumps(
+            {
+                "jobs": args.jobs,
+                "mode": args.mode,
+                "jobs_per_sec": results,
+                "speedup_vs_single": (
+                    {size: round(rate / baseline, 2) for size, rate in results.items()}
+                    if baseline
+                    else {}
+                ),
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
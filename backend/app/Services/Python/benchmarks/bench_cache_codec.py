@@ -0,0 +1,106 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache_codec import ColumnarCodec, JsonCodec  # noqa: E402
+
+
+def manufacturing_unit_rows(count):
+    created = datetime(2025, 1, 1, 9, 30)
+    return [
+        {
+            "id": i,
+            "organization_id": 1 + i % 20,
+            "name": f"Drymix Plant {i}",
+            "code": f"MU{i:05d}",
+            "type": random.choice(["production", "warehouse", "distribution"]),
+            "city": random.choice(["Pune", "Nashik", "Surat", "Indore"]),
+            "state": random.choice(["Maharashtra", "Gujarat", "Madhya Pradesh"]),
+            "capacity_per_day": Decimal(f"{random.uniform(10, 500):.2f}"),
+            "capacity_unit": "MT",
+            "status": random.choice(["active", "inactive", "maintenance"]),
+            "created_at": created + timedelta(hours=i),
+            "updated_at": created + timedelta(hours=i, minutes=15),
+        }
+        for i in range(1, count + 1)
+    ]
+
+
+def product_rows(count):
+    created = datetime(2025, 1, 1, 9, 30)
+    return [
+        {
+            "id": i,
+            "organization_id": 1 + i % 20,
+            "name": f"Tile adhesive grade {i}",
+            "code": f"PRD{i:06d}",
+            "sku": f"SKU-{i:06d}",
+            "type": random.choice(["dry_mix", "raw_material", "finished_good"]),
+            "unit_of_measure": random.choice(["bag", "kg", "MT"]),
+            "standard_cost": Decimal(f"{random.uniform(50, 900):.2f}"),
+            "selling_price": Decimal(f"{random.uniform(80, 1500):.2f}"),
+            "gst_rate": Decimal("18.00"),
+            "shelf_life_days": random.choice([90, 180, 365, None]),
+            "status": "active",
+            "updated_at": created + timedelta(minutes=i),
+        }
+        for i in range(1, count + 1)
+    ]
+
+
+def timed(func, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return result, best * 1000
+
+
+def bench(label, rows, codecs, repeat):
+    results = []
+    for name, codec in codecs:
+        payload, encode_ms = timed(lambda: codec.encode(rows), repeat)
+        decoded, decode_ms = timed(lambda: codec.decode(payload), repeat)
+        results.append(
+            {
+                "dataset": label,
+                "rows": len(rows),
+                "codec": name,
+                "bytes": len(payload),
+                "encode_ms": round(encode_ms, 2),
+                "decode_ms": round(decode_ms, 2),
+                "round_trip_exact": decoded == rows,
+            }
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cache codec size and speed")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    codecs = [
+        ("json", JsonCodec()),
+        ("columnar", ColumnarCodec(compress=False)),
+        ("columnar+zlib", ColumnarCodec()),
+    ]
+    results = bench(
+        "manufacturing_units", manufacturing_unit_rows(args.rows), codecs, args.repeat
+    )
+    results += bench("products", product_rows(args.rows), codecs, args.repeat)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
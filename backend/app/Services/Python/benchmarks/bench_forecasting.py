@@ -0,0 +1,100 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from forecasting import fit_forecast
+
+
+def synthetic_series(count, periods, seed=11):
+    rng = np.random.default_rng(seed)
+    x = np.arange(periods)
+    level = rng.uniform(50, 500, (count, 1))
+    growth = rng.normal(0.01, 0.02, (count, 1))
+    season = 1 + 0.2 * np.sin(2 * np.pi * (x + rng.integers(0, 12, (count, 1))) / 12)
+    noise = rng.normal(1, 0.05, (count, periods))
+    return np.maximum(level * (1 + growth * x) * season * noise, 0)
+
+
+def calculate_trend(values):
+    n = len(values)
+    if n < 2:
+        return 0
+    sum_x = sum_y = sum_xy = sum_x2 = 0
+    for i in range(n):
+        sum_x += i
+        sum_y += values[i]
+        sum_xy += i * values[i]
+        sum_x2 += i * i
+    denominator = n * sum_x2 - sum_x * sum_x
+    if denominator == 0:
+        return 0
+    slope = (n * sum_xy - sum_x * sum_y) / denominator
+    avg_y = sum_y / n
+    return slope / avg_y * 100 if avg_y else 0
+
+
+def detect_seasonality(values):
+    seasonality = []
+    for i in range(12):
+        month_values = values[i::12]
+        seasonality.append(sum(month_values) / len(month_values) if month_values else 1)
+    overall = sum(values) / len(values) if values else 1
+    return [value / overall for value in seasonality] if overall > 0 else seasonality
+
+
+def forecast_demand(values, months):
+    # Line-for-line port of PredictionService::forecastDemand, run per series.
+    forecast = []
+    last_value = values[-1]
+    trend = calculate_trend(values)
+    seasonality = detect_seasonality(values)
+    for _ in range(months):
+        base_value = last_value * (1 + trend / 100)
+        forecast.append(max(0, base_value * seasonality[len(values) % 12]))
+        last_value = base_value
+    return forecast
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch forecasting benchmark")
+    parser.add_argument("--series", type=int, default=10000)
+    parser.add_argument("--periods", type=int, default=24)
+    parser.add_argument("--horizon", type=int, default=6)
+    args = parser.parse_args()
+
+    matrix = synthetic_series(args.series, args.periods)
+    as_lists = matrix.tolist()
+
+    started = time.perf_counter()
+    for values in as_lists:
+        forecast_demand(values, args.horizon)
+    per_series = time.perf_counter() - started
+
+    started = time.perf_counter()
+    fit_forecast(matrix, 12, args.horizon)
+    batched = time.perf_counter() - started
+
+    print(
+        json.dumps(
+            {
+                "series": args.series,
+                "periods": args.periods,
+                "per_series_seconds": round(per_series, 4),
+                "batched_seconds": round(batched, 4),
+                "per_series_series_per_sec": round(args.series / per_series, 1),
+                "batched_series_per_sec": round(args.series / batched, 1),
+                "speedup": round(per_series / batched, 2),
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
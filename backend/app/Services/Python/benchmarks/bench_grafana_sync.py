@@ -0,0 +1,158 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+GRAFANA_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..",
+    "..",
+    "..",
+    "..",
+    "..",
+    "docker",
+    "grafana",
+)
+sys.path.insert(0, GRAFANA_DIR)
+
+from dashboard_sync import DashboardSync  # noqa: E402
+
+
+class StubGrafana(ThreadingHTTPServer):
+    # Just enough of the dashboard API for the sync engine, with a fixed
+    # delay per request standing in for a remote Grafana.
+    daemon_threads = True
+
+    def __init__(self, latency):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.latency = latency
+        self.dashboards = {}
+        self.requests = {"GET": 0, "POST": 0, "DELETE": 0}
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def count(self):
+        time.sleep(self.server.latency)
+        with self.server.lock:
+            self.server.requests[self.command] += 1
+
+    def do_GET(self):
+        self.count()
+        uid = self.path.rsplit("/", 1)[-1]
+        dashboard = self.server.dashboards.get(uid)
+        if dashboard is None:
+            self.reply(404, {"message": "Dashboard not found"})
+        else:
+            self.reply(200, {"dashboard": dashboard})
+
+    def do_POST(self):
+        self.count()
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        dashboard = body["dashboard"]
+        self.server.dashboards[dashboard["uid"]] = dashboard
+        self.reply(200, {"status": "success", "uid": dashboard["uid"]})
+
+    def do_DELETE(self):
+        self.count()
+        uid = self.path.rsplit("/", 1)[-1]
+        found = self.server.dashboards.pop(uid, None) is not None
+        self.reply(200 if found else 404, {})
+
+
+def write_tenant_dashboards(path, tenants):
+    with open(
+        os.path.join(GRAFANA_DIR, "dashboards", "organization_overview.json")
+    ) as f:
+        template = json.load(f)
+    for tenant in range(1, tenants + 1):
+        dashboard = dict(
+            template,
+            uid=f"erp-tenant-{tenant}",
+            title=f"{template['title']} (tenant {tenant})",
+        )
+        with open(os.path.join(path, f"tenant_{tenant}.json"), "w") as f:
+            json.dump(dashboard, f)
+
+
+def timed_sync(server, sync):
+    before = dict(server.requests)
+    result = sync.sync()
+    result["requests"] = {
+        method: count - before[method] for method, count in server.requests.items()
+    }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Grafana dashboard sync against a stub server"
+    )
+    parser.add_argument("--tenants", type=int, default=60)
+    parser.add_argument("--latency-ms", type=float, default=25)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    server = StubGrafana(args.latency_ms / 1000)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    path = tempfile.mkdtemp(prefix="grafana-dashboards-")
+    try:
+        write_tenant_dashboards(path, args.tenants)
+        report = {"tenants": args.tenants, "latency_ms": args.latency_ms}
+
+        serial = DashboardSync(server.url, ("admin", "admin"), path, workers=1)
+        report["cold_serial"] = timed_sync(server, serial)
+        server.dashboards.clear()
+
+        sync = DashboardSync(server.url, ("admin", "admin"), path, workers=args.workers)
+        report["cold_parallel"] = timed_sync(server, sync)
+        report["unchanged"] = timed_sync(server, sync)
+
+        # One definition edited, as watch mode would see it.
+        edited = os.path.join(path, "tenant_1.json")
+        with open(edited) as f:
+            dashboard = json.load(f)
+        dashboard["refresh"] = "1m"
+        with open(edited, "w") as f:
+            json.dump(dashboard, f)
+        os.utime(edited, ns=(time.time_ns(), time.time_ns() + 1_000_000))
+        report["one_edited"] = timed_sync(server, sync)
+
+        # A restarted connector compares hashes with the server and pushes nothing.
+        restarted = DashboardSync(
+            server.url, ("admin", "admin"), path, workers=args.workers
+        )
+        report["restart"] = timed_sync(server, restarted)
+
+        os.remove(edited)
+        report["one_removed"] = timed_sync(server, restarted)
+        print(json.dumps(report, indent=2))
+    finally:
+        shutil.rmtree(path)
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import argparse
+import json
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlite_db import SQLiteConnection
+
+from kpi_analytics import KpiHistoryAnalyzer, analytics_rows, compute_kpi_analytics
+from kpi_engine import derive_kpi_fields
+
+
+def synthetic_history(series, days, seed=7):
+    rng = np.random.default_rng(seed)
+    start = date(2020, 1, 1)
+    kpi_ids = np.repeat(np.arange(series) % 10 + 1, days)
+    org_ids = np.repeat(np.arange(series) // 10 + 1, days)
+    drift = np.repeat(rng.normal(0, 0.5, series), days)
+    step = np.tile(np.arange(days), series)
+    actual = 100 + drift * step + rng.normal(0, 5, series * days)
+    return pd.DataFrame(
+        {
+            "id": np.arange(1, series * days + 1),
+            "kpi_id": kpi_ids,
+            "org_id": org_ids,
+            "unit_id": pd.array([pd.NA] * (series * days), dtype="Int64"),
+            "record_date": [start + timedelta(days=int(d)) for d in step],
+            "actual_value": np.round(actual, 2),
+            "target_value": 100.0,
+        }
+    )
+
+
+def row_by_row(frame, window):
+    # The per-row approach the dashboard code uses today, kept as a baseline.
+    results = []
+    history = {}
+    for row in frame.sort_values(["kpi_id", "org_id", "record_date"]).itertuples():
+        values = history.setdefault((row.kpi_id, row.org_id), [])
+        values.append(row.actual_value)
+        trailing = values[-window:]
+        previous = trailing[0] if len(trailing) > 1 else None
+        results.append(
+            derive_kpi_fields(row.actual_value, row.target_value, 0, previous)
+        )
+    return results
+
+
+def bench_database(frame, chunk_rows):
+    db = SQLiteConnection()
+    db.executescript("""
+        CREATE TABLE kpi_values (
+            id INTEGER PRIMARY KEY, kpi_id INTEGER, org_id INTEGER, unit_id INTEGER,
+            record_date TEXT, actual_value REAL, target_value REAL, variance REAL,
+            variance_percentage REAL, achievement_percentage REAL, trend TEXT,
+            rolling_trend TEXT
+        );
+        """)
+    with db.cursor() as cursor:
+        cursor.executemany(
+            "INSERT INTO kpi_values (id, kpi_id, org_id, unit_id, record_date, actual_value, target_value) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s)",
+            [
+                (r[0], r[1], r[2], None, r[4].isoformat(), r[5], r[6])
+                for r in frame.itertuples(index=False, name=None)
+            ],
+        )
+    db.commit()
+
+    import kpi_analytics
+
+    # SQLite has no UPDATE ... JOIN; its UPDATE ... FROM form is equivalent.
+    kpi_analytics.KPI_HISTORY_UPDATE_QUERY = (
+        "UPDATE kpi_values SET variance = s.variance, "
+        "variance_percentage = s.variance_percentage, "
+        "achievement_percentage = s.achievement_percentage, "
+        "rolling_trend = s.rolling_trend "
+        "FROM kpi_analytics_stage s WHERE s.id = kpi_values.id"
+    )
+    started = time.perf_counter()
+    rows = KpiHistoryAnalyzer(db, chunk_rows=chunk_rows).run()
+    return rows / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="KPI history analytics benchmark")
+    parser.add_argument("--series", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=1095)
+    parser.add_argument("--window", type=int, default=7)
+    parser.add_argument("--chunk-rows", type=int, default=200000)
+    parser.add_argument(
+        "--with-db", action="store_true", help="include a SQLite round-trip"
+    )
+    args = parser.parse_args()
+
+    frame = synthetic_history(args.series, args.days)
+
+    started = time.perf_counter()
+    analysed = compute_kpi_analytics(frame, window=args.window)
+    analytics_rows(analysed)
+    vectorized = time.perf_counter() - started
+
+    sample = frame[frame["kpi_id"] <= 1]
+    started = time.perf_counter()
+    row_by_row(sample, args.window)
+    scalar_rate = len(sample) / (time.perf_counter() - started)
+
+    result = {
+        "rows": len(frame),
+        "vectorized_rows_per_sec": round(len(frame) / vectorized, 1),
+        "row_by_row_rows_per_sec": round(scalar_rate, 1),
+        "speedup": round(len(frame) / vectorized / scalar_rate, 2),
+        "frame_mb": round(frame.memory_usage(deep=True).sum() / 1e6, 1),
+    }
+    if args.with_db:
+        result["end_to_end_rows_per_sec"] = round(
+            bench_database(frame, args.chunk_rows), 1
+        )
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
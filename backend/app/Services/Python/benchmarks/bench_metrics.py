@@ -0,0 +1,75 @@
+import argparse
+import json
+import logging
+import time
+
+import fakeredis
+from sqlite_db import SQLiteConnection
+
+import worker
+from db_pool import ConnectionPool
+from metrics import NullMetrics, WorkerMetrics
+
+
+def build_worker(metrics):
+    erp_worker = worker.ERPWorker()
+    erp_worker.metrics = metrics
+    erp_worker.redis_client = fakeredis.FakeRedis(decode_responses=True)
+    erp_worker.redis_client.set("bench:key", "value")
+    erp_worker.db_pool = ConnectionPool(SQLiteConnection, min_size=1, max_size=1)
+    erp_worker.db_pool.start()
+
+    # A small handler that touches both stores, so the measurement covers the
+    # per-job bookkeeping rather than a real job's own cost.
+    def handle_job(job_type, job_data):
+        with erp_worker.db_connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+        erp_worker.redis_client.get("bench:key")
+
+    erp_worker.handle_job = handle_job
+    return erp_worker
+
+
+def run(erp_worker, jobs):
+    job_types = ["kpi_calculation", "cache_warmup", "forecast", "report_generation"]
+    started = time.perf_counter()
+    for i in range(jobs):
+        erp_worker.process_job(job_types[i % len(job_types)], {})
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Metrics overhead on process_job")
+    parser.add_argument("--jobs", type=int, default=50000)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    # worker configures logging at import; silence the per-job INFO lines.
+    logging.getLogger().setLevel(logging.WARNING)
+    modes = {
+        "uninstrumented": lambda: build_worker(NullMetrics()),
+        "instrumented": lambda: build_worker(WorkerMetrics()),
+    }
+    best = {}
+    for _ in range(args.rounds):
+        for mode, factory in modes.items():
+            seconds = run(factory(), args.jobs)
+            best[mode] = min(best.get(mode, seconds), seconds)
+
+    result = {
+        "jobs": args.jobs,
+        "uninstrumented_jobs_per_sec": round(args.jobs / best["uninstrumented"], 1),
+        "instrumented_jobs_per_sec": round(args.jobs / best["instrumented"], 1),
+        "overhead_us_per_job": round(
+            (best["instrumented"] - best["uninstrumented"]) / args.jobs * 1e6, 2
+        ),
+        "overhead_percent": round(
+            (best["instrumented"] / best["uninstrumented"] - 1) * 100, 2
+        ),
+    }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import argparse
+import json
+import logging
+import smtplib
+import socketserver
+import threading
+import time
+from email.message import EmailMessage
+
+from sqlite_db import SQLiteConnection
+
+from db_pool import ConnectionPool
+from notification_delivery import NotificationDelivery, SMTPPool
+
+NOTIFICATIONS_DDL = """
+CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT, email TEXT);
+CREATE TABLE notifications (
+    id INTEGER PRIMARY KEY,
+    org_id INTEGER NOT NULL,
+    user_id INTEGER,
+    type VARCHAR(50) NOT NULL DEFAULT 'email',
+    subject VARCHAR(200),
+    message TEXT NOT NULL,
+    retry_count INTEGER NOT NULL DEFAULT 0,
+    delivery_status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    delivered_at TIMESTAMP,
+    delivery_error TEXT
+);
+"""
+
+
+class StubSMTPServer(socketserver.ThreadingTCPServer):
+    # Speaks enough SMTP for smtplib, with a fixed delay on connect and per
+    # accepted message standing in for a remote relay.
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, connect_latency, message_latency):
+        super().__init__(("127.0.0.1", 0), StubSMTPHandler)
+        self.connect_latency = connect_latency
+        self.message_latency = message_latency
+        self.connections = 0
+        self.messages = 0
+        self.lock = threading.Lock()
+
+
+class StubSMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        time.sleep(server.connect_latency)
+        self.reply("220 stub ESMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip().upper()
+            if command.startswith("EHLO"):
+                self.wfile.write(b"250-stub\r\n250 8BITMIME\r\n")
+            elif command.startswith("DATA"):
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                time.sleep(server.message_latency)
+                with server.lock:
+                    server.messages += 1
+                self.reply("250 OK queued")
+            elif command.startswith("QUIT"):
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+def seed(db, notifications, recipients):
+    with db.cursor() as cursor:
+        cursor.executemany(
+            "INSERT INTO users (id, name, email) VALUES (%s, %s, %s)",
+            [
+                (i, f"User {i}", f"user{i}@example.com")
+                for i in range(1, recipients + 1)
+            ],
+        )
+        cursor.executemany(
+            "INSERT INTO notifications (id, org_id, user_id, subject, message) "
+            "VALUES (%s, %s, %s, %s, %s)",
+            [
+                (
+                    i,
+                    1,
+                    1 + i % recipients,
+                    f"Invoice INV-{i:05d} is overdue",
+                    f"Invoice INV-{i:05d} was due 30 days ago.",
+                )
+                for i in range(1, notifications + 1)
+            ],
+        )
+    db.commit()
+
+
+def jobs(notifications):
+    return [
+        {"job_type": "email_notification", "notification_id": i, "org_id": 1}
+        for i in range(1, notifications + 1)
+    ]
+
+
+def run_per_message(server, db, notifications):
+    # The old shape of the handler: one SMTP connection per notification.
+    with db.cursor() as cursor:
+        cursor.execute(
+            "SELECT n.id, n.subject, n.message, u.email FROM notifications n "
+            "JOIN users u ON u.id = n.user_id"
+        )
+        rows = cursor.fetchall()
+    started = time.perf_counter()
+    for row in rows[:notifications]:
+        message = EmailMessage()
+        message["From"] = "noreply@erpdrymix.local"
+        message["To"] = row["email"]
+        message["Subject"] = row["subject"]
+        message.set_content(row["message"])
+        with smtplib.SMTP("127.0.0.1", server.server_address[1]) as session:
+            session.send_message(message)
+    return time.perf_counter() - started
+
+
+def run_delivery(server, db, notifications, pool_size, window):
+    db_pool = ConnectionPool(lambda: db, min_size=1, max_size=1, name="bench")
+    db_pool.start()
+    delivery = NotificationDelivery(
+        db_pool,
+        SMTPPool("127.0.0.1", server.server_address[1], size=pool_size),
+        "ERP DryMix <noreply@erpdrymix.local>",
+        digest_window=window,
+    )
+    delivery.start()
+    started = time.perf_counter()
+    batch = jobs(notifications)
+    for offset in range(0, len(batch), 100):
+        delivery.add_many(batch[offset : offset + 100])
+    delivery.close()
+    seconds = time.perf_counter() - started
+    with db.cursor() as cursor:
+        cursor.execute(
+            "SELECT delivery_status, COUNT(*) AS count FROM notifications "
+            "GROUP BY delivery_status"
+        )
+        statuses = {row["delivery_status"]: row["count"] for row in cursor.fetchall()}
+    return seconds, delivery.stats(), statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Notification delivery benchmark")
+    parser.add_argument("--notifications", type=int, default=2000)
+    parser.add_argument("--recipients", type=int, default=200)
+    parser.add_argument("--pool-size", type=int, default=4)
+    parser.add_argument("--window-ms", type=int, default=500)
+    parser.add_argument("--connect-latency-ms", type=float, default=20)
+    parser.add_argument("--message-latency-ms", type=float, default=5)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    server = StubSMTPServer(
+        args.connect_latency_ms / 1000, args.message_latency_ms / 1000
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    db = SQLiteConnection()
+    db.executescript(NOTIFICATIONS_DDL)
+    seed(db, args.notifications, args.recipients)
+
+    per_message_seconds = run_per_message(server, db, args.notifications)
+    server.connections = server.messages = 0
+
+    seconds, stats, statuses = run_delivery(
+        server, db, args.notifications, args.pool_size, args.window_ms / 1000
+    )
+    server.shutdown()
+
+    result = {
+        "notifications": args.notifications,
+        "recipients": args.recipients,
+        "per_message_seconds": round(per_message_seconds, 3),
+        "per_message_notifications_per_sec": round(
+            args.notifications / per_message_seconds, 1
+        ),
+        "pooled_seconds": round(seconds, 3),
+        "pooled_notifications_per_sec": round(args.notifications / seconds, 1),
+        "pooled_smtp_connections": server.connections,
+        "pooled_messages": server.messages,
+        "delivery_stats": stats,
+        "delivery_status": statuses,
+    }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+import fakeredis
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from job_queue import PriorityLanes, ReliableJobQueue, SimpleJobQueue
+
+QUEUE = "bench_jobs_queue"
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def make_queue(client, mode, lanes):
+    if mode == "reliable":
+        return ReliableJobQueue(client, QUEUE, "bench-worker", lanes=lanes)
+    return SimpleJobQueue(client, QUEUE, lanes=lanes)
+
+
+def produce(queue, jobs, rate, delay):
+    interval = 1 / rate
+    for i in range(jobs):
+        run_at = time.time() + delay if delay else None
+        queue.push({"job_type": "report_generation", "seq": i}, run_at=run_at)
+        time.sleep(interval)
+
+
+def run(args, backlog, lanes_enabled):
+    client = fakeredis.FakeRedis(decode_responses=True)
+    if lanes_enabled:
+        lanes = PriorityLanes(client, QUEUE, promote_interval=args.promote_interval)
+    else:
+        # Everything in one FIFO list, as before priority lanes.
+        lanes = PriorityLanes(
+            client,
+            QUEUE,
+            weights={"default": 1},
+            priorities={},
+            promote_interval=args.promote_interval,
+        )
+    queue = make_queue(client, args.mode, lanes)
+
+    pipe = client.pipeline(transaction=False)
+    now = time.time()
+    for i in range(backlog):
+        job = {"job_type": "kpi_analytics", "kpi_id": i, "queued_at": now}
+        pipe.lpush(lanes.key_for(job), json.dumps(job))
+    pipe.execute()
+
+    producer = threading.Thread(
+        target=produce,
+        args=(queue, args.high_jobs, args.high_rate, args.delay_ms / 1000),
+        daemon=True,
+    )
+    producer.start()
+
+    waits = []
+    started = time.perf_counter()
+    while len(waits) < args.high_jobs:
+        raw_job = queue.fetch(timeout=5)
+        if raw_job is None:
+            break
+        queue.ack(raw_job)
+        data = json.loads(raw_job)
+        if data["job_type"] == "report_generation":
+            waits.append(time.time() - data["queued_at"])
+        else:
+            # Stand-in for the bulk job's own work.
+            time.sleep(args.bulk_work_ms / 1000)
+    producer.join()
+
+    return {
+        "high_jobs": len(waits),
+        "seconds": round(time.perf_counter() - started, 3),
+        "high_wait_ms": {
+            name: round(percentile(waits, fraction) * 1000, 2)
+            for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Priority lane latency benchmark")
+    parser.add_argument("--backlogs", default="0,1000,4000")
+    parser.add_argument("--high-jobs", type=int, default=200)
+    parser.add_argument("--high-rate", type=float, default=100)
+    parser.add_argument("--bulk-work-ms", type=float, default=1)
+    parser.add_argument(
+        "--delay-ms",
+        type=float,
+        default=0,
+        help="push the high-priority jobs as delayed jobs due this far ahead",
+    )
+    parser.add_argument("--promote-interval", type=float, default=0.05)
+    parser.add_argument("--mode", choices=["simple", "reliable"], default="simple")
+    args = parser.parse_args()
+
+    results = {}
+    for backlog in [int(size) for size in args.backlogs.split(",")]:
+        results[backlog] = {
+            "single_fifo": run(args, backlog, lanes_enabled=False),
+            "priority_lanes": run(args, backlog, lanes_enabled=True),
+        }
+
+    print(
+        json.dumps(
+            {
+                "mode": args.mode,
+                "high_rate_per_sec": args.high_rate,
+                "bulk_work_ms": args.bulk_work_ms,
+                "delay_ms": args.delay_ms,
+                "bulk_backlog": results,
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
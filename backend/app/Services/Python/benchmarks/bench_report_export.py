@@ -0,0 +1,168 @@
+import argparse
+import csv
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import fakeredis
+from sqlite_db import SQLiteConnection
+
+from report_engine import REPORTS, ReportEngine
+
+STOCK_DDL = """
+CREATE TABLE products (id INTEGER PRIMARY KEY, code TEXT, name TEXT);
+CREATE TABLE manufacturing_units (id INTEGER PRIMARY KEY, name TEXT);
+CREATE TABLE stock_transactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    organization_id INTEGER,
+    manufacturing_unit_id INTEGER,
+    product_id INTEGER,
+    transaction_number TEXT,
+    transaction_type TEXT,
+    quantity NUMERIC,
+    unit_of_measure TEXT,
+    reference_type TEXT,
+    reference_id INTEGER,
+    reason TEXT,
+    transaction_date TEXT
+);
+CREATE INDEX stock_transactions_org_date ON stock_transactions (organization_id, transaction_date);
+"""
+
+
+def build_db(path, rows, products=200, units=10):
+    db = SQLiteConnection(path, synchronous="OFF")
+    db.executescript(STOCK_DDL)
+    with db.cursor() as cursor:
+        cursor.executemany(
+            "INSERT INTO products (id, code, name) VALUES (%s, %s, %s)",
+            [(i, f"P{i:05d}", f"Drymix product {i}") for i in range(1, products + 1)],
+        )
+        cursor.executemany(
+            "INSERT INTO manufacturing_units (id, name) VALUES (%s, %s)",
+            [(i, f"Plant {i}") for i in range(1, units + 1)],
+        )
+        start = datetime(2026, 1, 1)
+        batch = []
+        for i in range(rows):
+            batch.append(
+                (
+                    1,
+                    1 + i % units,
+                    1 + random.randrange(products),
+                    f"ST{i:09d}",
+                    random.choice(["receipt", "issue", "transfer", "adjustment"]),
+                    round(random.uniform(1, 500), 2),
+                    "bag",
+                    "production_order",
+                    i,
+                    None,
+                    (start + timedelta(seconds=i * 20)).strftime("%Y-%m-%d %H:%M:%S"),
+                )
+            )
+            if len(batch) == 50000:
+                insert_transactions(cursor, batch)
+                batch = []
+        if batch:
+            insert_transactions(cursor, batch)
+    db.commit()
+    return db
+
+
+def insert_transactions(cursor, batch):
+    cursor.executemany(
+        "INSERT INTO stock_transactions (organization_id, manufacturing_unit_id, product_id, "
+        "transaction_number, transaction_type, quantity, unit_of_measure, reference_type, "
+        "reference_id, reason, transaction_date) "
+        "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)",
+        batch,
+    )
+
+
+def job(output_format):
+    return {
+        "report": "stock_ledger",
+        "format": output_format,
+        "org_id": 1,
+        "date_from": "2020-01-01",
+        "date_to": "2100-01-01",
+    }
+
+
+def run_buffered(db, storage, data):
+    # The fetchall-then-write shape the stream replaces.
+    definition = REPORTS[data["report"]]
+    path = os.path.join(storage, "buffered.csv")
+    with db.cursor() as cursor:
+        cursor.execute(definition.query, definition.bind(data))
+        rows = cursor.fetchall()
+    with open(path, "w", newline="") as handle:
+        writer = csv.writer(handle)
+        writer.writerow([label for _, label in definition.columns])
+        for row in rows:
+            writer.writerow([row[key] for key, _ in definition.columns])
+    return path
+
+
+def measure(label, rows, func):
+    tracemalloc.start()
+    started = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "mode": label,
+        "rows": rows,
+        "seconds": round(elapsed, 2),
+        "rows_per_sec": round(rows / elapsed, 1),
+        "peak_mb": round(peak / 1024 / 1024, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Streaming vs buffered stock ledger export"
+    )
+    parser.add_argument("--rows", default="100000,1000000")
+    parser.add_argument("--formats", default="csv")
+    parser.add_argument("--skip-buffered", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    redis_client = fakeredis.FakeRedis(decode_responses=True)
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for rows in [int(value) for value in args.rows.split(",")]:
+            db_path = os.path.join(workdir, f"stock_{rows}.db")
+            db = build_db(db_path, rows)
+            engine = ReportEngine(db, redis_client, storage_path=workdir)
+            for output_format in args.formats.split(","):
+                results.append(
+                    measure(
+                        f"stream_{output_format}",
+                        rows,
+                        lambda: engine.generate(job(output_format)),
+                    )
+                )
+            if not args.skip_buffered:
+                results.append(
+                    measure(
+                        "buffered_csv",
+                        rows,
+                        lambda: run_buffered(db, workdir, job("csv")),
+                    )
+                )
+            db.close()
+            os.remove(db_path)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+import argparse
+import json
+import logging
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import fakeredis
+import pymysql
+from sqlite_db import SQLiteConnection
+
+import stock_ledger
+from stock_ledger import StockBalances, StockLedger
+
+STOCK_DDL = """
+CREATE TABLE stock_transactions (
+    id INTEGER PRIMARY KEY,
+    organization_id INTEGER NOT NULL,
+    manufacturing_unit_id INTEGER NOT NULL,
+    product_id INTEGER NOT NULL,
+    transaction_type TEXT NOT NULL,
+    quantity DECIMAL(15, 2) NOT NULL,
+    transaction_date TIMESTAMP NOT NULL
+);
+CREATE INDEX stock_trans_date_idx ON stock_transactions (transaction_date);
+CREATE INDEX stock_trans_unit_prod_date_idx
+    ON stock_transactions (manufacturing_unit_id, product_id, transaction_date);
+CREATE TABLE inventory (
+    id INTEGER PRIMARY KEY,
+    organization_id INTEGER NOT NULL,
+    manufacturing_unit_id INTEGER NOT NULL,
+    product_id INTEGER NOT NULL,
+    quantity_on_hand DECIMAL(15, 2) NOT NULL DEFAULT 0,
+    quantity_reserved DECIMAL(15, 2) NOT NULL DEFAULT 0,
+    quantity_available DECIMAL(15, 2) NOT NULL DEFAULT 0,
+    created_at TIMESTAMP,
+    updated_at TIMESTAMP,
+    UNIQUE (manufacturing_unit_id, product_id)
+);
+CREATE TABLE anomalies (
+    id INTEGER PRIMARY KEY,
+    org_id INTEGER NOT NULL,
+    unit_id INTEGER,
+    anomaly_type TEXT NOT NULL,
+    severity TEXT NOT NULL,
+    detected_at TIMESTAMP,
+    entity_type TEXT,
+    entity_id INTEGER,
+    anomaly_description TEXT,
+    expected_value DECIMAL(15, 2),
+    actual_value DECIMAL(15, 2),
+    status TEXT,
+    created_at TIMESTAMP,
+    updated_at TIMESTAMP
+);
+"""
+
+# SQLite has no ON DUPLICATE KEY UPDATE; its upsert form is equivalent.
+SQLITE_INVENTORY_UPSERT_QUERY = """
+INSERT INTO inventory
+(organization_id, manufacturing_unit_id, product_id, quantity_on_hand, quantity_available, created_at, updated_at)
+VALUES (%s, %s, %s, %s, %s, %s, %s)
+ON CONFLICT(manufacturing_unit_id, product_id) DO UPDATE SET
+quantity_on_hand = excluded.quantity_on_hand,
+quantity_available = excluded.quantity_on_hand - quantity_reserved,
+updated_at = excluded.updated_at
+"""
+
+TRANSACTION_TYPES = ["receipt", "issue", "return", "adjustment", "transfer"]
+TRANSACTION_WEIGHTS = [46, 45, 5, 2, 2]
+
+
+def synthetic_transactions(start_id, count, units, products, started):
+    kinds = random.choices(TRANSACTION_TYPES, TRANSACTION_WEIGHTS, k=count)
+    for offset in range(count):
+        unit_id = random.randint(1, units)
+        kind = kinds[offset]
+        quantity = (
+            random.randint(100, 50000)
+            if kind != "issue"
+            else random.randint(100, 48000)
+        )
+        yield (
+            start_id + offset,
+            1 + unit_id % 25,
+            unit_id,
+            random.randint(1, products),
+            kind,
+            f"{quantity / 100:.2f}",
+            (started + timedelta(seconds=(start_id + offset) * 7)).isoformat(sep=" "),
+        )
+
+
+def load(db, rows):
+    with db.cursor() as cursor:
+        cursor.executemany(
+            "INSERT INTO stock_transactions (id, organization_id, manufacturing_unit_id, "
+            "product_id, transaction_type, quantity, transaction_date) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s)",
+            rows,
+        )
+    db.commit()
+
+
+def timed_run(path, redis_client, full):
+    read_connection = SQLiteConnection(path)
+    write_connection = SQLiteConnection(path)
+    started = time.perf_counter()
+    result = StockLedger(read_connection, write_connection, redis_client).run(full=full)
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    result["transactions_per_sec"] = round(
+        result["transactions"] / result["seconds"], 1
+    )
+    read_connection.close()
+    write_connection.close()
+    return result
+
+
+def apply_only_rate(path):
+    # The in-memory fold on its own, with rows already fetched.
+    db = SQLiteConnection(path)
+    with db.cursor(pymysql.cursors.SSCursor) as cursor:
+        cursor.execute(stock_ledger.STOCK_TRANSACTION_QUERY.format(where=""), [1 << 62])
+        rows = cursor.fetchall()
+    db.close()
+    balances = StockBalances()
+    started = time.perf_counter()
+    balances.apply(rows)
+    return round(len(rows) / (time.perf_counter() - started), 1)
+
+
+def check_against_decimal_fold(path):
+    # Recompute a sample with plain Decimal arithmetic and compare.
+    db = SQLiteConnection(path)
+    with db.cursor() as cursor:
+        cursor.execute(
+            "SELECT manufacturing_unit_id, product_id, transaction_type, quantity "
+            "FROM stock_transactions WHERE manufacturing_unit_id = 1 "
+            "ORDER BY transaction_date, id"
+        )
+        expected = {}
+        for row in cursor.fetchall():
+            key = row["product_id"]
+            quantity = Decimal(str(row["quantity"]))
+            if row["transaction_type"] == "adjustment":
+                expected[key] = quantity
+            elif row["transaction_type"] in ("receipt", "return"):
+                expected[key] = expected.get(key, Decimal(0)) + quantity
+            elif row["transaction_type"] == "issue":
+                expected[key] = expected.get(key, Decimal(0)) - quantity
+        cursor.execute(
+            "SELECT product_id, quantity_on_hand FROM inventory WHERE manufacturing_unit_id = 1"
+        )
+        stored = {
+            row["product_id"]: Decimal(str(row["quantity_on_hand"]))
+            for row in cursor.fetchall()
+        }
+    db.close()
+    return all(
+        stored.get(key, Decimal(0)).quantize(Decimal("0.01"))
+        == value.quantize(Decimal("0.01"))
+        for key, value in expected.items()
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stock ledger rebuild benchmark")
+    parser.add_argument("--transactions", type=int, default=1000000)
+    parser.add_argument("--units", type=int, default=50)
+    parser.add_argument("--products", type=int, default=400)
+    parser.add_argument("--incremental", type=int, default=1000)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    sqlite3.register_adapter(Decimal, str)
+    stock_ledger.INVENTORY_UPSERT_QUERY = SQLITE_INVENTORY_UPSERT_QUERY
+    # SQLite's SIGNED affinity leaves ROUND()'s REAL as a REAL.
+    stock_ledger.STOCK_TRANSACTION_QUERY = stock_ledger.STOCK_TRANSACTION_QUERY.replace(
+        "AS SIGNED", "AS INTEGER"
+    )
+
+    redis_client = fakeredis.FakeRedis(decode_responses=True)
+    started = datetime(2024, 1, 1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "stock.db")
+        db = SQLiteConnection(path, synchronous="OFF")
+        db.executescript(STOCK_DDL)
+        load(
+            db,
+            synthetic_transactions(
+                1, args.transactions, args.units, args.products, started
+            ),
+        )
+
+        report = {"transactions": args.transactions, "keys": args.units * args.products}
+        report["apply_only_transactions_per_sec"] = apply_only_rate(path)
+        report["full"] = timed_run(path, redis_client, full=True)
+
+        load(
+            db,
+            synthetic_transactions(
+                args.transactions + 1,
+                args.incremental,
+                args.units,
+                args.products,
+                started,
+            ),
+        )
+        report["incremental"] = timed_run(path, redis_client, full=False)
+        report["balances_match_decimal_fold"] = check_against_decimal_fold(path)
+        db.close()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,538 @@
+import argparse
+import heapq
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import fakeredis
+from bench_audit_log import make_job as make_audit_job
+from sqlite_db import ACTIVITY_LOG_DDL, SQLiteConnection
+
+import kpi_engine
+import worker
+from db_pool import ConnectionPool
+from job_coalescer import JobCoalescer
+
+ERP_DDL = """
+CREATE TABLE organizations (
+    id INTEGER PRIMARY KEY, name TEXT, code TEXT, city TEXT, state TEXT,
+    country TEXT, phone TEXT, email TEXT, status TEXT,
+    deleted_at TIMESTAMP, updated_at TIMESTAMP
+);
+CREATE TABLE manufacturing_units (
+    id INTEGER PRIMARY KEY, organization_id INTEGER, name TEXT, code TEXT,
+    type TEXT, city TEXT, state TEXT, capacity_per_day REAL, capacity_unit TEXT,
+    status TEXT, deleted_at TIMESTAMP, updated_at TIMESTAMP
+);
+CREATE TABLE users (
+    id INTEGER PRIMARY KEY, organization_id INTEGER, manufacturing_unit_id INTEGER,
+    name TEXT, email TEXT, status TEXT, deleted_at TIMESTAMP, updated_at TIMESTAMP
+);
+CREATE TABLE products (
+    id INTEGER PRIMARY KEY, organization_id INTEGER, name TEXT, code TEXT,
+    sku TEXT, type TEXT, unit_of_measure TEXT, standard_cost REAL,
+    selling_price REAL, gst_rate REAL, status TEXT,
+    deleted_at TIMESTAMP, updated_at TIMESTAMP
+);
+CREATE TABLE kpis (
+    id INTEGER PRIMARY KEY, target_value REAL, tolerance_percentage REAL
+);
+CREATE TABLE kpi_values (
+    id INTEGER PRIMARY KEY, kpi_id INTEGER, org_id INTEGER, unit_id INTEGER,
+    record_date DATE, actual_value REAL, target_value REAL, variance REAL,
+    variance_percentage REAL, achievement_percentage REAL, status TEXT,
+    trend TEXT, calculated_at TIMESTAMP,
+    UNIQUE (kpi_id, org_id, unit_id, record_date)
+);
+CREATE TABLE stock_transactions (
+    id INTEGER PRIMARY KEY, organization_id INTEGER, manufacturing_unit_id INTEGER,
+    product_id INTEGER, transaction_number TEXT, transaction_type TEXT,
+    quantity NUMERIC, unit_of_measure TEXT, reference_type TEXT,
+    reference_id INTEGER, reason TEXT, transaction_date TEXT
+);
+CREATE INDEX stock_transactions_org_date ON stock_transactions (organization_id, transaction_date);
+"""
+
+# SQLite has no ON DUPLICATE KEY UPDATE; its upsert form is equivalent.
+SQLITE_KPI_UPSERT_QUERY = """
+INSERT INTO kpi_values
+(kpi_id, org_id, unit_id, record_date, actual_value, target_value, variance, variance_percentage, achievement_percentage, status, trend, calculated_at)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+ON CONFLICT(kpi_id, org_id, unit_id, record_date) DO UPDATE SET
+actual_value = excluded.actual_value,
+target_value = excluded.target_value,
+variance = excluded.variance,
+variance_percentage = excluded.variance_percentage,
+achievement_percentage = excluded.achievement_percentage,
+status = excluded.status,
+trend = excluded.trend,
+calculated_at = excluded.calculated_at
+"""
+
+REPORT_START = datetime(2026, 1, 1)
+
+
+def parse_rates(spec):
+    rates = {}
+    for item in spec.split(","):
+        job_type, _, rate = item.partition("=")
+        rates[job_type.strip()] = float(rate)
+    return rates
+
+
+def seed(path, orgs, users, products, report_rows):
+    db = SQLiteConnection(path, synchronous="OFF")
+    db.executescript(ERP_DDL + ACTIVITY_LOG_DDL)
+    now = datetime.now().isoformat(sep=" ")
+    with db.cursor() as cursor:
+        cursor.executemany(
+            "INSERT INTO organizations VALUES (%s, %s, %s, 'Pune', 'MH', 'IN', '', '', 'active', NULL, %s)",
+            [(i, f"Org {i}", f"ORG{i:03d}", now) for i in range(1, orgs + 1)],
+        )
+        cursor.executemany(
+            "INSERT INTO manufacturing_units VALUES "
+            "(%s, %s, %s, %s, 'plant', 'Pune', 'MH', 100, 'ton', 'active', NULL, %s)",
+            [
+                (i, 1 + i % orgs, f"Plant {i}", f"U{i:04d}", now)
+                for i in range(1, orgs * 4 + 1)
+            ],
+        )
+        cursor.executemany(
+            "INSERT INTO users VALUES (%s, %s, %s, %s, %s, 'active', NULL, %s)",
+            [
+                (i, 1 + i % orgs, 1 + i % (orgs * 4), f"User {i}", f"u{i}@x.test", now)
+                for i in range(1, users + 1)
+            ],
+        )
+        cursor.executemany(
+            "INSERT INTO products VALUES "
+            "(%s, %s, %s, %s, %s, 'finished', 'bag', 250, 320, 18, 'active', NULL, %s)",
+            [
+                (i, 1 + i % orgs, f"Product {i}", f"P{i:05d}", f"SKU{i:05d}", now)
+                for i in range(1, products + 1)
+            ],
+        )
+        cursor.executemany(
+            "INSERT INTO kpis VALUES (%s, %s, %s)", [(1, 40, 5), (2, 4, 0)]
+        )
+        cursor.executemany(
+            "INSERT INTO stock_transactions (organization_id, manufacturing_unit_id, "
+            "product_id, transaction_number, transaction_type, quantity, unit_of_measure, "
+            "reference_type, reference_id, reason, transaction_date) "
+            "VALUES (1, %s, %s, %s, 'receipt', %s, 'bag', 'production_order', %s, NULL, %s)",
+            [
+                (
+                    1 + i % 4,
+                    1 + i % products,
+                    f"ST{i:09d}",
+                    round(random.uniform(1, 500), 2),
+                    i,
+                    (REPORT_START + timedelta(minutes=i)).isoformat(sep=" "),
+                )
+                for i in range(report_rows)
+            ],
+        )
+    db.commit()
+    return db
+
+
+def make_job(job_type, seq, report_rows):
+    if job_type == "audit_log":
+        return make_audit_job(seq)
+    if job_type == "report_generation":
+        return {
+            "job_type": job_type,
+            "report": "stock_ledger",
+            "format": "csv",
+            "org_id": 1,
+            "report_id": f"bench{seq}",
+            "date_from": REPORT_START.isoformat(sep=" "),
+            "date_to": (REPORT_START + timedelta(minutes=report_rows)).isoformat(
+                sep=" "
+            ),
+        }
+    return {"job_type": job_type}
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.service = {}
+        self.completed = 0
+        self.failed = 0
+        self.coalesced = {}
+
+    def record(self, job_type, jobs_data, started, succeeded):
+        finished = time.time()
+        service = time.perf_counter() - started
+        with self.lock:
+            latencies = self.latencies.setdefault(job_type, [])
+            for job_data in jobs_data:
+                latencies.append(finished - float(job_data.get("queued_at", finished)))
+            self.service.setdefault(job_type, []).extend(
+                [service / len(jobs_data)] * len(jobs_data)
+            )
+            self.completed += len(jobs_data)
+            if not succeeded:
+                self.failed += len(jobs_data)
+
+    def record_coalesced(self, job_type, count):
+        with self.lock:
+            self.coalesced[job_type] = self.coalesced.get(job_type, 0) + count
+            self.completed += count
+
+
+def instrument(erp_worker, recorder):
+    # Wrap the worker's own entry points, so the timings cover the real
+    # dispatch path from the queue onwards.
+    process_job = erp_worker.process_job
+    process_job_batch = erp_worker.process_job_batch
+
+    def timed_process_job(job_type, job_data):
+        started = time.perf_counter()
+        succeeded = process_job(job_type, job_data)
+        recorder.record(job_type, [job_data], started, succeeded)
+        return succeeded
+
+    def timed_process_job_batch(job_type, jobs):
+        started = time.perf_counter()
+        succeeded = process_job_batch(job_type, jobs)
+        recorder.record(job_type, [data for data, _ in jobs], started, succeeded)
+        return succeeded
+
+    # Coalesced jobs never reach process_job but still count as done.
+    coalesced = erp_worker.metrics.coalesced
+
+    def counted_coalesced(job_type, count=1):
+        recorder.record_coalesced(job_type, count)
+        coalesced(job_type, count)
+
+    erp_worker.process_job = timed_process_job
+    erp_worker.process_job_batch = timed_process_job_batch
+    erp_worker.metrics.coalesced = counted_coalesced
+
+
+def build_worker(path, args):
+    worker.WORKER_CONCURRENCY = args.concurrency
+    worker.BULK_DEQUEUE_SIZE = args.bulk_size
+    erp_worker = worker.ERPWorker()
+    erp_worker.redis_client = fakeredis.FakeRedis(decode_responses=True)
+    erp_worker.create_db_connection = lambda: SQLiteConnection(path)
+    erp_worker.db_pool = ConnectionPool(
+        erp_worker.create_db_connection,
+        min_size=1,
+        max_size=args.concurrency + 2,
+        name="bench",
+    )
+    erp_worker.db_pool.start()
+    erp_worker.start_audit_batcher()
+    erp_worker.job_queue = erp_worker.create_job_queue()
+    erp_worker.job_queue.start()
+    if args.coalescing:
+        erp_worker.coalescer = JobCoalescer(
+            erp_worker.redis_client, requeue=erp_worker.job_queue.push
+        )
+    erp_worker.start_job_pool()
+    return erp_worker
+
+
+def close_worker(erp_worker):
+    if erp_worker.job_pool:
+        erp_worker.job_pool.shutdown()
+    erp_worker.audit_batcher.close()
+    erp_worker.db_pool.close()
+
+
+def schedule(rates, duration, seed_value):
+    # Poisson arrivals per job type, merged into one timeline.
+    rng = random.Random(seed_value)
+    events = []
+    for job_type, rate in rates.items():
+        if rate <= 0:
+            continue
+        at = rng.expovariate(rate)
+        while at < duration:
+            events.append((at, job_type))
+            at += rng.expovariate(rate)
+    heapq.heapify(events)
+    return [heapq.heappop(events) for _ in range(len(events))]
+
+
+def produce(erp_worker, events, args, churn_db):
+    started = time.perf_counter()
+    for seq, (at, job_type) in enumerate(events):
+        if not args.saturate:
+            delay = at - (time.perf_counter() - started)
+            if delay > 0:
+                time.sleep(delay)
+        if job_type == "churn":
+            # Row updates that give the incremental KPI and cache jobs
+            # something to pick up.
+            with churn_db.cursor() as cursor:
+                cursor.execute(
+                    "UPDATE users SET updated_at = %s WHERE id = %s",
+                    (datetime.now().isoformat(sep=" "), random.randint(1, args.users)),
+                )
+                cursor.execute(
+                    "UPDATE products SET updated_at = %s WHERE id = %s",
+                    (
+                        datetime.now().isoformat(sep=" "),
+                        random.randint(1, args.products),
+                    ),
+                )
+            churn_db.commit()
+            continue
+        erp_worker.job_queue.push(make_job(job_type, seq, args.report_rows))
+
+
+def summarize(values):
+    values = sorted(values)
+    if not values:
+        return {}
+    pick = lambda fraction: values[min(len(values) - 1, int(len(values) * fraction))]
+    return {
+        "p50": round(pick(0.5) * 1000, 3),
+        "p95": round(pick(0.95) * 1000, 3),
+        "p99": round(pick(0.99) * 1000, 3),
+    }
+
+
+def run_load(path, args, rates):
+    events = schedule({**rates, "churn": args.churn}, args.duration, args.seed)
+    expected = sum(1 for _, job_type in events if job_type != "churn")
+    recorder = Recorder()
+    erp_worker = build_worker(path, args)
+    instrument(erp_worker, recorder)
+    churn_db = SQLiteConnection(path)
+
+    listener = threading.Thread(target=erp_worker.listen_for_jobs, daemon=True)
+    producer = threading.Thread(
+        target=produce, args=(erp_worker, events, args, churn_db), daemon=True
+    )
+    if args.saturate:
+        produce(erp_worker, events, args, churn_db)
+    started = time.perf_counter()
+    if not args.saturate:
+        producer.start()
+    listener.start()
+    if not args.saturate:
+        producer.join()
+    deadline = time.monotonic() + args.drain_timeout
+    while recorder.completed < expected and time.monotonic() < deadline:
+        time.sleep(0.01)
+    seconds = time.perf_counter() - started
+
+    # Wake the listener out of its blocking fetch so it sees running=False;
+    # the worker logs the unknown wake-up job as a warning.
+    erp_worker.running = False
+    logging.getLogger().setLevel(logging.ERROR)
+    erp_worker.job_queue.push({"job_type": "bench_stop"})
+    listener.join(timeout=10)
+    logging.getLogger().setLevel(logging.WARNING)
+    close_worker(erp_worker)
+    churn_db.close()
+
+    job_types = {}
+    for job_type in rates:
+        latencies = recorder.latencies.get(job_type, [])
+        job_types[job_type] = {
+            "jobs": len(latencies),
+            "jobs_per_sec": round(len(latencies) / seconds, 1),
+            "coalesced": recorder.coalesced.get(job_type, 0),
+            "latency_ms": summarize(latencies),
+            "service_ms": summarize(recorder.service.get(job_type, [])),
+        }
+    completed = sum(stats["jobs"] + stats["coalesced"] for stats in job_types.values())
+    return {
+        "jobs": completed,
+        "expected_jobs": expected,
+        "failed_jobs": recorder.failed,
+        "seconds": round(seconds, 3),
+        "jobs_per_sec": round(completed / seconds, 1),
+        "job_types": job_types,
+    }
+
+
+def measure_memory(path, args, job_types):
+    # Separate pass so tracemalloc's own overhead stays out of the timings.
+    args = argparse.Namespace(**{**vars(args), "concurrency": 1})
+    erp_worker = build_worker(path, args)
+    results = {}
+    for job_type in job_types:
+        jobs = [
+            {"queued_at": time.time(), **make_job(job_type, i, args.report_rows)}
+            for i in range(args.memory_jobs)
+        ]
+        erp_worker.process_job(job_type, jobs[0])
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        for job in jobs:
+            erp_worker.process_job(job_type, job)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[job_type] = {
+            "peak_kib": round((peak - before) / 1024, 1),
+            "retained_bytes_per_job": round(max(current - before, 0) / len(jobs), 1),
+        }
+    close_worker(erp_worker)
+    return results
+
+
+def regressions(report, baseline, max_regression, latency_slack_ms, min_samples):
+    found = []
+
+    # Small absolute differences are noise on a shared box, whatever their
+    # ratio, so a change also has to exceed slack to count.
+    def compare(name, current, previous, higher_is_worse, slack=0):
+        if current is None or not previous:
+            return
+        change = (current - previous) / previous
+        worse = current - previous if higher_is_worse else previous - current
+        if (change if higher_is_worse else -change) > max_regression and worse > slack:
+            found.append(f"{name}: {previous} -> {current} ({change * 100:+.1f}%)")
+
+    compare(
+        "jobs_per_sec",
+        report["load"]["jobs_per_sec"],
+        baseline["load"]["jobs_per_sec"],
+        False,
+    )
+    for job_type, current in report["load"]["job_types"].items():
+        previous = baseline["load"]["job_types"].get(job_type)
+        if not previous:
+            continue
+        # A tail percentile of a few dozen samples is one or two jobs; with
+        # fewer than min_samples on either side only the median is compared.
+        fields = ("p95", "p99")
+        if min(current["jobs"], previous["jobs"]) < min_samples:
+            fields = ("p50",)
+        for field in fields:
+            compare(
+                f"{job_type}.latency_ms.{field}",
+                current["latency_ms"].get(field),
+                previous["latency_ms"].get(field),
+                True,
+                slack=latency_slack_ms,
+            )
+    for job_type, current in report.get("memory", {}).items():
+        previous = baseline.get("memory", {}).get(job_type, {})
+        compare(
+            f"{job_type}.retained_bytes_per_job",
+            current["retained_bytes_per_job"],
+            previous.get("retained_bytes_per_job"),
+            True,
+            slack=1024,
+        )
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker job pipeline load test")
+    parser.add_argument(
+        "--rates",
+        default="audit_log=200,kpi_calculation=2,cache_warmup=2,report_generation=4",
+        help="jobs per second for each job type",
+    )
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument(
+        "--saturate",
+        action="store_true",
+        help="enqueue the whole mix up front and measure how fast it drains",
+    )
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--bulk-size", type=int, default=50)
+    parser.add_argument("--coalescing", action="store_true")
+    parser.add_argument(
+        "--churn", type=float, default=20, help="row updates per second"
+    )
+    parser.add_argument("--orgs", type=int, default=50)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--report-rows", type=int, default=5000)
+    parser.add_argument("--memory-jobs", type=int, default=20)
+    parser.add_argument("--drain-timeout", type=float, default=120)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="also write the report to this file")
+    parser.add_argument("--baseline", help="earlier report to compare against")
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        default=0.2,
+        help="fail when throughput drops or latency/memory grows by more than this fraction",
+    )
+    parser.add_argument(
+        "--latency-slack-ms",
+        type=float,
+        default=10,
+        help="ignore latency increases smaller than this",
+    )
+    parser.add_argument(
+        "--min-samples",
+        type=int,
+        default=200,
+        help="compare p95/p99 only for job types with at least this many jobs",
+    )
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    random.seed(args.seed)
+    kpi_engine.KPI_UPSERT_QUERY = SQLITE_KPI_UPSERT_QUERY
+    rates = parse_rates(args.rates)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "erp.db")
+        worker.REPORT_STORAGE_PATH = os.path.join(tmp, "reports")
+        seed(path, args.orgs, args.users, args.products, args.report_rows).close()
+
+        report = {
+            "config": {
+                "rates": rates,
+                "duration": args.duration,
+                "saturate": args.saturate,
+                "concurrency": args.concurrency,
+                "bulk_size": args.bulk_size,
+                "coalescing": args.coalescing,
+                "churn": args.churn,
+            },
+            "load": run_load(path, args, rates),
+            "memory": measure_memory(path, args, list(rates)),
+            "max_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        }
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as handle:
+            handle.write(output)
+
+    failed = []
+    if report["load"]["jobs"] < report["load"]["expected_jobs"]:
+        failed.append(
+            f"only {report['load']['jobs']} of {report['load']['expected_jobs']} jobs completed"
+        )
+    if args.baseline:
+        with open(args.baseline) as handle:
+            failed += regressions(
+                report,
+                json.load(handle),
+                args.max_regression,
+                args.latency_slack_ms,
+                args.min_samples,
+            )
+    if failed:
+        for line in failed:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import os
+import sqlite3
+import sys
+from datetime import datetime
+
+import pymysql
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class SQLiteCursor:
+    def __init__(self, cursor, as_dict=True):
+        self.cursor = cursor
+        self.row = dict if as_dict else tuple
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cursor.close()
+
+    @staticmethod
+    def _translate(query):
+        return query.replace("%s", "?")
+
+    def execute(self, query, params=()):
+        self.cursor.execute(self._translate(query), params)
+        return self.cursor.rowcount
+
+    def executemany(self, query, rows):
+        self.cursor.executemany(self._translate(query), rows)
+        return self.cursor.rowcount
+
+    def fetchone(self):
+        row = self.cursor.fetchone()
+        return self.row(row) if row is not None else None
+
+    def fetchall(self):
+        return [self.row(row) for row in self.cursor.fetchall()]
+
+    def fetchmany(self, size):
+        return [self.row(row) for row in self.cursor.fetchmany(size)]
+
+    def __iter__(self):
+        for row in self.cursor:
+            yield self.row(row)
+
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self.cursor.lastrowid
+
+
+class SQLiteConnection:
+    # pymysql-shaped wrapper so worker code can run against SQLite.
+
+    def __init__(self, path=":memory:", synchronous="FULL"):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.create_function(
+            "NOW", 0, lambda: datetime.now().isoformat(sep=" ")
+        )
+        self.connection.execute(f"PRAGMA synchronous = {synchronous}")
+        if path != ":memory:":
+            self.connection.execute("PRAGMA journal_mode = WAL")
+
+    def cursor(self, cursorclass=None):
+        # sqlite3 cursors already step lazily, so only the row shape of the
+        # requested class matters.
+        as_dict = cursorclass is None or issubclass(
+            cursorclass, pymysql.cursors.DictCursorMixin
+        )
+        return SQLiteCursor(self.connection.cursor(), as_dict)
+
+    def commit(self):
+        self.connection.commit()
+
+    def rollback(self):
+        self.connection.rollback()
+
+    def ping(self, reconnect=False):
+        self.connection.execute("SELECT 1")
+
+    def close(self):
+        self.connection.close()
+
+    def executescript(self, script):
+        self.connection.executescript(script)
+
+
+ACTIVITY_LOG_DDL = """
+CREATE TABLE IF NOT EXISTS activity_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    log_name VARCHAR(255),
+    description TEXT NOT NULL,
+    subject_type VARCHAR(255),
+    subject_id INTEGER,
+    causer_type VARCHAR(255),
+    causer_id INTEGER,
+    properties TEXT,
+    batch_uuid CHAR(36),
+    event VARCHAR(255),
+    created_at TIMESTAMP,
+    updated_at TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS activity_log_log_name_index ON activity_log (log_name);
+CREATE INDEX IF NOT EXISTS subject ON activity_log (subject_type, subject_id);
+CREATE INDEX IF NOT EXISTS causer ON activity_log (causer_type, causer_id);
+"""
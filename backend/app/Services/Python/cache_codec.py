@@ -0,0 +1,135 @@
+import json
+import struct
+import zlib
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+CODEC_MAGIC = b"ERPC"
+CODEC_VERSION = 1
+FLAG_COMPRESSED = 0x01
+HEADER = struct.Struct(">4sBB")
+COMPRESS_MIN_BYTES = 1024
+COMPRESSION_LEVEL = 6
+
+# Column types and the (encode, decode) pair used for each of their values.
+COLUMN_TYPES = {
+    "decimal": (str, Decimal),
+    "datetime": (datetime.isoformat, datetime.fromisoformat),
+    "date": (date.isoformat, date.fromisoformat),
+    "timedelta": (timedelta.total_seconds, lambda value: timedelta(seconds=value)),
+    "json": (lambda value: value, lambda value: value),
+}
+
+
+def column_type(values):
+    kinds = set()
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, Decimal):
+            kinds.add("decimal")
+        elif isinstance(value, datetime):
+            kinds.add("datetime")
+        elif isinstance(value, date):
+            kinds.add("date")
+        elif isinstance(value, timedelta):
+            kinds.add("timedelta")
+        else:
+            kinds.add("json")
+    return kinds.pop() if len(kinds) == 1 else "json"
+
+
+class JsonCodec:
+    name = "json"
+
+    def encode(self, rows):
+        return json.dumps(rows, default=str).encode("utf-8")
+
+    def decode(self, payload):
+        if isinstance(payload, bytes):
+            payload = payload.decode("utf-8")
+        return json.loads(payload)
+
+
+class ColumnarCodec:
+    # Header: magic, version, flags. Body: JSON object holding the column
+    # names and types once and one value array per column, zlib'd when
+    # FLAG_COMPRESSED is set.
+    name = "columnar"
+
+    def __init__(
+        self,
+        compress=True,
+        compress_min_bytes=COMPRESS_MIN_BYTES,
+        level=COMPRESSION_LEVEL,
+    ):
+        self.compress = compress
+        self.compress_min_bytes = compress_min_bytes
+        self.level = level
+
+    def encode(self, rows):
+        columns = list(rows[0]) if rows else []
+        arrays = [[row[column] for row in rows] for column in columns]
+        types = [column_type(values) for values in arrays]
+        encoded = []
+        for kind, values in zip(types, arrays):
+            encode_value = COLUMN_TYPES[kind][0]
+            if kind == "json":
+                encoded.append(values)
+            else:
+                encoded.append(
+                    [None if value is None else encode_value(value) for value in values]
+                )
+
+        body = json.dumps(
+            {"columns": columns, "types": types, "rows": len(rows), "values": encoded},
+            separators=(",", ":"),
+            default=str,
+        ).encode("utf-8")
+
+        flags = 0
+        if self.compress and len(body) >= self.compress_min_bytes:
+            body = zlib.compress(body, self.level)
+            flags |= FLAG_COMPRESSED
+        return HEADER.pack(CODEC_MAGIC, CODEC_VERSION, flags) + body
+
+    def decode(self, payload):
+        magic, version, flags = HEADER.unpack_from(payload)
+        if magic != CODEC_MAGIC:
+            raise ValueError("Payload is not columnar-encoded")
+        if not 1 <= version <= CODEC_VERSION:
+            raise ValueError(f"Unsupported cache codec version {version}")
+
+        body = payload[HEADER.size :]
+        if flags & FLAG_COMPRESSED:
+            body = zlib.decompress(body)
+        document = json.loads(body)
+
+        columns = document["columns"]
+        arrays = []
+        for kind, values in zip(document["types"], document["values"]):
+            decode_value = COLUMN_TYPES[kind][1]
+            if kind == "json":
+                arrays.append(values)
+            else:
+                arrays.append(
+                    [None if value is None else decode_value(value) for value in values]
+                )
+        return [dict(zip(columns, row)) for row in zip(*arrays)]
+
+
+CODECS = {"json": JsonCodec, "columnar": ColumnarCodec}
+
+
+def get_codec(name, **options):
+    if name not in CODECS:
+        raise ValueError(f"Unknown cache codec: {name}")
+    return CODECS[name](**options)
+
+
+def decode_payload(payload):
+    # Readers can hold a mix of formats while a codec change rolls out;
+    # anything without the columnar header is legacy JSON.
+    if isinstance(payload, bytes) and payload[: len(CODEC_MAGIC)] == CODEC_MAGIC:
+        return ColumnarCodec().decode(payload)
+    return JsonCodec().decode(payload)
@@ -0,0 +1,251 @@
+import logging
+import random
+import time
+
+from cache_codec import get_codec
+
+CACHE_CHUNK_ROWS = 1000
+CACHE_TTL = 3600
+CACHE_TTL_JITTER = 0.2
+PIPELINE_KEYS = 100
+
+
+class CacheEntry:
+    def __init__(
+        self,
+        name,
+        table,
+        columns,
+        where=None,
+        org_column="organization_id",
+        key_column="id",
+        watermark_column="updated_at",
+        ttl=CACHE_TTL,
+    ):
+        self.name = name
+        self.table = table
+        self.columns = columns
+        self.where = where
+        self.org_column = org_column
+        self.key_column = key_column
+        self.watermark_column = watermark_column
+        self.ttl = ttl
+
+    def chunk_query(self, limit):
+        conditions = [f"{self.org_column} = %s", f"{self.key_column} > %s"]
+        if self.where:
+            conditions.append(self.where)
+        return (
+            f"SELECT {', '.join(self.columns)} FROM {self.table} "
+            f"WHERE {' AND '.join(conditions)} "
+            f"ORDER BY {self.key_column} LIMIT {int(limit)}"
+        )
+
+    def fingerprint_query(self):
+        # Unfiltered on purpose: a row leaving the cached set (deactivated,
+        # soft deleted) still moves its organization's watermark.
+        return (
+            f"SELECT {self.org_column} AS org_id, MAX({self.watermark_column}) AS latest, "
+            f"COUNT(*) AS row_count FROM {self.table} GROUP BY {self.org_column}"
+        )
+
+
+CACHE_ENTRIES = {}
+
+
+def register_cache_entry(entry):
+    CACHE_ENTRIES[entry.name] = entry
+    return entry
+
+
+register_cache_entry(
+    CacheEntry(
+        "organization",
+        "organizations",
+        ["id", "name", "code", "city", "state", "country", "phone", "email", "status"],
+        where="deleted_at IS NULL",
+        org_column="id",
+    )
+)
+
+register_cache_entry(
+    CacheEntry(
+        "manufacturing_units",
+        "manufacturing_units",
+        [
+            "id",
+            "organization_id",
+            "name",
+            "code",
+            "type",
+            "city",
+            "state",
+            "capacity_per_day",
+            "capacity_unit",
+            "status",
+        ],
+        where="deleted_at IS NULL",
+    )
+)
+
+register_cache_entry(
+    CacheEntry(
+        "users:active",
+        "users",
+        ["id", "organization_id", "manufacturing_unit_id", "name", "email", "status"],
+        where="status = 'active' AND deleted_at IS NULL",
+    )
+)
+
+register_cache_entry(
+    CacheEntry(
+        "products:active",
+        "products",
+        [
+            "id",
+            "organization_id",
+            "name",
+            "code",
+            "sku",
+            "type",
+            "unit_of_measure",
+            "standard_cost",
+            "selling_price",
+            "gst_rate",
+            "status",
+        ],
+        where="status = 'active' AND deleted_at IS NULL",
+    )
+)
+
+
+class CacheWarmer:
+    def __init__(
+        self,
+        db_connection,
+        redis_client,
+        key_prefix="",
+        entries=None,
+        chunk_rows=CACHE_CHUNK_ROWS,
+        ttl_jitter=CACHE_TTL_JITTER,
+        codec=None,
+    ):
+        self.db_connection = db_connection
+        self.redis_client = redis_client
+        self.key_prefix = key_prefix
+        self.entries = entries if entries is not None else CACHE_ENTRIES
+        self.chunk_rows = chunk_rows
+        self.ttl_jitter = ttl_jitter
+        self.codec = codec or get_codec("columnar")
+        self.stats = {}
+
+    def cache_key(self, entry, org_id):
+        return f"{self.key_prefix}cache:{entry.name}:{org_id}"
+
+    def watermark_key(self, entry):
+        return f"{self.key_prefix}cache:watermarks:{entry.name}"
+
+    def stats_key(self):
+        return f"{self.key_prefix}cache:warmup:stats"
+
+    def jittered_ttl(self, ttl):
+        # Spread expiries so keys warmed together do not all miss together.
+        return ttl + random.randint(0, int(ttl * self.ttl_jitter))
+
+    def fingerprints(self, cursor, entry):
+        cursor.execute(entry.fingerprint_query())
+        return {
+            row["org_id"]: f"{row['latest']}|{row['row_count']}"
+            for row in cursor.fetchall()
+            if row["org_id"] is not None
+        }
+
+    def stale_orgs(self, entry, current):
+        org_ids = sorted(current)
+        if not org_ids:
+            return [], []
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.hmget(self.watermark_key(entry), org_ids)
+        for org_id in org_ids:
+            pipe.exists(self.cache_key(entry, org_id))
+        results = pipe.execute()
+        stored, present = results[0], results[1:]
+
+        fresh, stale = [], []
+        for org_id, previous, exists in zip(org_ids, stored, present):
+            if exists and previous == current[org_id]:
+                fresh.append(org_id)
+            else:
+                stale.append(org_id)
+        return fresh, stale
+
+    def load_rows(self, cursor, entry, org_id):
+        query = entry.chunk_query(self.chunk_rows)
+        rows = []
+        last_key = 0
+        while True:
+            cursor.execute(query, (org_id, last_key))
+            chunk = cursor.fetchall()
+            rows.extend(chunk)
+            if len(chunk) < self.chunk_rows:
+                return rows
+            last_key = chunk[-1][entry.key_column]
+
+    def warm_entry(self, cursor, entry):
+        counts = {"hits": 0, "misses": 0, "keys_written": 0, "bytes_written": 0}
+        current = self.fingerprints(cursor, entry)
+        fresh, stale = self.stale_orgs(entry, current)
+        counts["hits"] = len(fresh)
+        counts["misses"] = len(stale)
+
+        pipe = self.redis_client.pipeline(transaction=False)
+        for org_id in fresh:
+            pipe.expire(self.cache_key(entry, org_id), self.jittered_ttl(entry.ttl))
+
+        pending = 0
+        for org_id in stale:
+            payload = self.codec.encode(self.load_rows(cursor, entry, org_id))
+            pipe.setex(
+                self.cache_key(entry, org_id), self.jittered_ttl(entry.ttl), payload
+            )
+            # The watermark rides in the same pipeline as its payload, so a
+            # failed flush leaves both behind and the next run retries.
+            pipe.hset(self.watermark_key(entry), org_id, current[org_id])
+            counts["keys_written"] += 1
+            counts["bytes_written"] += len(payload)
+            pending += 1
+            if pending >= PIPELINE_KEYS:
+                pipe.execute()
+                pending = 0
+
+        removed = set(
+            int(org_id) for org_id in self.redis_client.hkeys(self.watermark_key(entry))
+        ) - set(current)
+        for org_id in removed:
+            pipe.delete(self.cache_key(entry, org_id))
+            pipe.hdel(self.watermark_key(entry), org_id)
+        pipe.execute()
+        return counts
+
+    def run(self):
+        started = time.perf_counter()
+        totals = {"hits": 0, "misses": 0, "keys_written": 0, "bytes_written": 0}
+        self.stats = {}
+        with self.db_connection.cursor() as cursor:
+            for name, entry in self.entries.items():
+                counts = self.warm_entry(cursor, entry)
+                self.stats[name] = counts
+                for field, value in counts.items():
+                    totals[field] += value
+
+        pipe = self.redis_client.pipeline(transaction=False)
+        for field, value in totals.items():
+            pipe.hincrby(self.stats_key(), field, value)
+        pipe.execute()
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        logging.info(
+            f"Cache warmed: {totals['misses']} rebuilt, {totals['hits']} unchanged, "
+            f"{totals['bytes_written']} bytes written in {elapsed_ms:.1f} ms"
+        )
+        return totals
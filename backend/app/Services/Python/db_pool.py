@@ -0,0 +1,214 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import pymysql
+
+# MySQL client errors that mean the connection itself is gone: can't connect,
+# server has gone away, lost connection during query, server lost.
+DISCONNECT_ERRORS = {2003, 2006, 2013, 2055}
+
+
+def is_disconnect(error):
+    if isinstance(error, pymysql.err.InterfaceError):
+        return True
+    if isinstance(error, pymysql.err.OperationalError) and error.args:
+        return error.args[0] in DISCONNECT_ERRORS
+    return isinstance(error, (ConnectionError, BrokenPipeError))
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(
+        self,
+        connect,
+        min_size=1,
+        max_size=5,
+        checkout_timeout=10,
+        ping_after=5,
+        name="mysql",
+    ):
+        if min_size > max_size:
+            raise ValueError("min_size cannot exceed max_size")
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.ping_after = ping_after
+        self.name = name
+        self.condition = threading.Condition()
+        self.idle = []
+        self.size = 0
+        self.closed = False
+
+        self.checkouts = 0
+        self.timeouts = 0
+        self.reconnects = 0
+        self.discarded = 0
+        self.retries = 0
+        self.wait_seconds = 0.0
+        self.max_wait_ms = 0.0
+        self.hold_seconds = 0.0
+        self.max_hold_ms = 0.0
+        self.checked_out = {}
+
+    def start(self):
+        with self.condition:
+            while self.size < self.min_size:
+                self.idle.append((self.connect(), time.monotonic()))
+                self.size += 1
+        logging.info(
+            f"Connection pool {self.name} started with {self.size} connections (max {self.max_size})"
+        )
+
+    def _open(self):
+        try:
+            return self.connect()
+        except Exception:
+            with self.condition:
+                self.size -= 1
+                self.condition.notify()
+            raise
+
+    def _healthy(self, connection, idle_since):
+        # Connections used within ping_after seconds skip the round trip.
+        if time.monotonic() - idle_since < self.ping_after:
+            return True
+        try:
+            connection.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def _close_quietly(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def acquire(self, timeout=None):
+        timeout = self.checkout_timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        with self.condition:
+            while not self.idle and self.size >= self.max_size:
+                if self.closed:
+                    raise PoolTimeout(f"Connection pool {self.name} is closed")
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout(
+                        f"No connection from pool {self.name} within {timeout}s"
+                    )
+                self.condition.wait(remaining)
+            if self.idle:
+                connection, idle_since = self.idle.pop()
+            else:
+                connection, idle_since = None, None
+                self.size += 1
+
+        if connection is None:
+            connection = self._open()
+        elif not self._healthy(connection, idle_since):
+            self._close_quietly(connection)
+            self.reconnects += 1
+            connection = self._open()
+
+        waited = time.monotonic() - started
+        with self.condition:
+            self.checkouts += 1
+            self.wait_seconds += waited
+            self.max_wait_ms = max(self.max_wait_ms, waited * 1000)
+            self.checked_out[id(connection)] = time.monotonic()
+        return connection
+
+    def release(self, connection, error=None):
+        discard = error is not None and is_disconnect(error)
+        if error is not None and not discard:
+            try:
+                connection.rollback()
+            except Exception:
+                discard = True
+
+        with self.condition:
+            checked_out_at = self.checked_out.pop(id(connection), None)
+            if checked_out_at is not None:
+                held = time.monotonic() - checked_out_at
+                self.hold_seconds += held
+                self.max_hold_ms = max(self.max_hold_ms, held * 1000)
+            if discard or self.closed:
+                self.size -= 1
+                self.discarded += discard
+            else:
+                self.idle.append((connection, time.monotonic()))
+            self.condition.notify()
+
+        if discard or self.closed:
+            self._close_quietly(connection)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        connection = self.acquire(timeout)
+        try:
+            yield connection
+        except BaseException as e:
+            self.release(connection, error=e)
+            raise
+        self.release(connection)
+
+    def run(self, func, retry=False):
+        # retry is only safe for idempotent work: the first attempt may have
+        # reached the server before the connection dropped.
+        try:
+            with self.connection() as connection:
+                return func(connection)
+        except Exception as e:
+            if not retry or not is_disconnect(e):
+                raise
+            logging.warning(
+                f"Connection pool {self.name}: retrying after lost connection: {e}"
+            )
+            with self.condition:
+                self.retries += 1
+        with self.connection() as connection:
+            return func(connection)
+
+    def stats(self):
+        with self.condition:
+            return {
+                "size": self.size,
+                "idle": len(self.idle),
+                "in_use": len(self.checked_out),
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "reconnects": self.reconnects,
+                "discarded": self.discarded,
+                "retries": self.retries,
+                "avg_wait_ms": (
+                    round(self.wait_seconds * 1000 / self.checkouts, 3)
+                    if self.checkouts
+                    else 0.0
+                ),
+                "max_wait_ms": round(self.max_wait_ms, 3),
+                "avg_hold_ms": (
+                    round(self.hold_seconds * 1000 / self.checkouts, 3)
+                    if self.checkouts
+                    else 0.0
+                ),
+                "max_hold_ms": round(self.max_hold_ms, 3),
+            }
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            idle = self.idle
+            self.idle = []
+            self.size -= len(idle)
+            self.condition.notify_all()
+        for connection, _ in idle:
+            self._close_quietly(connection)
+        logging.info(f"Connection pool {self.name} closed: {self.stats()}")
@@ -0,0 +1,465 @@
+import json
+import logging
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+FORECAST_ALGORITHM = "linear_trend_seasonal"
+FORECAST_MODEL_VERSION = "1.0"
+ALL_ENTITIES = "all"
+Z_95 = 1.96
+
+DEMAND_QUERY = """
+SELECT so.organization_id AS org_id, soi.product_id AS entity_id,
+       DATE_FORMAT(so.order_date, '%%Y-%%m-01') AS period,
+       SUM(soi.quantity) AS value, NULL AS weight
+FROM sales_order_items soi
+JOIN sales_orders so ON so.id = soi.sales_order_id
+WHERE so.order_date >= %s AND so.deleted_at IS NULL AND so.status <> 'cancelled'
+GROUP BY so.organization_id, soi.product_id, period
+"""
+
+PRODUCTION_QUERY = """
+SELECT organization_id AS org_id, manufacturing_unit_id AS entity_id,
+       order_date AS period, SUM(actual_quantity) AS value, NULL AS weight
+FROM production_orders
+WHERE order_date >= %s AND deleted_at IS NULL AND status <> 'cancelled'
+GROUP BY organization_id, manufacturing_unit_id, order_date
+"""
+
+QUALITY_QUERY = """
+SELECT organization_id AS org_id, manufacturing_unit_id AS entity_id,
+       inspection_date AS period,
+       SUM(CASE WHEN result = 'fail' THEN 1 ELSE 0 END) AS value,
+       COUNT(*) AS weight
+FROM inspections
+WHERE inspection_date >= %s AND deleted_at IS NULL AND manufacturing_unit_id IS NOT NULL
+GROUP BY organization_id, manufacturing_unit_id, inspection_date
+"""
+
+
+class ForecastSpec:
+    def __init__(
+        self,
+        kind,
+        entity_type,
+        query,
+        monthly,
+        season_length,
+        horizon,
+        history,
+        history_field,
+        forecast_key,
+        forecast_field,
+        ratio=False,
+    ):
+        self.kind = kind
+        self.entity_type = entity_type
+        self.query = query
+        self.monthly = monthly
+        self.season_length = season_length
+        self.horizon = horizon
+        self.history = history
+        self.history_field = history_field
+        self.forecast_key = forecast_key
+        self.forecast_field = forecast_field
+        self.ratio = ratio
+
+    def period_index(self, period, start):
+        if self.monthly:
+            return (period.year - start.year) * 12 + period.month - start.month
+        return (period - start).days
+
+    def period_at(self, start, offset):
+        if self.monthly:
+            month = start.month - 1 + offset
+            return date(start.year + month // 12, month % 12 + 1, 1)
+        return start + timedelta(days=offset)
+
+    def period_label(self, period):
+        return period.strftime("%Y-%m" if self.monthly else "%Y-%m-%d")
+
+    def history_start(self, today):
+        if self.monthly:
+            return self.period_at(date(today.year, today.month, 1), -self.history)
+        return today - timedelta(days=self.history)
+
+
+# Field names mirror the JSON PredictionController already returns, so a
+# cached payload can be served as-is.
+FORECAST_SPECS = {
+    "demand": ForecastSpec(
+        "demand",
+        "product",
+        DEMAND_QUERY,
+        monthly=True,
+        season_length=12,
+        horizon=6,
+        history=24,
+        history_field="total",
+        forecast_key="forecast",
+        forecast_field="predicted_value",
+    ),
+    "production": ForecastSpec(
+        "production",
+        "manufacturing_unit",
+        PRODUCTION_QUERY,
+        monthly=False,
+        season_length=7,
+        horizon=30,
+        history=90,
+        history_field="total_quantity",
+        forecast_key="prediction",
+        forecast_field="predicted_quantity",
+    ),
+    "quality": ForecastSpec(
+        "quality",
+        "manufacturing_unit",
+        QUALITY_QUERY,
+        monthly=False,
+        season_length=7,
+        horizon=30,
+        history=90,
+        history_field="defect_rate",
+        forecast_key="prediction",
+        forecast_field="predicted_defect_rate",
+        ratio=True,
+    ),
+}
+
+
+def fit_forecast(matrix, season_length, horizon):
+    # One least-squares trend and one set of multiplicative seasonal indices
+    # per row, fitted for every series at once.
+    series_count, periods = matrix.shape
+    x = np.arange(periods, dtype=float)
+    x_centered = x - x.mean()
+    y_mean = matrix.mean(axis=1)
+    slope = (matrix - y_mean[:, None]) @ x_centered / max((x_centered**2).sum(), 1.0)
+    intercept = y_mean - slope * x.mean()
+    trend_fit = intercept[:, None] + slope[:, None] * x
+
+    positions = np.arange(periods) % season_length
+    seasonal = np.ones((series_count, season_length))
+    if season_length > 1 and periods >= 2 * season_length:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = np.where(trend_fit > 0, matrix / trend_fit, 1.0)
+        one_hot = np.eye(season_length)[positions]
+        seasonal = ratio @ one_hot / one_hot.sum(axis=0)
+        norm = seasonal.mean(axis=1, keepdims=True)
+        seasonal = np.where(norm > 0, seasonal / np.where(norm > 0, norm, 1), 1.0)
+
+    fitted = trend_fit * seasonal[:, positions]
+    residual_std = np.sqrt(((matrix - fitted) ** 2).mean(axis=1))
+
+    future_x = np.arange(periods, periods + horizon, dtype=float)
+    future_seasonal = seasonal[
+        :, (np.arange(periods, periods + horizon)) % season_length
+    ]
+    forecast = np.maximum(
+        (intercept[:, None] + slope[:, None] * future_x) * future_seasonal, 0
+    )
+    lower = np.maximum(forecast - Z_95 * residual_std[:, None], 0)
+    upper = forecast + Z_95 * residual_std[:, None]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        trend_percent = np.where(y_mean != 0, slope / y_mean * 100, 0.0)
+        confidence = np.where(
+            y_mean > 0, np.clip(100 - residual_std / y_mean * 100, 0, 100), 0.0
+        )
+
+    return {
+        "forecast": forecast,
+        "lower": lower,
+        "upper": upper,
+        "seasonal": future_seasonal,
+        "trend_percent": trend_percent,
+        "confidence": confidence,
+    }
+
+
+class SeriesSet:
+    def __init__(self, keys, values, weights, start):
+        self.keys = keys
+        self.values = values
+        self.weights = weights
+        self.start = start
+
+    def observed(self):
+        if self.weights is None:
+            return self.values
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(self.weights > 0, self.values / self.weights * 100, 0.0)
+
+
+def load_series(cursor, spec, today):
+    start = spec.history_start(today)
+    # The current, still-incomplete month or day is left out of the fit.
+    periods = spec.period_index(today, start)
+    cursor.execute(spec.query, (start,))
+    rows = cursor.fetchall()
+
+    index = {}
+    for row in rows:
+        index.setdefault((row["org_id"], row["entity_id"]), len(index))
+    orgs = sorted({org_id for org_id, _ in index})
+    # Organisation-wide series ("all") are the sum of their entity rows.
+    for org_id in orgs:
+        index[(org_id, ALL_ENTITIES)] = len(index)
+
+    values = np.zeros((len(index), max(periods, 1)))
+    weights = np.zeros_like(values) if spec.ratio else None
+    row_ids, columns, amounts, totals = [], [], [], []
+    for row in rows:
+        period = row["period"]
+        if isinstance(period, str):
+            period = date.fromisoformat(period[:10])
+        column = spec.period_index(period, start)
+        if 0 <= column < periods:
+            row_ids.append(index[(row["org_id"], row["entity_id"])])
+            row_ids.append(index[(row["org_id"], ALL_ENTITIES)])
+            columns.extend([column, column])
+            amounts.extend([float(row["value"] or 0)] * 2)
+            totals.extend([float(row["weight"] or 0)] * 2)
+
+    np.add.at(values, (row_ids, columns), amounts)
+    if weights is not None:
+        np.add.at(weights, (row_ids, columns), totals)
+
+    keys = [None] * len(index)
+    for key, position in index.items():
+        keys[position] = key
+    return SeriesSet(keys, values, weights, start)
+
+
+class ForecastEngine:
+    def __init__(
+        self, db_connection, redis_client=None, cache_prefix="", cache_ttl=21600
+    ):
+        self.db_connection = db_connection
+        self.redis_client = redis_client
+        self.cache_prefix = cache_prefix
+        self.cache_ttl = cache_ttl
+
+    def cache_key(self, kind, org_id, entity_id):
+        return f"{self.cache_prefix}forecast:{kind}:{org_id}:{entity_id}"
+
+    def run(self, kinds=None, today=None):
+        today = today or date.today()
+        totals = {}
+        for kind in kinds or list(FORECAST_SPECS):
+            totals[kind] = self.run_kind(FORECAST_SPECS[kind], today)
+        return totals
+
+    def run_kind(self, spec, today):
+        started = time.perf_counter()
+        with self.db_connection.cursor() as cursor:
+            series = load_series(cursor, spec, today)
+        if not series.keys:
+            logging.info(f"No history to forecast {spec.kind}")
+            return 0
+
+        observed = series.observed()
+        result = fit_forecast(observed, spec.season_length, spec.horizon)
+        if spec.ratio:
+            np.minimum(result["forecast"], 100, out=result["forecast"])
+            np.minimum(result["upper"], 100, out=result["upper"])
+        fitted_at = time.perf_counter()
+
+        model_ids = self.store_models(spec, series, today)
+        self.store_predictions(spec, series, result, model_ids)
+        self.cache_forecasts(spec, series, observed, result)
+
+        elapsed = time.perf_counter() - started
+        logging.info(
+            f"Forecast {spec.kind}: {len(series.keys)} series fitted in "
+            f"{(fitted_at - started) * 1000:.1f} ms, stored in {elapsed:.1f}s"
+        )
+        return len(series.keys)
+
+    def store_models(self, spec, series, today):
+        now = datetime.now()
+        orgs = sorted({org_id for org_id, _ in series.keys})
+        parameters = json.dumps(
+            {
+                "season_length": spec.season_length,
+                "horizon": spec.horizon,
+                "history": spec.history,
+                "monthly": spec.monthly,
+            }
+        )
+        rows = [
+            (
+                org_id,
+                f"{spec.kind}_forecast_{org_id}",
+                f"{spec.kind.title()} forecast",
+                "forecast",
+                spec.history_field,
+                FORECAST_ALGORITHM,
+                FORECAST_MODEL_VERSION,
+                now,
+                today + timedelta(days=1),
+                1,
+                spec.entity_type,
+                parameters,
+                now,
+                now,
+            )
+            for org_id in orgs
+        ]
+        with self.db_connection.cursor() as cursor:
+            cursor.executemany(
+                """
+                INSERT INTO ml_models
+                (org_id, model_code, model_name, model_type, target_variable, algorithm, model_version, last_trained_at, next_training_date, training_frequency_days, training_data_source, model_parameters, created_at, updated_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                algorithm = VALUES(algorithm),
+                model_version = VALUES(model_version),
+                last_trained_at = VALUES(last_trained_at),
+                next_training_date = VALUES(next_training_date),
+                model_parameters = VALUES(model_parameters),
+                updated_at = VALUES(updated_at)
+                """,
+                rows,
+            )
+            placeholders = ", ".join(["%s"] * len(orgs))
+            cursor.execute(
+                f"SELECT id, org_id FROM ml_models WHERE model_code IN ({placeholders})",
+                [f"{spec.kind}_forecast_{org_id}" for org_id in orgs],
+            )
+            model_ids = {row["org_id"]: row["id"] for row in cursor.fetchall()}
+        self.db_connection.commit()
+        return model_ids
+
+    def store_predictions(self, spec, series, result, model_ids):
+        now = datetime.now()
+        last_period = spec.period_at(series.start, series.values.shape[1] - 1)
+        future = [
+            spec.period_at(last_period, step) for step in range(1, spec.horizon + 1)
+        ]
+        horizons = [(period - last_period).days for period in future]
+
+        forecast = np.round(result["forecast"], 2).tolist()
+        lower = np.round(result["lower"], 2).tolist()
+        upper = np.round(result["upper"], 2).tolist()
+        confidence = np.round(result["confidence"], 2).tolist()
+
+        rows = []
+        for position, (org_id, entity_id) in enumerate(series.keys):
+            if entity_id == ALL_ENTITIES:
+                entity_type, entity_id, unit_id = "organization", org_id, None
+            else:
+                entity_type = spec.entity_type
+                unit_id = entity_id if entity_type == "manufacturing_unit" else None
+            for step, period in enumerate(future):
+                rows.append(
+                    (
+                        org_id,
+                        unit_id,
+                        model_ids[org_id],
+                        spec.kind,
+                        entity_type,
+                        entity_id,
+                        datetime.combine(period, datetime.min.time()),
+                        horizons[step],
+                        forecast[position][step],
+                        lower[position][step],
+                        upper[position][step],
+                        confidence[position],
+                        "predicted",
+                        now,
+                        now,
+                    )
+                )
+
+        model_list = sorted(set(model_ids.values()))
+        placeholders = ", ".join(["%s"] * len(model_list))
+        first_future = datetime.combine(future[0], datetime.min.time())
+        history_start = datetime.combine(series.start, datetime.min.time())
+        with self.db_connection.cursor() as cursor:
+            # Forecasts for periods this run covers again are replaced, so
+            # each series keeps one row per period however often it runs.
+            cursor.execute(
+                f"DELETE FROM predictions WHERE model_id IN ({placeholders}) "
+                "AND status IN ('predicted', 'expired') AND prediction_date >= %s",
+                model_list + [first_future],
+            )
+            # The last forecast made for a period that has now passed is kept
+            # for accuracy tracking, but no longer served, and dropped once
+            # the period falls out of the history window.
+            cursor.execute(
+                "UPDATE predictions SET status = 'expired', updated_at = %s "
+                f"WHERE model_id IN ({placeholders}) AND status = 'predicted'",
+                [now] + model_list,
+            )
+            cursor.execute(
+                f"DELETE FROM predictions WHERE model_id IN ({placeholders}) "
+                "AND status = 'expired' AND prediction_date < %s",
+                model_list + [history_start],
+            )
+            cursor.executemany(
+                """
+                INSERT INTO predictions
+                (org_id, unit_id, model_id, prediction_type, entity_type, entity_id, prediction_date, prediction_horizon_days, predicted_value, confidence_lower, confidence_upper, confidence_percentage, status, created_at, updated_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                """,
+                rows,
+            )
+        self.db_connection.commit()
+
+    def cache_forecasts(self, spec, series, observed, result):
+        if not self.redis_client:
+            return
+
+        generated_at = datetime.now().isoformat()
+        periods = series.values.shape[1]
+        history_labels = [
+            spec.period_label(spec.period_at(series.start, offset))
+            for offset in range(periods)
+        ]
+        last_period = spec.period_at(series.start, periods - 1)
+        future_labels = [
+            spec.period_label(spec.period_at(last_period, step))
+            for step in range(1, spec.horizon + 1)
+        ]
+
+        history = np.round(observed, 2).tolist()
+        forecast = np.round(result["forecast"], 2).tolist()
+        lower = np.round(result["lower"], 2).tolist()
+        upper = np.round(result["upper"], 2).tolist()
+        seasonal = np.round(result["seasonal"], 4).tolist()
+        trend = np.round(result["trend_percent"], 4).tolist()
+        confidence = np.round(result["confidence"], 2).tolist()
+
+        pipe = self.redis_client.pipeline(transaction=False)
+        for position, (org_id, entity_id) in enumerate(series.keys):
+            payload = {
+                "generated_at": generated_at,
+                "historical": [
+                    {"period": label, spec.history_field: value}
+                    for label, value in zip(history_labels, history[position])
+                ],
+                spec.forecast_key: [
+                    {
+                        "period": label,
+                        "date": label,
+                        spec.forecast_field: forecast[position][step],
+                        "trend_component": trend[position],
+                        "seasonal_component": seasonal[position][step],
+                        "confidence": confidence[position],
+                    }
+                    for step, label in enumerate(future_labels)
+                ],
+                "confidence_interval": {
+                    "lower": lower[position],
+                    "upper": upper[position],
+                },
+            }
+            pipe.setex(
+                self.cache_key(spec.kind, org_id, entity_id),
+                self.cache_ttl,
+                json.dumps(payload),
+            )
+        pipe.execute()
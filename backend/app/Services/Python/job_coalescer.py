@@ -0,0 +1,238 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+
+import redis
+
+# Job type -> payload fields that make two jobs interchangeable. Two jobs of
+# the same type with equal values for these fields do the same work, so one
+# run can stand in for both.
+IDEMPOTENCY_KEYS = {
+    "kpi_calculation": (),
+    "cache_warmup": (),
+    "kpi_analytics": ("kpi_id", "chunk_rows", "window"),
+    "forecast": ("kinds",),
+    "rollup_refresh": ("full",),
+    "rollup_verify": ("repair",),
+    "stock_rebuild": ("full",),
+    "activity_archive": ("retention_days",),
+}
+
+# Long enough that a normal run's record outlives the burst it absorbs;
+# expiry only ever makes coalescing less eager, never drops a job.
+LAST_RUN_TTL = 86400
+
+
+class Claim:
+    def __init__(self, job_type, job_data, key=None, started_at=None):
+        self.job_type = job_type
+        self.job_data = job_data
+        self.key = key
+        self.started_at = started_at
+        # The lock holds the run's start time so duplicates can tell whether
+        # the run already covers them.
+        self.lock_value = f"{uuid.uuid4().hex}|{started_at}"
+
+
+class JobCoalescer:
+    def __init__(
+        self,
+        redis_client,
+        key_prefix="erp_jobs_queue:coalesce",
+        idempotency_keys=None,
+        ttl=900,
+        requeue=None,
+    ):
+        self.redis_client = redis_client
+        self.key_prefix = key_prefix
+        self.idempotency_keys = (
+            idempotency_keys if idempotency_keys is not None else IDEMPOTENCY_KEYS
+        )
+        self.ttl = ttl
+        self.requeue = requeue
+        # lock value -> Claim for runs in progress, kept alive by the renewer
+        # so a run that outlasts ttl doesn't let a duplicate start beside it.
+        self.active = {}
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.renewer_thread = None
+
+    def start(self):
+        self.stop_event.clear()
+        self.renewer_thread = threading.Thread(target=self._run_renewer, daemon=True)
+        self.renewer_thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.renewer_thread:
+            self.renewer_thread.join()
+            self.renewer_thread = None
+
+    def _run_renewer(self):
+        # Renew well inside the ttl so a slow round trip can't let it lapse.
+        while not self.stop_event.wait(self.ttl / 3):
+            self.renew_all()
+
+    def renew_all(self):
+        with self.lock:
+            claims = list(self.active.values())
+        for claim in claims:
+            try:
+                if not self.renew(claim):
+                    logging.warning(
+                        f"Lost the coalescing lock for {claim.job_type} mid-run"
+                    )
+                    with self.lock:
+                        self.active.pop(claim.lock_value, None)
+            except Exception as e:
+                logging.error(f"Renewing {claim.job_type} coalescing lock failed: {e}")
+
+    def renew(self, claim):
+        lock_key = self._key("lock", claim.key)
+        # Extend only if the lock is still ours; WATCH makes the check and
+        # the expire atomic without server-side scripting. A pending rerun
+        # request is kept for as long as the run it waits on.
+        with self.redis_client.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    pipe.watch(lock_key)
+                    if pipe.get(lock_key) != claim.lock_value:
+                        pipe.unwatch()
+                        return False
+                    pipe.multi()
+                    pipe.expire(lock_key, self.ttl)
+                    pipe.expire(self._key("rerun", claim.key), self.ttl)
+                    pipe.execute()
+                    return True
+                except redis.WatchError:
+                    continue
+
+    def key_for(self, job_type, job_data):
+        fields = self.idempotency_keys.get(job_type)
+        if fields is None:
+            return None
+        values = json.dumps([job_data.get(field) for field in fields], sort_keys=True)
+        digest = hashlib.sha1(values.encode()).hexdigest()[:16]
+        return f"{job_type}:{digest}"
+
+    def _key(self, kind, key):
+        return f"{self.key_prefix}:{kind}:{key}"
+
+    def mark_pending(self, job_type, job_data):
+        # Enqueue side: a job already waiting in the queue will cover this
+        # one, so it is not pushed at all.
+        key = self.key_for(job_type, job_data)
+        if key is None:
+            return True
+        return bool(
+            self.redis_client.set(self._key("pending", key), 1, nx=True, ex=self.ttl)
+        )
+
+    def collapse(self, job_type, jobs):
+        # Copies of the same job fetched in one batch only need one run. The
+        # most recently queued copy is kept since it is the one whose claim
+        # decides whether an in-flight run covers the rest; returns the jobs
+        # to run and the ones they absorb.
+        kept, absorbed, seen = [], [], set()
+        for job in sorted(
+            jobs, key=lambda job: float(job[0].get("queued_at") or 0), reverse=True
+        ):
+            key = self.key_for(job_type, job[0])
+            if key is not None and key in seen:
+                absorbed.append(job)
+                continue
+            if key is not None:
+                seen.add(key)
+            kept.append(job)
+        kept.reverse()
+        return kept, absorbed
+
+    def claim(self, job_type, job_data):
+        """Returns a Claim to run the job under, or None if it was coalesced."""
+        key = self.key_for(job_type, job_data)
+        if key is None:
+            return Claim(job_type, job_data)
+
+        lock_key = self._key("lock", key)
+        rerun_key = self._key("rerun", key)
+        queued_at = float(job_data.get("queued_at") or 0)
+        # Whatever happens to this copy, it has left the queue, so the next
+        # enqueue must not be skipped on its account.
+        self.redis_client.delete(self._key("pending", key))
+
+        while True:
+            # A job queued before the last successful run started had its
+            # changes picked up by that run.
+            last_run = self.redis_client.get(self._key("last_run", key))
+            if queued_at and last_run and queued_at <= float(last_run):
+                return None
+
+            claim = Claim(job_type, job_data, key, time.time())
+            if self.redis_client.set(lock_key, claim.lock_value, nx=True, ex=self.ttl):
+                with self.lock:
+                    self.active[claim.lock_value] = claim
+                return claim
+
+            # Another worker is running it. Unless that run started after
+            # this job was queued, ask it for one more pass afterwards; WATCH
+            # makes sure the lock is still held when the request lands,
+            # otherwise nobody would see it.
+            with self.redis_client.pipeline(transaction=True) as pipe:
+                try:
+                    pipe.watch(lock_key)
+                    lock_value = pipe.get(lock_key)
+                    if lock_value is None:
+                        continue
+                    if queued_at and queued_at <= float(lock_value.split("|")[1]):
+                        return None
+                    pipe.multi()
+                    pipe.set(rerun_key, json.dumps(job_data), ex=self.ttl)
+                    pipe.execute()
+                    return None
+                except redis.WatchError:
+                    continue
+
+    def release(self, claim, succeeded):
+        if claim.key is None:
+            return
+
+        with self.lock:
+            self.active.pop(claim.lock_value, None)
+        lock_key = self._key("lock", claim.key)
+        rerun_key = self._key("rerun", claim.key)
+        with self.redis_client.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    pipe.watch(lock_key)
+                    owns_lock = pipe.get(lock_key) == claim.lock_value
+                    pipe.multi()
+                    if succeeded:
+                        pipe.set(
+                            self._key("last_run", claim.key),
+                            claim.started_at,
+                            ex=LAST_RUN_TTL,
+                        )
+                    # Dropping the lock and taking the rerun request in one
+                    # transaction leaves no gap for a request to slip into.
+                    # If the lock expired and was taken over, the request
+                    # belongs to the new holder.
+                    if owns_lock:
+                        pipe.delete(lock_key)
+                        pipe.get(rerun_key)
+                        pipe.delete(rerun_key)
+                    results = pipe.execute()
+                    rerun = results[-2] if owns_lock else None
+                    break
+                except redis.WatchError:
+                    continue
+
+        if rerun and self.requeue:
+            logging.info(
+                f"Re-queueing {claim.job_type} for changes made during its run"
+            )
+            data = json.loads(rerun)
+            data.pop("queued_at", None)
+            self.requeue(data)
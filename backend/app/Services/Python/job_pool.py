@@ -0,0 +1,170 @@
+import logging
+import threading
+from collections import deque
+
+
+def parse_type_limits(spec):
+    limits = {}
+    for item in (spec or "").split(","):
+        if not item.strip():
+            continue
+        job_type, _, limit = item.partition("=")
+        limits[job_type.strip()] = int(limit)
+    return limits
+
+
+class JobPool:
+    def __init__(
+        self,
+        handler,
+        workers=4,
+        type_limits=None,
+        max_pending=None,
+        initializer=None,
+        finalizer=None,
+    ):
+        self.handler = handler
+        self.workers = workers
+        self.type_limits = type_limits or {}
+        self.max_pending = max_pending or workers * 2
+        self.initializer = initializer
+        self.finalizer = finalizer
+
+        self.pending = deque()
+        self.queued = {}
+        self.running = {}
+        self.condition = threading.Condition()
+        self.threads = []
+        self.stopping = False
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.backpressure_waits = 0
+
+    def start(self):
+        self.stopping = False
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._run_worker, name=f"erp-job-worker-{i}", daemon=True
+            )
+            thread.start()
+            self.threads.append(thread)
+        logging.info(
+            f"Job pool started with {self.workers} workers, limits {self.type_limits}"
+        )
+
+    def submit(self, job_type, *args, timeout=None):
+        with self.condition:
+            if not self._can_admit(job_type):
+                self.backpressure_waits += 1
+            # Blocking here stops the queue consumer from dequeuing more jobs
+            # until a worker frees a slot.
+            if not self.condition.wait_for(
+                lambda: self.stopping or self._can_admit(job_type),
+                timeout=timeout,
+            ):
+                return False
+            if self.stopping:
+                return False
+            self.pending.append((job_type, args))
+            self.queued[job_type] = self.queued.get(job_type, 0) + 1
+            self.submitted += 1
+            self.condition.notify_all()
+            return True
+
+    def _has_capacity(self, job_type):
+        limit = self.type_limits.get(job_type)
+        return limit is None or self.running.get(job_type, 0) < limit
+
+    def _blocked(self, job_type):
+        # Pending jobs of this type that can't start until one of the same
+        # type finishes, however many workers are idle.
+        limit = self.type_limits.get(job_type)
+        if limit is None:
+            return 0
+        free = max(limit - self.running.get(job_type, 0), 0)
+        return max(self.queued.get(job_type, 0) - free, 0)
+
+    def _can_admit(self, job_type):
+        # Jobs held back by their type's limit get max_pending of their own,
+        # so a burst of one type can't fill the pool and stall every other.
+        limit = self.type_limits.get(job_type)
+        if limit is not None and self.queued.get(job_type, 0) >= max(
+            limit - self.running.get(job_type, 0), 0
+        ):
+            return self._blocked(job_type) < self.max_pending
+        runnable = len(self.pending) - sum(map(self._blocked, self.queued))
+        return runnable < self.max_pending
+
+    def _take_runnable(self):
+        for index, (job_type, args) in enumerate(self.pending):
+            if self._has_capacity(job_type):
+                del self.pending[index]
+                self.queued[job_type] -= 1
+                self.running[job_type] = self.running.get(job_type, 0) + 1
+                return job_type, args
+        return None
+
+    def _run_worker(self):
+        if self.initializer:
+            try:
+                self.initializer()
+            except Exception as e:
+                logging.error(f"Job pool worker failed to initialize: {e}")
+                return
+
+        try:
+            while True:
+                with self.condition:
+                    job = None
+                    while job is None:
+                        job = self._take_runnable()
+                        if job is None:
+                            if self.stopping and not self.pending:
+                                return
+                            self.condition.wait()
+                    self.condition.notify_all()
+
+                job_type, args = job
+                try:
+                    succeeded = self.handler(job_type, *args)
+                except Exception as e:
+                    logging.error(f"Job {job_type} raised in pool: {e}")
+                    succeeded = False
+
+                with self.condition:
+                    self.running[job_type] -= 1
+                    if succeeded is False:
+                        self.failed += 1
+                    else:
+                        self.completed += 1
+                    self.condition.notify_all()
+        finally:
+            if self.finalizer:
+                try:
+                    self.finalizer()
+                except Exception as e:
+                    logging.error(f"Job pool worker failed to clean up: {e}")
+
+    def stats(self):
+        with self.condition:
+            return {
+                "workers": self.workers,
+                "pending": len(self.pending),
+                "running": {k: v for k, v in self.running.items() if v},
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "backpressure_waits": self.backpressure_waits,
+            }
+
+    def shutdown(self, wait=True):
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+        if wait:
+            for thread in self.threads:
+                thread.join()
+        self.threads = []
+        logging.info(f"Job pool stopped: {self.stats()}")
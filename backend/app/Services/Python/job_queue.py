@@ -0,0 +1,360 @@
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+
+import redis
+
+DEFAULT_LANE = "default"
+# Lanes in priority order, with each one's share of fetches while all of
+# them are backed up.
+LANE_WEIGHTS = {"high": 6, DEFAULT_LANE: 3, "bulk": 1}
+# Lane for jobs whose payload does not name one in "priority": work a user
+# is waiting on goes ahead, long batch recomputations go behind.
+JOB_PRIORITIES = {
+    "audit_log": "high",
+    "report_generation": "high",
+    "kpi_calculation": "bulk",
+    "kpi_analytics": "bulk",
+    "forecast": "bulk",
+    "cache_warmup": "bulk",
+    "rollup_verify": "bulk",
+    "stock_rebuild": "bulk",
+    "activity_archive": "bulk",
+}
+PROMOTE_BATCH = 100
+
+
+class PriorityLanes:
+    def __init__(
+        self,
+        redis_client,
+        queue_name,
+        weights=None,
+        priorities=None,
+        promote_interval=1.0,
+    ):
+        self.redis_client = redis_client
+        self.queue_name = queue_name
+        self.weights = dict(weights or LANE_WEIGHTS)
+        self.weights.setdefault(DEFAULT_LANE, 1)
+        self.priorities = priorities if priorities is not None else JOB_PRIORITIES
+        self.promote_interval = promote_interval
+        # The default lane keeps the bare queue name, so producers that LPUSH
+        # onto it directly keep working unchanged.
+        self.keys = {
+            lane: queue_name if lane == DEFAULT_LANE else f"{queue_name}:{lane}"
+            for lane in self.weights
+        }
+        self.delayed_key = f"{queue_name}:delayed"
+        self.credits = dict.fromkeys(self.weights, 0)
+        self.next_promotion = 0
+
+    def lane_for(self, data):
+        lane = data.get("priority") or self.priorities.get(data.get("job_type"))
+        return lane if lane in self.keys else DEFAULT_LANE
+
+    def key_for(self, data):
+        return self.keys[self.lane_for(data)]
+
+    def push(self, data, run_at=None):
+        now = time.time()
+        if run_at is not None and run_at > now:
+            # A delayed job counts as queued once it is due, which is what
+            # queue age and job coalescing compare against.
+            self.redis_client.zadd(
+                self.delayed_key, {json.dumps({**data, "queued_at": run_at}): run_at}
+            )
+            return
+        self.redis_client.lpush(
+            self.key_for(data), json.dumps({"queued_at": now, **data})
+        )
+
+    def order(self):
+        # Smooth weighted round-robin picks the lane to try first; the rest
+        # follow in priority order so an empty lane never idles a worker.
+        for lane, weight in self.weights.items():
+            self.credits[lane] += weight
+        chosen = max(self.credits, key=self.credits.get)
+        self.credits[chosen] -= sum(self.weights.values())
+        return [self.keys[chosen]] + [
+            key for lane, key in self.keys.items() if lane != chosen
+        ]
+
+    def promote_due(self):
+        if time.monotonic() < self.next_promotion:
+            return 0
+        self.next_promotion = time.monotonic() + self.promote_interval
+
+        promoted = 0
+        with self.redis_client.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    # WATCH keeps two workers from promoting the same job:
+                    # the loser's transaction is discarded and it re-reads.
+                    pipe.watch(self.delayed_key)
+                    due = pipe.zrangebyscore(
+                        self.delayed_key,
+                        "-inf",
+                        time.time(),
+                        start=0,
+                        num=PROMOTE_BATCH,
+                    )
+                    if not due:
+                        pipe.unwatch()
+                        break
+                    pipe.multi()
+                    pipe.zrem(self.delayed_key, *due)
+                    for raw_job in due:
+                        pipe.lpush(self.key_for(json.loads(raw_job)), raw_job)
+                    pipe.execute()
+                    promoted += len(due)
+                    if len(due) < PROMOTE_BATCH:
+                        break
+                except redis.WatchError:
+                    continue
+        if promoted:
+            logging.info(f"Promoted {promoted} delayed jobs")
+        return promoted
+
+
+class SimpleJobQueue:
+    def __init__(self, redis_client, queue_name, lanes=None):
+        self.redis_client = redis_client
+        self.queue_name = queue_name
+        self.lanes = lanes or PriorityLanes(redis_client, queue_name)
+
+    def start(self):
+        pass
+
+    def push(self, data, run_at=None):
+        self.lanes.push(data, run_at=run_at)
+
+    def fetch_from_lane(self, timeout=30):
+        deadline = time.monotonic() + timeout
+        while True:
+            self.lanes.promote_due()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None, None
+            # BRPOP takes the first non-empty key in the order given, so one
+            # call both honours the lane weights and blocks on every lane.
+            # It wakes up at least every promote_interval for delayed jobs.
+            job = self.redis_client.brpop(
+                self.lanes.order(), timeout=min(remaining, self.lanes.promote_interval)
+            )
+            if job:
+                return job
+
+    def fetch(self, timeout=30):
+        return self.fetch_from_lane(timeout=timeout)[1]
+
+    def fetch_many(self, count, timeout=30):
+        lane_key, first = self.fetch_from_lane(timeout=timeout)
+        if first is None:
+            return []
+        if count <= 1:
+            return [first]
+        # RPOP with a count drains the rest of the batch from the same lane
+        # in one round-trip.
+        return [first] + (self.redis_client.rpop(lane_key, count - 1) or [])
+
+    def ack(self, raw_job):
+        pass
+
+    def ack_many(self, raw_jobs):
+        pass
+
+    def fail(self, raw_job, error=None):
+        pass
+
+    def recover(self):
+        return 0
+
+    def stop(self):
+        pass
+
+
+class ReliableJobQueue:
+    def __init__(
+        self,
+        redis_client,
+        queue_name,
+        worker_id,
+        visibility_timeout=300,
+        max_retries=3,
+        lanes=None,
+    ):
+        self.redis_client = redis_client
+        self.queue_name = queue_name
+        self.lanes = lanes or PriorityLanes(redis_client, queue_name)
+        self.worker_id = worker_id
+        self.visibility_timeout = visibility_timeout
+        self.max_retries = max_retries
+
+        self.workers_key = f"{queue_name}:workers"
+        self.dead_letter_key = f"{queue_name}:dead"
+        self.processing_key = self.processing_key_for(worker_id)
+        self.heartbeat_key = self.heartbeat_key_for(worker_id)
+
+        self.stop_event = threading.Event()
+        self.heartbeat_thread = None
+
+    def processing_key_for(self, worker_id):
+        return f"{self.queue_name}:processing:{worker_id}"
+
+    def heartbeat_key_for(self, worker_id):
+        return f"{self.queue_name}:heartbeat:{worker_id}"
+
+    def start(self):
+        # A restarted worker with the same id picks up what its previous
+        # incarnation left in flight.
+        for raw_job in self.redis_client.lrange(self.processing_key, 0, -1):
+            self.fail(raw_job, error=f"worker {self.worker_id} restarted")
+
+        self.heartbeat()
+        self.redis_client.sadd(self.workers_key, self.worker_id)
+        self.stop_event.clear()
+        self.heartbeat_thread = threading.Thread(
+            target=self._run_heartbeat, daemon=True
+        )
+        self.heartbeat_thread.start()
+
+    def heartbeat(self):
+        self.redis_client.set(
+            self.heartbeat_key, int(time.time()), ex=self.visibility_timeout
+        )
+
+    def _run_heartbeat(self):
+        # Refresh well inside the visibility timeout so long-running jobs are
+        # not reclaimed from a live worker.
+        interval = max(self.visibility_timeout / 3, 1)
+        while not self.stop_event.wait(interval):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                logging.error(f"Queue heartbeat failed: {e}")
+
+    def push(self, data, run_at=None):
+        self.lanes.push(data, run_at=run_at)
+
+    def fetch_from_lane(self, timeout=30):
+        deadline = time.monotonic() + timeout
+        while True:
+            self.lanes.promote_due()
+            order = self.lanes.order()
+            for lane_key in order:
+                raw_job = self.redis_client.lmove(
+                    lane_key, self.processing_key, "RIGHT", "LEFT"
+                )
+                if raw_job is not None:
+                    return lane_key, raw_job
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None, None
+            # BLMOVE watches a single list, so an idle worker blocks on the
+            # highest-priority lane and picks up the others within
+            # promote_interval.
+            lane_key = next(iter(self.lanes.keys.values()))
+            raw_job = self.redis_client.blmove(
+                lane_key,
+                self.processing_key,
+                min(remaining, self.lanes.promote_interval),
+                "RIGHT",
+                "LEFT",
+            )
+            if raw_job is not None:
+                return lane_key, raw_job
+
+    def fetch(self, timeout=30):
+        return self.fetch_from_lane(timeout=timeout)[1]
+
+    def fetch_many(self, count, timeout=30):
+        lane_key, first = self.fetch_from_lane(timeout=timeout)
+        if first is None:
+            return []
+        if count <= 1:
+            return [first]
+
+        pipe = self.redis_client.pipeline(transaction=False)
+        for _ in range(count - 1):
+            pipe.lmove(lane_key, self.processing_key, "RIGHT", "LEFT")
+        return [first] + [raw_job for raw_job in pipe.execute() if raw_job is not None]
+
+    def ack(self, raw_job):
+        self.redis_client.lrem(self.processing_key, 1, raw_job)
+
+    def ack_many(self, raw_jobs):
+        pipe = self.redis_client.pipeline(transaction=False)
+        for raw_job in raw_jobs:
+            pipe.lrem(self.processing_key, 1, raw_job)
+        pipe.execute()
+
+    def fail(self, raw_job, error=None):
+        try:
+            data = json.loads(raw_job)
+            poisoned = not isinstance(data, dict)
+        except (TypeError, ValueError):
+            poisoned = True
+        if poisoned:
+            data = {"raw_job": raw_job}
+
+        retries = int(data.get("retry_count", 0)) + 1
+        data["retry_count"] = retries
+
+        pipe = self.redis_client.pipeline(transaction=True)
+        pipe.lrem(self.processing_key, 1, raw_job)
+        if poisoned or retries > self.max_retries:
+            data["error"] = str(error) if error else None
+            data["failed_at"] = datetime.now().isoformat()
+            data["worker_id"] = self.worker_id
+            pipe.lpush(self.dead_letter_key, json.dumps(data))
+            logging.warning(
+                f"Job {data.get('job_type', 'unknown')} moved to dead-letter list after {retries} attempts"
+            )
+        else:
+            pipe.lpush(self.lanes.key_for(data), json.dumps(data))
+        pipe.execute()
+
+    def recover(self):
+        reclaimed = 0
+        for worker_id in self.redis_client.smembers(self.workers_key):
+            if worker_id == self.worker_id:
+                continue
+            if self.redis_client.exists(self.heartbeat_key_for(worker_id)):
+                continue
+
+            processing_key = self.processing_key_for(worker_id)
+            while True:
+                # Claim into our own processing list first so a crash while
+                # reaping leaves the job recoverable by the next reaper.
+                raw_job = self.redis_client.lmove(
+                    processing_key, self.processing_key, "RIGHT", "LEFT"
+                )
+                if raw_job is None:
+                    break
+                self.fail(raw_job, error=f"worker {worker_id} stopped responding")
+                reclaimed += 1
+
+            self.redis_client.srem(self.workers_key, worker_id)
+
+        if reclaimed:
+            logging.warning(f"Reclaimed {reclaimed} jobs from dead workers")
+        return reclaimed
+
+    def dead_letters(self, count=100):
+        raw_jobs = self.redis_client.lrange(self.dead_letter_key, 0, count - 1)
+        return [json.loads(raw_job) for raw_job in raw_jobs]
+
+    def stop(self):
+        self.stop_event.set()
+        if self.heartbeat_thread:
+            self.heartbeat_thread.join(timeout=5)
+            self.heartbeat_thread = None
+        if not self.redis_client.llen(self.processing_key):
+            pipe = self.redis_client.pipeline(transaction=True)
+            pipe.srem(self.workers_key, self.worker_id)
+            pipe.delete(self.heartbeat_key)
+            pipe.execute()
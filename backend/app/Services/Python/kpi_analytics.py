@@ -0,0 +1,244 @@
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+
+from kpi_engine import KPI_DEFINITIONS, PERCENT_LIMIT, STABLE_BAND_PERCENT
+
+TREND_WINDOW = 7
+CHUNK_ROWS = 200000
+SERIES_COLUMNS = ["kpi_id", "org_id", "unit_key"]
+ANALYTICS_COLUMNS = [
+    "id",
+    "variance",
+    "variance_percentage",
+    "achievement_percentage",
+    "rolling_trend",
+]
+
+# Results are staged in a temporary table and applied with one UPDATE ... JOIN
+# by primary key, so a row deleted since it was read is skipped instead of
+# being re-inserted.
+KPI_ANALYTICS_STAGE_QUERY = """
+CREATE TEMPORARY TABLE IF NOT EXISTS kpi_analytics_stage (
+id BIGINT UNSIGNED NOT NULL PRIMARY KEY,
+variance DECIMAL(15, 2) NULL,
+variance_percentage DECIMAL(5, 2) NULL,
+achievement_percentage DECIMAL(5, 2) NULL,
+rolling_trend VARCHAR(16) NULL
+)
+"""
+
+KPI_ANALYTICS_STAGE_INSERT_QUERY = """
+INSERT INTO kpi_analytics_stage
+(id, variance, variance_percentage, achievement_percentage, rolling_trend)
+VALUES (%s, %s, %s, %s, %s)
+"""
+
+KPI_HISTORY_UPDATE_QUERY = """
+UPDATE kpi_values kv
+JOIN kpi_analytics_stage s ON s.id = kv.id
+SET kv.variance = s.variance,
+kv.variance_percentage = s.variance_percentage,
+kv.achievement_percentage = s.achievement_percentage,
+kv.rolling_trend = s.rolling_trend
+"""
+
+
+def compute_kpi_analytics(
+    frame, window=TREND_WINDOW, stable_band=STABLE_BAND_PERCENT, higher_is_better=True
+):
+    # frame: id, kpi_id, org_id, unit_id, record_date, actual_value, target_value
+    frame = frame.copy()
+    frame["unit_key"] = frame["unit_id"].fillna(-1)
+    frame = frame.sort_values(SERIES_COLUMNS + ["record_date"], kind="mergesort")
+
+    actual = frame["actual_value"].to_numpy(dtype=float)
+    target = frame["target_value"].to_numpy(dtype=float)
+    # Same rules as derive_kpi_fields, so this job and kpi_calculation write
+    # identical values: nothing without a non-zero target, and the
+    # percentage is taken from the rounded variance.
+    has_target = np.isfinite(target) & (target != 0)
+    safe_target = np.where(has_target, target, 1.0)
+
+    variance = np.where(has_target, np.round(actual - target, 2), np.nan)
+    frame["variance"] = variance
+    frame["variance_percentage"] = np.where(
+        has_target,
+        np.clip(
+            np.round(variance / safe_target * 100, 2), -PERCENT_LIMIT, PERCENT_LIMIT
+        ),
+        np.nan,
+    )
+    frame["achievement_percentage"] = np.where(
+        has_target,
+        np.clip(np.round(actual / safe_target * 100, 2), -PERCENT_LIMIT, PERCENT_LIMIT),
+        np.nan,
+    )
+
+    # Least-squares slope over the trailing window of each series, built from
+    # windowed differences of per-series cumulative sums.
+    keys = [frame[column] for column in SERIES_COLUMNS]
+    position = frame.groupby(keys, sort=False).cumcount().to_numpy(dtype=float)
+    y = np.nan_to_num(actual)
+    sums = pd.DataFrame(
+        {"x": position, "y": y, "xy": position * y, "xx": position * position},
+        index=frame.index,
+    )
+    cumulative = sums.groupby(keys, sort=False).cumsum()
+    windowed = cumulative - cumulative.groupby(keys, sort=False).shift(
+        window, fill_value=0
+    )
+
+    n = np.minimum(position + 1, window)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope, relative_slope = trailing_slope(windowed, n)
+    if not higher_is_better:
+        relative_slope = -relative_slope
+
+    # The windowed slope has its own column; trend stays the day-over-day
+    # change kpi_calculation records.
+    frame["rolling_trend"] = np.select(
+        [
+            np.isnan(slope),
+            relative_slope > stable_band,
+            relative_slope < -stable_band,
+        ],
+        [None, "improving", "declining"],
+        default="stable",
+    )
+    return frame.drop(columns=["unit_key"])
+
+
+def trailing_slope(windowed, n):
+    denominator = n * windowed["xx"].to_numpy() - windowed["x"].to_numpy() ** 2
+    slope = np.divide(
+        n * windowed["xy"].to_numpy()
+        - windowed["x"].to_numpy() * windowed["y"].to_numpy(),
+        denominator,
+        out=np.full(len(n), np.nan),
+        where=denominator != 0,
+    )
+    mean = windowed["y"].to_numpy() / n
+    relative_slope = np.divide(
+        slope * 100,
+        np.abs(mean),
+        out=np.where(slope == 0, 0.0, np.sign(slope) * np.inf),
+        where=mean != 0,
+    )
+    return slope, relative_slope
+
+
+def analytics_rows(frame):
+    columns = []
+    for name in ANALYTICS_COLUMNS:
+        series = frame[name].astype(object)
+        columns.append(series.where(series.notna(), None).tolist())
+    return list(zip(*columns))
+
+
+class KpiHistoryAnalyzer:
+    def __init__(
+        self,
+        db_connection,
+        chunk_rows=CHUNK_ROWS,
+        window=TREND_WINDOW,
+        stable_band=STABLE_BAND_PERCENT,
+    ):
+        self.db_connection = db_connection
+        self.chunk_rows = chunk_rows
+        self.window = window
+        self.stable_band = stable_band
+
+    def plan_chunks(self, kpi_id=None):
+        # Whole series always land in the same chunk; a chunk closes once it
+        # holds chunk_rows rows.
+        query = "SELECT kpi_id, org_id, COUNT(*) AS row_count FROM kpi_values"
+        params = []
+        if kpi_id is not None:
+            query += " WHERE kpi_id = %s"
+            params.append(kpi_id)
+        query += " GROUP BY kpi_id, org_id ORDER BY kpi_id, org_id"
+
+        with self.db_connection.cursor() as cursor:
+            cursor.execute(query, params)
+            series = cursor.fetchall()
+
+        chunk, chunk_rows = [], 0
+        for row in series:
+            if chunk and (
+                chunk_rows + row["row_count"] > self.chunk_rows
+                or chunk[0][0] != row["kpi_id"]
+            ):
+                yield chunk
+                chunk, chunk_rows = [], 0
+            chunk.append((row["kpi_id"], row["org_id"]))
+            chunk_rows += row["row_count"]
+        if chunk:
+            yield chunk
+
+    def load_chunk(self, chunk):
+        kpi_id = chunk[0][0]
+        org_ids = [org_id for _, org_id in chunk]
+        placeholders = ", ".join(["%s"] * len(org_ids))
+        with self.db_connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT id, kpi_id, org_id, unit_id, record_date, actual_value, target_value "
+                f"FROM kpi_values WHERE kpi_id = %s AND org_id IN ({placeholders})",
+                [kpi_id] + org_ids,
+            )
+            rows = cursor.fetchall()
+
+        frame = pd.DataFrame(
+            rows,
+            columns=[
+                "id",
+                "kpi_id",
+                "org_id",
+                "unit_id",
+                "record_date",
+                "actual_value",
+                "target_value",
+            ],
+        )
+        frame["unit_id"] = frame["unit_id"].astype("Int64")
+        frame["actual_value"] = pd.to_numeric(frame["actual_value"], errors="coerce")
+        frame["target_value"] = pd.to_numeric(frame["target_value"], errors="coerce")
+        return frame
+
+    def write_chunk(self, frame):
+        rows = analytics_rows(frame)
+        try:
+            with self.db_connection.cursor() as cursor:
+                cursor.execute(KPI_ANALYTICS_STAGE_QUERY)
+                cursor.execute("DELETE FROM kpi_analytics_stage")
+                cursor.executemany(KPI_ANALYTICS_STAGE_INSERT_QUERY, rows)
+                cursor.execute(KPI_HISTORY_UPDATE_QUERY)
+            self.db_connection.commit()
+        except Exception:
+            self.db_connection.rollback()
+            raise
+        return len(rows)
+
+    def run(self, kpi_id=None):
+        started = time.perf_counter()
+        total = 0
+        for chunk in self.plan_chunks(kpi_id):
+            frame = self.load_chunk(chunk)
+            if frame.empty:
+                continue
+            definition = KPI_DEFINITIONS.get(chunk[0][0])
+            higher_is_better = definition.higher_is_better if definition else True
+            total += self.write_chunk(
+                compute_kpi_analytics(
+                    frame, self.window, self.stable_band, higher_is_better
+                )
+            )
+
+        elapsed = time.perf_counter() - started
+        rate = total / elapsed if elapsed > 0 else 0.0
+        logging.info(
+            f"KPI history analysed: {total} rows in {elapsed:.1f}s ({rate:.0f} rows/sec)"
+        )
+        return total
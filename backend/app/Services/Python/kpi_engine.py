@@ -0,0 +1,348 @@
+import logging
+import time
+from datetime import date, datetime
+
+KPI_WATERMARKS_KEY = "erp:kpi:watermarks"
+KPI_RECORD_DATES_KEY = "erp:kpi:record_dates"
+INITIAL_WATERMARK = "1970-01-01 00:00:00"
+ORG_CHUNK_SIZE = 1000
+PERCENT_LIMIT = 999.99
+STABLE_BAND_PERCENT = 1.0
+
+KPI_UPSERT_QUERY = """
+INSERT INTO kpi_values
+(kpi_id, org_id, unit_id, record_date, actual_value, target_value, variance, variance_percentage, achievement_percentage, status, trend, calculated_at)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+ON DUPLICATE KEY UPDATE
+actual_value = VALUES(actual_value),
+target_value = VALUES(target_value),
+variance = VALUES(variance),
+variance_percentage = VALUES(variance_percentage),
+achievement_percentage = VALUES(achievement_percentage),
+status = VALUES(status),
+trend = VALUES(trend),
+calculated_at = VALUES(calculated_at)
+"""
+
+
+class KpiDefinition:
+    def __init__(
+        self,
+        kpi_id,
+        name,
+        source_table,
+        aggregate_sql=None,
+        aggregator=None,
+        org_column="organization_id",
+        watermark_column="updated_at",
+        higher_is_better=True,
+    ):
+        if not aggregate_sql and not aggregator:
+            raise ValueError(f"KPI {kpi_id} needs aggregate_sql or an aggregator")
+        self.kpi_id = kpi_id
+        self.name = name
+        self.source_table = source_table
+        self.aggregate_sql = aggregate_sql
+        self.aggregator = aggregator
+        self.org_column = org_column
+        self.watermark_column = watermark_column
+        self.higher_is_better = higher_is_better
+
+    def aggregate(self, cursor, org_ids):
+        # Yields (org_id, unit_id, value) for the given organizations only.
+        if self.aggregator:
+            yield from self.aggregator(cursor, org_ids)
+            return
+
+        placeholders = ", ".join(["%s"] * len(org_ids))
+        cursor.execute(self.aggregate_sql.format(org_ids=placeholders), list(org_ids))
+        for row in cursor.fetchall():
+            yield row["org_id"], row.get("unit_id"), row["value"]
+
+
+KPI_DEFINITIONS = {}
+
+
+def register_kpi(definition):
+    KPI_DEFINITIONS[definition.kpi_id] = definition
+    return definition
+
+
+register_kpi(
+    KpiDefinition(
+        1,
+        "Active users",
+        "users",
+        aggregate_sql=(
+            "SELECT organization_id AS org_id, NULL AS unit_id, COUNT(*) AS value "
+            "FROM users WHERE status = 'active' AND deleted_at IS NULL "
+            "AND organization_id IN ({org_ids}) GROUP BY organization_id"
+        ),
+    )
+)
+
+register_kpi(
+    KpiDefinition(
+        2,
+        "Active manufacturing units",
+        "manufacturing_units",
+        aggregate_sql=(
+            "SELECT organization_id AS org_id, NULL AS unit_id, COUNT(*) AS value "
+            "FROM manufacturing_units WHERE status = 'active' AND deleted_at IS NULL "
+            "AND organization_id IN ({org_ids}) GROUP BY organization_id"
+        ),
+    )
+)
+
+
+def clamp_percent(value):
+    return max(-PERCENT_LIMIT, min(PERCENT_LIMIT, round(value, 2)))
+
+
+def derive_kpi_fields(actual, target, tolerance, previous, higher_is_better=True):
+    variance = variance_percentage = achievement_percentage = None
+    status = "on_target"
+
+    if target:
+        variance = round(actual - target, 2)
+        variance_percentage = clamp_percent(variance / target * 100)
+        achievement_percentage = clamp_percent(actual / target * 100)
+        band = abs(target) * (tolerance or 0) / 100
+        if variance > band:
+            status = "above_target"
+        elif variance < -band:
+            status = "below_target"
+
+    trend = None
+    if previous is not None:
+        delta = actual - previous
+        if abs(delta) <= abs(previous) * STABLE_BAND_PERCENT / 100:
+            trend = "stable"
+        elif (delta > 0) == higher_is_better:
+            trend = "improving"
+        else:
+            trend = "declining"
+
+    return variance, variance_percentage, achievement_percentage, status, trend
+
+
+def parse_watermark(value):
+    # Stored as "<updated_at>|<id>". A bare timestamp, as written before ids
+    # were tracked, resumes from that second's first row.
+    latest, _, last_id = (value or INITIAL_WATERMARK).partition("|")
+    return latest, int(last_id or 0)
+
+
+def changed_since(
+    cursor, source_table, org_column, watermark_column, watermark, bucket_sql=None
+):
+    # Keyset scan on (watermark_column, id) with a strict comparison: rows
+    # sharing the watermark second are still found by id, and the last row
+    # seen is not picked up again on every run. With bucket_sql the changes
+    # come back as (org, bucket) pairs instead of organizations.
+    latest, last_id = parse_watermark(watermark)
+    after = f"{watermark_column} > %s OR ({watermark_column} = %s AND id > %s)"
+    params = (latest, latest, last_id)
+    bucket = f", {bucket_sql} AS bucket" if bucket_sql else ""
+    cursor.execute(
+        f"SELECT DISTINCT {org_column} AS org_id{bucket} FROM {source_table} WHERE {after}",
+        params,
+    )
+    rows = cursor.fetchall()
+    if not rows:
+        return set(), watermark
+    cursor.execute(
+        f"SELECT {watermark_column} AS latest, id FROM {source_table} WHERE {after} "
+        f"ORDER BY {watermark_column} DESC, id DESC LIMIT 1",
+        params,
+    )
+    last = cursor.fetchone()
+    if bucket_sql:
+        changed = {
+            (row["org_id"], str(row["bucket"]))
+            for row in rows
+            if row["org_id"] is not None and row["bucket"] is not None
+        }
+    else:
+        changed = {row["org_id"] for row in rows if row["org_id"] is not None}
+    return changed, f"{last['latest']}|{last['id']}"
+
+
+def to_float(value):
+    return float(value) if value is not None else None
+
+
+class KpiEngine:
+    def __init__(self, db_connection, redis_client=None, definitions=None):
+        self.db_connection = db_connection
+        self.redis_client = redis_client
+        self.definitions = definitions if definitions is not None else KPI_DEFINITIONS
+
+    def get_watermark(self, definition):
+        if self.redis_client:
+            value = self.redis_client.hget(KPI_WATERMARKS_KEY, definition.kpi_id)
+            if value:
+                return value
+        return INITIAL_WATERMARK
+
+    def needs_rollover(self, definition, record_date):
+        if not self.redis_client:
+            return True
+        last_date = self.redis_client.hget(KPI_RECORD_DATES_KEY, definition.kpi_id)
+        return last_date != record_date.isoformat()
+
+    def load_targets(self, cursor):
+        ids = list(self.definitions)
+        if not ids:
+            return {}
+        placeholders = ", ".join(["%s"] * len(ids))
+        cursor.execute(
+            f"SELECT id, target_value, tolerance_percentage FROM kpis WHERE id IN ({placeholders})",
+            ids,
+        )
+        return {
+            row["id"]: (
+                to_float(row["target_value"]),
+                to_float(row["tolerance_percentage"]),
+            )
+            for row in cursor.fetchall()
+        }
+
+    def changed_orgs(self, cursor, definition, watermark):
+        return changed_since(
+            cursor,
+            definition.source_table,
+            definition.org_column,
+            definition.watermark_column,
+            watermark,
+        )
+
+    def previous_values(self, cursor, definition, record_date):
+        cursor.execute(
+            "SELECT org_id, unit_id, actual_value FROM kpi_values "
+            "WHERE kpi_id = %s AND record_date = "
+            "(SELECT MAX(record_date) FROM kpi_values WHERE kpi_id = %s AND record_date < %s)",
+            (definition.kpi_id, definition.kpi_id, record_date),
+        )
+        return {
+            (row["org_id"], row["unit_id"]): to_float(row["actual_value"])
+            for row in cursor.fetchall()
+        }
+
+    def compute_values(self, cursor, definition, org_ids):
+        values = {}
+        ordered = sorted(org_ids)
+        for start in range(0, len(ordered), ORG_CHUNK_SIZE):
+            chunk = ordered[start : start + ORG_CHUNK_SIZE]
+            for org_id, unit_id, value in definition.aggregate(cursor, chunk):
+                values[(org_id, unit_id)] = to_float(value) or 0.0
+
+        # An organization whose last qualifying row went away still gets a
+        # zero for the day instead of keeping yesterday's figure.
+        seen = {org_id for org_id, _ in values}
+        for org_id in org_ids - seen:
+            values[(org_id, None)] = 0.0
+        return values
+
+    def build_rows(self, definition, record_date, values, previous, target):
+        target_value, tolerance = target or (None, None)
+        calculated_at = datetime.now()
+        rows = []
+        for (org_id, unit_id), actual in values.items():
+            derived = derive_kpi_fields(
+                actual,
+                target_value,
+                tolerance,
+                previous.get((org_id, unit_id)),
+                definition.higher_is_better,
+            )
+            rows.append(
+                (definition.kpi_id, org_id, unit_id, record_date, actual, target_value)
+                + derived
+                + (calculated_at,)
+            )
+        return rows
+
+    def delete_org_level_rows(self, cursor, kpi_id, record_date, org_ids):
+        # The unique key treats NULL unit_ids as distinct, so ON DUPLICATE KEY
+        # never fires for organization-level rows; replace them instead.
+        ordered = sorted(org_ids)
+        for start in range(0, len(ordered), ORG_CHUNK_SIZE):
+            chunk = ordered[start : start + ORG_CHUNK_SIZE]
+            placeholders = ", ".join(["%s"] * len(chunk))
+            cursor.execute(
+                "DELETE FROM kpi_values WHERE kpi_id = %s AND record_date = %s "
+                f"AND unit_id IS NULL AND org_id IN ({placeholders})",
+                [kpi_id, record_date] + chunk,
+            )
+
+    def run(self, record_date=None):
+        record_date = record_date or date.today()
+        started = time.perf_counter()
+        rows = []
+        watermarks = {}
+        rolled_over = []
+        changed_total = 0
+
+        try:
+            with self.db_connection.cursor() as cursor:
+                targets = self.load_targets(cursor)
+
+                for kpi_id, definition in self.definitions.items():
+                    watermark = self.get_watermark(definition)
+                    org_ids, watermarks[kpi_id] = self.changed_orgs(
+                        cursor, definition, watermark
+                    )
+                    rollover = self.needs_rollover(definition, record_date)
+                    if not org_ids and not rollover:
+                        continue
+
+                    previous = self.previous_values(cursor, definition, record_date)
+                    values = self.compute_values(cursor, definition, org_ids)
+                    if rollover:
+                        # Carry unchanged series into the new day; this costs
+                        # one row per series, not a rescan of the source table.
+                        for key, value in previous.items():
+                            values.setdefault(key, value)
+                        rolled_over.append(kpi_id)
+
+                    org_level = {
+                        org_id for org_id, unit_id in values if unit_id is None
+                    }
+                    if org_level:
+                        self.delete_org_level_rows(
+                            cursor, kpi_id, record_date, org_level
+                        )
+
+                    rows.extend(
+                        self.build_rows(
+                            definition,
+                            record_date,
+                            values,
+                            previous,
+                            targets.get(kpi_id),
+                        )
+                    )
+                    changed_total += len(org_ids)
+
+                if rows:
+                    cursor.executemany(KPI_UPSERT_QUERY, rows)
+            self.db_connection.commit()
+        except Exception:
+            self.db_connection.rollback()
+            raise
+
+        # Watermarks only advance once the values they cover are committed.
+        if self.redis_client:
+            pipe = self.redis_client.pipeline()
+            if watermarks:
+                pipe.hset(KPI_WATERMARKS_KEY, mapping=watermarks)
+            for kpi_id in rolled_over:
+                pipe.hset(KPI_RECORD_DATES_KEY, kpi_id, record_date.isoformat())
+            pipe.execute()
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        logging.info(
+            f"KPIs calculated: {len(rows)} values upserted for {changed_total} changed organizations in {elapsed_ms:.1f} ms"
+        )
+        return len(rows)
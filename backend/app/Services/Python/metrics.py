@@ -0,0 +1,255 @@
+import json
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+import pymysql
+import redis
+from prometheus_client import CollectorRegistry, Counter, Histogram, start_http_server
+from prometheus_client.core import GaugeMetricFamily
+
+try:
+    from opentelemetry import trace
+except ImportError:
+    trace = None
+
+JOB_LATENCY_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+UNKNOWN_JOB_TYPE = "unknown"
+
+# Per-thread accumulator for the job currently running on that thread; the
+# timed cursor and Redis connection add to it and nothing else reads it.
+_active = threading.local()
+
+
+def record_io(backend, seconds):
+    io = getattr(_active, "io", None)
+    if io is not None:
+        io[backend] += seconds
+
+
+class TimedDictCursor(pymysql.cursors.DictCursor):
+    # executemany() is built on execute(), so this covers both.
+    def execute(self, query, args=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, args)
+        finally:
+            record_io("db", time.perf_counter() - started)
+
+
+class TimedRedisConnection(redis.Connection):
+    def send_packed_command(self, command, check_health=True):
+        started = time.perf_counter()
+        try:
+            return super().send_packed_command(command, check_health)
+        finally:
+            record_io("redis", time.perf_counter() - started)
+
+    def read_response(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().read_response(*args, **kwargs)
+        finally:
+            record_io("redis", time.perf_counter() - started)
+
+
+class QueueCollector:
+    # Reads queue depth at scrape time so the job loop pays nothing for it.
+    def __init__(self, redis_client, queue_names):
+        self.redis_client = redis_client
+        self.queue_names = queue_names
+
+    def describe(self):
+        # Without this the registry would call collect() at registration.
+        return []
+
+    def collect(self):
+        length = GaugeMetricFamily(
+            "erp_queue_length", "Jobs waiting in the queue", labels=["queue"]
+        )
+        oldest = GaugeMetricFamily(
+            "erp_queue_oldest_job_age_seconds",
+            "Age of the next job to be consumed",
+            labels=["queue"],
+        )
+        now = time.time()
+        pipe = self.redis_client.pipeline(transaction=False)
+        for queue in self.queue_names:
+            pipe.llen(queue)
+            pipe.lindex(queue, -1)
+        results = pipe.execute()
+        for index, queue in enumerate(self.queue_names):
+            length.add_metric([queue], results[index * 2])
+            age = job_age(results[index * 2 + 1], now)
+            oldest.add_metric([queue], age if age is not None else 0)
+        yield length
+        yield oldest
+
+
+def job_age(raw_job, now):
+    if raw_job is None:
+        return None
+    try:
+        queued_at = json.loads(raw_job).get("queued_at")
+    except (ValueError, AttributeError):
+        return None
+    return max(0.0, now - queued_at) if queued_at else None
+
+
+class WorkerMetrics:
+    def __init__(self, registry=None, tracing=False, job_types=None):
+        self.registry = registry or CollectorRegistry()
+        # job_type comes from the payload, so anything the worker has no
+        # handler for shares one label instead of starting a new series.
+        self.job_types = frozenset(job_types) if job_types is not None else None
+        self.job_duration = Histogram(
+            "erp_job_duration_seconds",
+            "Job processing time",
+            ["job_type"],
+            buckets=JOB_LATENCY_BUCKETS,
+            registry=self.registry,
+        )
+        self.jobs = Counter(
+            "erp_jobs", "Jobs processed", ["job_type", "status"], registry=self.registry
+        )
+        self.io_seconds = Counter(
+            "erp_job_io_seconds",
+            "Time jobs spent waiting on the database or Redis",
+            ["job_type", "backend"],
+            registry=self.registry,
+        )
+        self.coalesced_jobs = Counter(
+            "erp_jobs_coalesced",
+            "Duplicate jobs absorbed by another run of the same job",
+            ["job_type"],
+            registry=self.registry,
+        )
+        self.tracer = trace.get_tracer("erp-worker") if tracing and trace else None
+        self.children = {}
+
+    def label(self, job_type):
+        if self.job_types is None or job_type in self.job_types:
+            return job_type
+        return UNKNOWN_JOB_TYPE
+
+    def job_metrics(self, job_type):
+        # labels() takes a lock and builds a key on every call; resolve each
+        # job type's children once.
+        job_type = self.label(job_type)
+        children = self.children.get(job_type)
+        if children is None:
+            children = self.children[job_type] = (
+                self.job_duration.labels(job_type),
+                self.jobs.labels(job_type, "success"),
+                self.jobs.labels(job_type, "failure"),
+                self.io_seconds.labels(job_type, "db"),
+                self.io_seconds.labels(job_type, "redis"),
+            )
+        return children
+
+    def watch_queues(self, redis_client, queue_names):
+        self.registry.register(QueueCollector(redis_client, queue_names))
+
+    def serve(self, port):
+        start_http_server(port, registry=self.registry)
+
+    def coalesced(self, job_type, count=1):
+        self.coalesced_jobs.labels(self.label(job_type)).inc(count)
+
+    @contextmanager
+    def job(self, job_type, count=1):
+        job_type = self.label(job_type)
+        span = (
+            self.tracer.start_as_current_span(
+                f"job {job_type}", attributes={"job_type": job_type, "jobs": count}
+            )
+            if self.tracer
+            else nullcontext()
+        )
+        io = {"db": 0.0, "redis": 0.0}
+        outer = getattr(_active, "io", None)
+        _active.io = io
+        started = time.perf_counter()
+        duration, succeeded, failed, db_seconds, redis_seconds = self.job_metrics(
+            job_type
+        )
+        outcome = failed
+        try:
+            with span:
+                yield
+            outcome = succeeded
+        finally:
+            _active.io = outer
+            duration.observe(time.perf_counter() - started)
+            outcome.inc(count)
+            if io["db"]:
+                db_seconds.inc(io["db"])
+            if io["redis"]:
+                redis_seconds.inc(io["redis"])
+
+    # Buffered jobs (audit logs, notifications) are only done once their
+    # batch is written on whichever thread flushes it, so they are measured
+    # in pieces: I/O wherever it happens, latency per flush, and outcomes
+    # once the batch is settled.
+    @contextmanager
+    def io(self, job_type):
+        _, _, _, db_seconds, redis_seconds = self.job_metrics(job_type)
+        io = {"db": 0.0, "redis": 0.0}
+        outer = getattr(_active, "io", None)
+        _active.io = io
+        try:
+            yield
+        finally:
+            _active.io = outer
+            if io["db"]:
+                db_seconds.inc(io["db"])
+            if io["redis"]:
+                redis_seconds.inc(io["redis"])
+
+    @contextmanager
+    def flush(self, job_type, count):
+        job_type = self.label(job_type)
+        span = (
+            self.tracer.start_as_current_span(
+                f"flush {job_type}", attributes={"job_type": job_type, "jobs": count}
+            )
+            if self.tracer
+            else nullcontext()
+        )
+        duration = self.job_metrics(job_type)[0]
+        started = time.perf_counter()
+        try:
+            with span, self.io(job_type):
+                yield
+        finally:
+            duration.observe(time.perf_counter() - started)
+
+    def settled(self, job_type, succeeded=0, failed=0):
+        _, succeeded_jobs, failed_jobs, _, _ = self.job_metrics(job_type)
+        if succeeded:
+            succeeded_jobs.inc(succeeded)
+        if failed:
+            failed_jobs.inc(failed)
+
+
+class NullMetrics:
+    def watch_queues(self, redis_client, queue_names):
+        pass
+
+    def serve(self, port):
+        pass
+
+    def coalesced(self, job_type, count=1):
+        pass
+
+    def job(self, job_type, count=1):
+        return nullcontext()
+
+    def io(self, job_type):
+        return nullcontext()
+
+    def flush(self, job_type, count):
+        return nullcontext()
+
+    def settled(self, job_type, succeeded=0, failed=0):
+        pass
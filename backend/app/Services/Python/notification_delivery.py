@@ -0,0 +1,470 @@
+import logging
+import queue
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from email.message import EmailMessage
+from email.utils import formataddr, make_msgid
+
+from metrics import NullMetrics
+
+# Notification ids per IN (...) list.
+ID_CHUNK_SIZE = 1000
+
+NOTIFICATION_RECIPIENT_QUERY = """
+SELECT n.id AS notification_id, u.email AS email, u.name AS name
+FROM notifications n
+JOIN users u ON u.id = n.user_id
+WHERE n.id IN ({placeholders})
+"""
+
+NOTIFICATION_SENT_QUERY = """
+UPDATE notifications
+SET delivery_status = 'sent', delivered_at = %s, delivery_error = NULL, retry_count = retry_count + %s
+WHERE id IN ({placeholders})
+"""
+
+NOTIFICATION_FAILED_QUERY = """
+UPDATE notifications
+SET delivery_status = 'failed', delivery_error = %s, retry_count = retry_count + %s
+WHERE id IN ({placeholders})
+"""
+
+# Connection drops, timeouts and 4xx replies are worth another attempt on a
+# fresh session; 5xx replies such as an unknown mailbox are not.
+TRANSIENT_SMTP_ERRORS = (
+    smtplib.SMTPServerDisconnected,
+    smtplib.SMTPConnectError,
+    TimeoutError,
+    ConnectionError,
+)
+
+
+def is_transient(error):
+    if isinstance(error, TRANSIENT_SMTP_ERRORS):
+        return True
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    code = getattr(error, "smtp_code", None)
+    return code is not None and 400 <= code < 500
+
+
+class Alert:
+    def __init__(self, data, email=None, name=None, receipt=None):
+        self.notification_id = data.get("notification_id")
+        self.org_id = data.get("org_id")
+        self.email = (data.get("to") or email or "").strip()
+        self.name = data.get("recipient_name") or name
+        self.subject = data.get("subject") or "Notification"
+        self.message = data.get("message") or ""
+        self.urgent = data.get("priority") == "urgent"
+        self.receipt = receipt
+
+
+class Digest:
+    def __init__(self, email, name, alerts):
+        self.email = email
+        self.name = name
+        self.alerts = alerts
+
+    def build_message(self, sender):
+        message = EmailMessage()
+        message["From"] = sender
+        message["To"] = formataddr((self.name, self.email)) if self.name else self.email
+        message["Message-ID"] = make_msgid(domain=sender.rsplit("@", 1)[-1].strip(">"))
+        if len(self.alerts) == 1:
+            message["Subject"] = self.alerts[0].subject
+            message.set_content(self.alerts[0].message)
+            return message
+
+        message["Subject"] = f"{len(self.alerts)} new notifications"
+        sections = [f"{alert.subject}\n\n{alert.message}" for alert in self.alerts]
+        message.set_content(("\n\n" + "-" * 40 + "\n\n").join(sections))
+        return message
+
+
+class RateLimiter:
+    # Spaces sends evenly at `rate` per second across every pool thread; a
+    # rate of 0 disables the limit.
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_at = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_at)
+            self.next_at = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class SMTPPool:
+    def __init__(
+        self,
+        host,
+        port,
+        username=None,
+        password=None,
+        encryption=None,
+        size=2,
+        timeout=30,
+        noop_after=30,
+    ):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.encryption = encryption
+        self.timeout = timeout
+        self.noop_after = noop_after
+        self.size = size
+        self.idle = queue.LifoQueue()
+        for _ in range(size):
+            self.idle.put((None, 0.0))
+        self.connections_opened = 0
+
+    def _open(self):
+        if self.encryption == "ssl":
+            session = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            session = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            if self.encryption == "tls":
+                session.starttls()
+        if self.username:
+            session.login(self.username, self.password or "")
+        self.connections_opened += 1
+        return session
+
+    def _close_quietly(self, session):
+        try:
+            session.quit()
+        except Exception:
+            try:
+                session.close()
+            except Exception:
+                pass
+
+    def _usable(self, session, idle_since):
+        # Servers drop idle sessions; a NOOP before reuse is cheaper than a
+        # failed MAIL FROM.
+        if time.monotonic() - idle_since < self.noop_after:
+            return True
+        try:
+            return session.noop()[0] == 250
+        except Exception:
+            return False
+
+    def send(self, message):
+        session, idle_since = self.idle.get()
+        try:
+            if session is not None and not self._usable(session, idle_since):
+                self._close_quietly(session)
+                session = None
+            if session is None:
+                session = self._open()
+            session.send_message(message)
+        except smtplib.SMTPResponseException:
+            # A refused transaction is reset by smtplib; the session is still
+            # good for the next message.
+            self.idle.put((session, time.monotonic()))
+            raise
+        except Exception:
+            if session is not None:
+                self._close_quietly(session)
+            self.idle.put((None, 0.0))
+            raise
+        self.idle.put((session, time.monotonic()))
+
+    def close(self):
+        while True:
+            try:
+                session, _ = self.idle.get_nowait()
+            except queue.Empty:
+                return
+            if session is not None:
+                self._close_quietly(session)
+
+
+class NotificationDelivery:
+    job_type = "email_notification"
+
+    def __init__(
+        self,
+        db_pool,
+        smtp_pool,
+        sender,
+        digest_window=5.0,
+        max_digest_alerts=50,
+        rate_limit=0,
+        max_retries=2,
+        on_flush=None,
+        metrics=None,
+    ):
+        self.db_pool = db_pool
+        self.smtp_pool = smtp_pool
+        self.sender = sender
+        self.digest_window = digest_window
+        self.max_digest_alerts = max_digest_alerts
+        self.rate_limiter = RateLimiter(rate_limit)
+        self.max_retries = max_retries
+        # Called with (settled, failed) receipts once alerts are sent or
+        # recorded as failed, so queued jobs are only acknowledged then.
+        self.on_flush = on_flush
+        self.metrics = metrics or NullMetrics()
+        self.senders = ThreadPoolExecutor(
+            max_workers=smtp_pool.size, thread_name_prefix="smtp"
+        )
+        # recipient -> [first queued at, display name, alerts]
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.flusher_thread = None
+
+        self.notifications_sent = 0
+        self.notifications_failed = 0
+        self.notifications_dropped = 0
+        self.messages_sent = 0
+        self.send_seconds = 0.0
+        self.started_at = time.monotonic()
+
+    def start(self):
+        self.stop_event.clear()
+        self.flusher_thread = threading.Thread(target=self._run_flusher, daemon=True)
+        self.flusher_thread.start()
+
+    def add(self, data, receipt=None):
+        self.add_many([data], [receipt])
+
+    def resolve_recipients(self, ids):
+        # Jobs that only carry a notification id are addressed to the
+        # notification's user, looked up for the whole batch at once.
+        recipients = {}
+        ids = sorted(ids)
+        with self.db_pool.connection() as connection:
+            with connection.cursor() as cursor:
+                for start in range(0, len(ids), ID_CHUNK_SIZE):
+                    chunk = ids[start : start + ID_CHUNK_SIZE]
+                    cursor.execute(
+                        NOTIFICATION_RECIPIENT_QUERY.format(
+                            placeholders=", ".join(["%s"] * len(chunk))
+                        ),
+                        chunk,
+                    )
+                    for row in cursor.fetchall():
+                        recipients[row["notification_id"]] = (row["email"], row["name"])
+            connection.rollback()
+        return recipients
+
+    def add_many(self, items, receipts=None):
+        unaddressed = {
+            data["notification_id"]
+            for data in items
+            if not data.get("to") and data.get("notification_id")
+        }
+        recipients = {}
+        if unaddressed:
+            with self.metrics.io(self.job_type):
+                recipients = self.resolve_recipients(unaddressed)
+
+        urgent = False
+        dropped = []
+        with self.lock:
+            now = time.monotonic()
+            for data, receipt in zip(items, receipts or [None] * len(items)):
+                alert = Alert(
+                    data,
+                    *recipients.get(data.get("notification_id"), (None, None)),
+                    receipt=receipt,
+                )
+                if not alert.email:
+                    logging.error(
+                        f"Dropping email notification without a recipient: {data}"
+                    )
+                    self.notifications_dropped += 1
+                    dropped.append(receipt)
+                    continue
+                key = alert.email.lower()
+                entry = self.pending.setdefault(key, [now, alert.name, []])
+                entry[2].append(alert)
+                # Urgent alerts and full digests go out on this call instead
+                # of waiting for the window.
+                if alert.urgent or len(entry[2]) >= self.max_digest_alerts:
+                    entry[0] = 0.0
+                    urgent = True
+
+        # Retrying a notification without a recipient cannot help.
+        self._settle([], dropped)
+        if urgent:
+            self.flush()
+
+    def _take_due(self, force=False):
+        with self.lock:
+            now = time.monotonic()
+            due = [
+                key
+                for key, (first_at, _, _) in self.pending.items()
+                if force or now - first_at >= self.digest_window
+            ]
+            digests = []
+            for key in due:
+                _, name, alerts = self.pending.pop(key)
+                digests.append(Digest(alerts[0].email, name, alerts))
+        return digests
+
+    def _run_flusher(self):
+        while not self.stop_event.wait(min(self.digest_window / 2, 1.0)):
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"Notification flush failed: {e}")
+
+    def deliver(self, digest):
+        # A digest that cannot be built (a CR/LF in a subject, say) fails on
+        # its own instead of aborting the flush and losing the others.
+        try:
+            message = digest.build_message(self.sender)
+        except Exception as e:
+            logging.error(f"Cannot build notification to {digest.email}: {e}")
+            return 0, str(e) or e.__class__.__name__
+        attempt = 0
+        while True:
+            self.rate_limiter.wait()
+            try:
+                self.smtp_pool.send(message)
+                return attempt, None
+            except Exception as e:
+                if attempt >= self.max_retries or not is_transient(e):
+                    return attempt, str(e) or e.__class__.__name__
+                attempt += 1
+                logging.warning(f"Retrying notification to {digest.email}: {e}")
+
+    def flush(self, force=False):
+        with self.flush_lock:
+            digests = self._take_due(force)
+            if not digests:
+                return 0
+
+            alerts = sum(len(d.alerts) for d in digests)
+            with self.metrics.flush(self.job_type, alerts):
+                started = time.perf_counter()
+                results = list(self.senders.map(self.deliver, digests))
+                elapsed = time.perf_counter() - started
+
+                # Notifications sharing an outcome are updated with one
+                # statement.
+                outcomes = {}
+                for digest, (retries, error) in zip(digests, results):
+                    ids = outcomes.setdefault((error, retries), [])
+                    ids.extend(
+                        alert.notification_id
+                        for alert in digest.alerts
+                        if alert.notification_id is not None
+                    )
+                self.record_status(outcomes)
+
+            sent = [
+                alert.receipt
+                for digest, (_, error) in zip(digests, results)
+                if error is None
+                for alert in digest.alerts
+            ]
+            failed = [
+                alert.receipt
+                for digest, (_, error) in zip(digests, results)
+                if error is not None
+                for alert in digest.alerts
+            ]
+            messages = sum(1 for _, error in results if error is None)
+            self._record_flush(messages, len(sent), len(failed), elapsed)
+            self._settle(sent, failed)
+            return messages
+
+    def _settle(self, sent, failed):
+        self.metrics.settled(self.job_type, len(sent), len(failed))
+        # Failed alerts are recorded on the notification row, so their jobs
+        # are acknowledged too.
+        receipts = [receipt for receipt in sent + failed if receipt is not None]
+        if not self.on_flush or not receipts:
+            return
+        try:
+            self.on_flush(receipts, [])
+        except Exception as e:
+            logging.error(f"Settling delivered notification jobs failed: {e}")
+
+    def record_status(self, outcomes):
+        outcomes = {key: ids for key, ids in outcomes.items() if ids}
+        if not outcomes:
+            return
+        now = datetime.now()
+        try:
+            with self.db_pool.connection() as connection:
+                with connection.cursor() as cursor:
+                    for (error, retries), ids in outcomes.items():
+                        if error is None:
+                            query, params = NOTIFICATION_SENT_QUERY, [now, retries]
+                        else:
+                            query, params = NOTIFICATION_FAILED_QUERY, [
+                                error[:1000],
+                                retries,
+                            ]
+                        for start in range(0, len(ids), ID_CHUNK_SIZE):
+                            chunk = ids[start : start + ID_CHUNK_SIZE]
+                            cursor.execute(
+                                query.format(
+                                    placeholders=", ".join(["%s"] * len(chunk))
+                                ),
+                                params + chunk,
+                            )
+                connection.commit()
+        except Exception as e:
+            # The mail has already gone out; a lost status update must not
+            # send it again.
+            logging.error(f"Recording notification delivery status failed: {e}")
+
+    def _record_flush(self, messages, sent, failed, elapsed):
+        self.messages_sent += messages
+        self.notifications_sent += sent
+        self.notifications_failed += failed
+        self.send_seconds += elapsed
+
+        rate = messages / elapsed if elapsed > 0 else 0.0
+        logging.info(
+            f"Delivered {sent} notifications in {messages} emails ({failed} failed) "
+            f"in {elapsed * 1000:.1f} ms ({rate:.0f} messages/sec)"
+        )
+
+    def stats(self):
+        uptime = time.monotonic() - self.started_at
+        return {
+            "notifications_sent": self.notifications_sent,
+            "notifications_failed": self.notifications_failed,
+            "notifications_dropped": self.notifications_dropped,
+            "notifications_pending": sum(len(e[2]) for e in self.pending.values()),
+            "messages_sent": self.messages_sent,
+            "smtp_connections_opened": self.smtp_pool.connections_opened,
+            "send_messages_per_sec": (
+                round(self.messages_sent / self.send_seconds, 1)
+                if self.send_seconds
+                else 0.0
+            ),
+            "messages_per_sec": (
+                round(self.messages_sent / uptime, 1) if uptime else 0.0
+            ),
+        }
+
+    def close(self):
+        self.stop_event.set()
+        if self.flusher_thread:
+            self.flusher_thread.join(timeout=self.digest_window * 2)
+            self.flusher_thread = None
+        self.flush(force=True)
+        self.senders.shutdown()
+        self.smtp_pool.close()
+        logging.info(f"Notification delivery stopped: {self.stats()}")
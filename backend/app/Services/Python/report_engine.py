@@ -0,0 +1,264 @@
+import csv
+import json
+import logging
+import os
+import re
+import time
+from datetime import datetime
+
+import pymysql
+
+FETCH_SIZE = 5000
+PROGRESS_EVERY = 50000
+XLSX_SHEET_ROWS = 1000000
+REPORT_STATUS_TTL = 86400
+REPORT_PROGRESS_CHANNEL = "erp:reports:progress"
+REPORT_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+def parse_org_id(value):
+    # Part of the output path, so only a positive integer will do.
+    if isinstance(value, str) and value.isdigit():
+        value = int(value)
+    if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+        raise ValueError(f"Invalid org_id: {value!r}")
+    return value
+
+
+def parse_report_id(value):
+    if not isinstance(value, str) or not REPORT_ID_PATTERN.fullmatch(value):
+        raise ValueError(f"Invalid report_id: {value!r}")
+    return value
+
+
+class ReportDefinition:
+    def __init__(self, name, title, query, params, columns):
+        self.name = name
+        self.title = title
+        self.query = query
+        self.params = params
+        self.columns = columns
+
+    def bind(self, data):
+        missing = [param for param in self.params if data.get(param) is None]
+        if missing:
+            raise ValueError(f"Report {self.name} is missing {', '.join(missing)}")
+        return [data[param] for param in self.params]
+
+
+REPORTS = {}
+
+
+def register_report(definition):
+    REPORTS[definition.name] = definition
+    return definition
+
+
+register_report(
+    ReportDefinition(
+        "stock_ledger",
+        "Stock Ledger",
+        """
+        SELECT st.transaction_date, st.transaction_number, st.transaction_type,
+               mu.name AS unit_name, p.code AS product_code, p.name AS product_name,
+               st.quantity, st.unit_of_measure, st.reference_type, st.reference_id, st.reason
+        FROM stock_transactions st
+        JOIN products p ON p.id = st.product_id
+        JOIN manufacturing_units mu ON mu.id = st.manufacturing_unit_id
+        WHERE st.organization_id = %s AND st.transaction_date >= %s AND st.transaction_date < %s
+        ORDER BY st.transaction_date, st.id
+        """,
+        ["org_id", "date_from", "date_to"],
+        [
+            ("transaction_date", "Date"),
+            ("transaction_number", "Transaction No."),
+            ("transaction_type", "Type"),
+            ("unit_name", "Unit"),
+            ("product_code", "Product Code"),
+            ("product_name", "Product"),
+            ("quantity", "Quantity"),
+            ("unit_of_measure", "UOM"),
+            ("reference_type", "Reference Type"),
+            ("reference_id", "Reference ID"),
+            ("reason", "Reason"),
+        ],
+    )
+)
+
+register_report(
+    ReportDefinition(
+        "sales_register",
+        "Sales Register",
+        """
+        SELECT so.order_date, so.order_number, c.name AS customer_name, so.status,
+               so.subtotal, so.discount_amount, so.tax_amount, so.total_amount
+        FROM sales_orders so
+        JOIN customers c ON c.id = so.customer_id
+        WHERE so.organization_id = %s AND so.order_date >= %s AND so.order_date < %s
+          AND so.deleted_at IS NULL
+        ORDER BY so.order_date, so.id
+        """,
+        ["org_id", "date_from", "date_to"],
+        [
+            ("order_date", "Order Date"),
+            ("order_number", "Order No."),
+            ("customer_name", "Customer"),
+            ("status", "Status"),
+            ("subtotal", "Subtotal"),
+            ("discount_amount", "Discount"),
+            ("tax_amount", "Tax"),
+            ("total_amount", "Total"),
+        ],
+    )
+)
+
+
+def stream_rows(cursor, fetch_size=FETCH_SIZE):
+    while True:
+        rows = cursor.fetchmany(fetch_size)
+        if not rows:
+            return
+        yield from rows
+
+
+def project(rows, columns):
+    keys = [key for key, _ in columns]
+    for row in rows:
+        yield [row[key] for key in keys]
+
+
+def write_csv(path, headers, records, on_row):
+    with open(path, "w", newline="", encoding="utf-8") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(headers)
+        for record in records:
+            writer.writerow(record)
+            on_row()
+
+
+def write_xlsx(path, headers, records, on_row, title):
+    from openpyxl import Workbook
+
+    # write_only mode streams rows to disk instead of building a cell tree.
+    workbook = Workbook(write_only=True)
+    sheet = None
+    sheet_rows = XLSX_SHEET_ROWS
+    for record in records:
+        if sheet_rows >= XLSX_SHEET_ROWS:
+            sheet = workbook.create_sheet(
+                f"{title[:25]} {len(workbook.worksheets) + 1}"
+            )
+            sheet.append(headers)
+            sheet_rows = 0
+        sheet.append(record)
+        sheet_rows += 1
+        on_row()
+    if sheet is None:
+        workbook.create_sheet(title[:31]).append(headers)
+    workbook.save(path)
+
+
+class ReportEngine:
+    def __init__(
+        self,
+        db_connection,
+        redis_client=None,
+        storage_path="storage/app/reports",
+        cursorclass=pymysql.cursors.SSDictCursor,
+        key_prefix="",
+    ):
+        self.db_connection = db_connection
+        self.redis_client = redis_client
+        self.storage_path = storage_path
+        self.cursorclass = cursorclass
+        self.key_prefix = key_prefix
+
+    def status_key(self, report_id):
+        return f"{self.key_prefix}report:{report_id}"
+
+    def publish(self, report_id, **fields):
+        if not self.redis_client:
+            return
+        fields["updated_at"] = datetime.now().isoformat()
+        key = self.status_key(report_id)
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.hset(key, mapping={k: "" if v is None else v for k, v in fields.items()})
+        pipe.expire(key, REPORT_STATUS_TTL)
+        pipe.publish(
+            REPORT_PROGRESS_CHANNEL, json.dumps({"report_id": report_id, **fields})
+        )
+        pipe.execute()
+
+    def output_path(self, report_id, definition, output_format, org_id):
+        directory = os.path.join(self.storage_path, str(parse_org_id(org_id)))
+        path = os.path.join(
+            directory, f"{definition.name}_{parse_report_id(report_id)}.{output_format}"
+        )
+        root = os.path.realpath(self.storage_path)
+        if os.path.commonpath([root, os.path.realpath(path)]) != root:
+            raise ValueError(f"Report path escapes {self.storage_path}: {path}")
+        os.makedirs(directory, exist_ok=True)
+        return path
+
+    def generate(self, data):
+        definition = REPORTS.get(data.get("report"))
+        if definition is None:
+            raise ValueError(f"Unknown report: {data.get('report')}")
+        output_format = data.get("format", "csv")
+        if output_format not in ("csv", "xlsx"):
+            raise ValueError(f"Unsupported report format: {output_format}")
+
+        # Both ids come from the job payload and end up in the file path.
+        data = {**data, "org_id": parse_org_id(data.get("org_id"))}
+        report_id = parse_report_id(
+            data.get("report_id") or datetime.now().strftime("%Y%m%d%H%M%S%f")
+        )
+        params = definition.bind(data)
+        path = self.output_path(report_id, definition, output_format, data["org_id"])
+        partial_path = f"{path}.part"
+
+        started = time.perf_counter()
+        progress = {"rows": 0}
+
+        def on_row():
+            progress["rows"] += 1
+            if progress["rows"] % PROGRESS_EVERY == 0:
+                self.publish(report_id, status="running", rows=progress["rows"])
+
+        self.publish(report_id, status="running", rows=0, report=definition.name)
+        try:
+            cursor = (
+                self.db_connection.cursor(self.cursorclass)
+                if self.cursorclass
+                else self.db_connection.cursor()
+            )
+            with cursor:
+                cursor.execute(definition.query, params)
+                headers = [label for _, label in definition.columns]
+                records = project(stream_rows(cursor), definition.columns)
+                if output_format == "xlsx":
+                    write_xlsx(partial_path, headers, records, on_row, definition.title)
+                else:
+                    write_csv(partial_path, headers, records, on_row)
+            os.replace(partial_path, path)
+        except Exception as e:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            self.publish(
+                report_id, status="failed", rows=progress["rows"], error=str(e)
+            )
+            raise
+
+        elapsed = time.perf_counter() - started
+        rate = progress["rows"] / elapsed if elapsed > 0 else 0.0
+        self.publish(
+            report_id,
+            status="completed",
+            rows=progress["rows"],
+            path=path,
+            seconds=round(elapsed, 2),
+        )
+        logging.info(
+            f"Report {definition.name} ({report_id}): {progress['rows']} rows to {path} in {elapsed:.1f}s ({rate:.0f} rows/sec)"
+        )
+        return path
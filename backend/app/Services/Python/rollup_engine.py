@@ -0,0 +1,331 @@
+import logging
+import time
+from datetime import date, datetime, timedelta
+
+from kpi_engine import INITIAL_WATERMARK, ORG_CHUNK_SIZE, changed_since
+
+# Bumped when the rollups gained per-day buckets: a watermark stored before
+# would skip building the buckets for rows it had already counted.
+ROLLUP_WATERMARKS_KEY = "erp:rollup:watermarks:v2"
+
+ROLLUP_TABLES = {"status": "rollup_status_counts", "daily": "rollup_daily_counts"}
+ROLLUP_INSERT_QUERIES = {
+    "status": (
+        "INSERT INTO rollup_status_counts (rollup, organization_id, dimension, value, updated_at) "
+        "VALUES (%s, %s, %s, %s, %s)"
+    ),
+    "daily": (
+        "INSERT INTO rollup_daily_counts (rollup, organization_id, day, dimension, value, updated_at) "
+        "VALUES (%s, %s, %s, %s, %s, %s)"
+    ),
+}
+ROLLUP_BUCKET_DELETE_QUERY = "DELETE FROM rollup_daily_counts WHERE rollup = %s AND organization_id = %s AND day = %s"
+# Status counts are the sum of their per-day buckets, so re-summing an
+# organization reads its buckets, not the source table.
+ROLLUP_STATUS_SUM_QUERY = """
+INSERT INTO rollup_status_counts (rollup, organization_id, dimension, value, updated_at)
+SELECT %s, organization_id, dimension, SUM(value), %s
+FROM rollup_daily_counts
+WHERE rollup = %s{orgs}
+GROUP BY organization_id, dimension
+"""
+
+
+class RollupDefinition:
+    def __init__(
+        self,
+        name,
+        kind,
+        source_table,
+        dimension_sql="''",
+        day_column=None,
+        where="deleted_at IS NULL",
+        org_column="organization_id",
+        watermark_column="updated_at",
+    ):
+        if kind not in ROLLUP_TABLES:
+            raise ValueError(f"Unknown rollup kind: {kind}")
+        if kind == "daily" and not day_column:
+            raise ValueError(f"Daily rollup {name} needs day_column")
+        self.name = name
+        self.kind = kind
+        self.source_table = source_table
+        self.dimension_sql = dimension_sql
+        # Every rollup is kept in per-(organization, day) buckets so a change
+        # only recomputes the buckets it touched. Status rollups bucket by
+        # creation day, which a row never leaves when its status changes, and
+        # store the buckets under their own name next to the daily rollups.
+        self.day_column = day_column or "created_at"
+        self.day_sql = f"DATE({self.day_column})"
+        self.bucket_name = name if kind == "daily" else f"{name}:created"
+        self.where = where
+        self.org_column = org_column
+        self.watermark_column = watermark_column
+
+    def aggregate_query(self, by_day=None, extra=None):
+        # Dimensions are COALESCEd so NULLs land in one '' bucket instead of
+        # slipping past the unique key. Rows without a day can't be bucketed
+        # and are left out of every rollup alike.
+        by_day = self.kind == "daily" if by_day is None else by_day
+        columns = [f"{self.org_column} AS org_id"]
+        group = [self.org_column]
+        if by_day:
+            columns.append(f"{self.day_sql} AS day")
+            group.append("day")
+        columns.append(f"COALESCE({self.dimension_sql}, '') AS dimension")
+        group.append("dimension")
+
+        conditions = [self.where] if self.where else []
+        conditions.append(f"{self.day_column} IS NOT NULL")
+        if extra:
+            conditions.append(extra)
+        return (
+            f"SELECT {', '.join(columns)}, COUNT(*) AS value FROM {self.source_table}"
+            f" WHERE {' AND '.join(conditions)} GROUP BY {', '.join(group)}"
+        )
+
+    def key(self, row):
+        if self.kind == "daily":
+            return (row["org_id"], str(row["day"]), row["dimension"])
+        return (row["org_id"], row["dimension"])
+
+
+def day_ranges(days):
+    # Contiguous runs of days as [start, end) bounds, so the bucket query
+    # can use an index on the day column.
+    ranges = []
+    for day in sorted(date.fromisoformat(day[:10]) for day in days):
+        if ranges and ranges[-1][1] == day:
+            ranges[-1][1] = day + timedelta(days=1)
+        else:
+            ranges.append([day, day + timedelta(days=1)])
+    return [(start.isoformat(), end.isoformat()) for start, end in ranges]
+
+
+ROLLUP_DEFINITIONS = {}
+
+
+def register_rollup(definition):
+    ROLLUP_DEFINITIONS[definition.name] = definition
+    return definition
+
+
+register_rollup(
+    RollupDefinition(
+        "organizations", "status", "organizations", "status", org_column="id"
+    )
+)
+register_rollup(
+    RollupDefinition("manufacturing_units", "status", "manufacturing_units", "status")
+)
+register_rollup(RollupDefinition("users_status", "status", "users", "status"))
+register_rollup(
+    RollupDefinition("users_created", "daily", "users", day_column="created_at")
+)
+register_rollup(
+    RollupDefinition(
+        "production_orders_status", "status", "production_orders", "status"
+    )
+)
+register_rollup(
+    RollupDefinition("inspections_result", "status", "inspections", "result")
+)
+register_rollup(
+    RollupDefinition(
+        "inspections_daily",
+        "daily",
+        "inspections",
+        "result",
+        day_column="inspection_date",
+    )
+)
+register_rollup(RollupDefinition("ncrs_status", "status", "ncrs", "status"))
+register_rollup(RollupDefinition("ncrs_type", "status", "ncrs", "non_conformance_type"))
+
+
+class RollupEngine:
+    def __init__(self, db_connection, redis_client=None, definitions=None):
+        self.db_connection = db_connection
+        self.redis_client = redis_client
+        self.definitions = (
+            definitions if definitions is not None else ROLLUP_DEFINITIONS
+        )
+
+    def get_watermark(self, definition):
+        if self.redis_client:
+            value = self.redis_client.hget(ROLLUP_WATERMARKS_KEY, definition.name)
+            if value:
+                return value
+        return INITIAL_WATERMARK
+
+    def changed_buckets(self, cursor, definition, watermark):
+        return changed_since(
+            cursor,
+            definition.source_table,
+            definition.org_column,
+            definition.watermark_column,
+            watermark,
+            bucket_sql=definition.day_sql,
+        )
+
+    def bucket_rows(self, definition, rows, now):
+        return [
+            (
+                definition.bucket_name,
+                row["org_id"],
+                str(row["day"]),
+                row["dimension"],
+                row["value"],
+                now,
+            )
+            for row in rows
+            if row["org_id"] is not None
+        ]
+
+    def refresh_buckets(self, cursor, definition, buckets):
+        # Each touched bucket is recounted from its own rows, which also
+        # catches rows that changed status within it. A row whose day itself
+        # changed leaves its old bucket stale until verify() repairs it.
+        now = datetime.now()
+        ordered = sorted(buckets)
+        written = 0
+        for start in range(0, len(ordered), ORG_CHUNK_SIZE):
+            chunk = ordered[start : start + ORG_CHUNK_SIZE]
+            org_ids = sorted({org_id for org_id, _ in chunk})
+            ranges = day_ranges({day for _, day in chunk})
+            within = " OR ".join(
+                [f"({definition.day_column} >= %s AND {definition.day_column} < %s)"]
+                * len(ranges)
+            )
+            cursor.execute(
+                definition.aggregate_query(
+                    by_day=True,
+                    extra=f"{definition.org_column} IN ({', '.join(['%s'] * len(org_ids))}) "
+                    f"AND ({within})",
+                ),
+                org_ids + [bound for pair in ranges for bound in pair],
+            )
+            # The query covers every listed organization on every listed
+            # day; only the buckets that actually changed are replaced.
+            touched = set(chunk)
+            rows = [
+                row
+                for row in self.bucket_rows(definition, cursor.fetchall(), now)
+                if (row[1], row[2]) in touched
+            ]
+            cursor.executemany(
+                ROLLUP_BUCKET_DELETE_QUERY,
+                [(definition.bucket_name, org_id, day) for org_id, day in chunk],
+            )
+            if rows:
+                cursor.executemany(ROLLUP_INSERT_QUERIES["daily"], rows)
+            written += len(rows)
+            if definition.kind == "status":
+                self.sum_status(cursor, definition, org_ids, now)
+        return written
+
+    def rebuild(self, cursor, definition):
+        now = datetime.now()
+        cursor.execute(definition.aggregate_query(by_day=True))
+        rows = self.bucket_rows(definition, cursor.fetchall(), now)
+        cursor.execute(
+            "DELETE FROM rollup_daily_counts WHERE rollup = %s",
+            (definition.bucket_name,),
+        )
+        for start in range(0, len(rows), ORG_CHUNK_SIZE):
+            cursor.executemany(
+                ROLLUP_INSERT_QUERIES["daily"], rows[start : start + ORG_CHUNK_SIZE]
+            )
+        if definition.kind == "status":
+            self.sum_status(cursor, definition, None, now)
+        return len(rows)
+
+    def sum_status(self, cursor, definition, org_ids, now):
+        if org_ids is None:
+            orgs, params = "", []
+        else:
+            orgs = f" AND organization_id IN ({', '.join(['%s'] * len(org_ids))})"
+            params = list(org_ids)
+        cursor.execute(
+            f"DELETE FROM rollup_status_counts WHERE rollup = %s{orgs}",
+            [definition.name] + params,
+        )
+        cursor.execute(
+            ROLLUP_STATUS_SUM_QUERY.format(orgs=orgs),
+            [definition.name, now, definition.bucket_name] + params,
+        )
+
+    def run(self, full=False):
+        started = time.perf_counter()
+        watermarks = {}
+        refreshed_buckets = 0
+        written = 0
+
+        try:
+            with self.db_connection.cursor() as cursor:
+                for name, definition in self.definitions.items():
+                    watermark = (
+                        INITIAL_WATERMARK if full else self.get_watermark(definition)
+                    )
+                    buckets, watermarks[name] = self.changed_buckets(
+                        cursor, definition, watermark
+                    )
+                    # A full run also clears buckets whose source rows were
+                    # hard deleted or moved to another day.
+                    if full:
+                        written += self.rebuild(cursor, definition)
+                    elif buckets:
+                        written += self.refresh_buckets(cursor, definition, buckets)
+                    refreshed_buckets += len(buckets)
+            self.db_connection.commit()
+        except Exception:
+            self.db_connection.rollback()
+            raise
+
+        # Watermarks only advance once the rollups they cover are committed.
+        if self.redis_client and watermarks:
+            self.redis_client.hset(ROLLUP_WATERMARKS_KEY, mapping=watermarks)
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        logging.info(
+            f"Rollups refreshed: {written} rows for {refreshed_buckets} changed buckets in {elapsed_ms:.1f} ms"
+        )
+        return written
+
+    def stored_rollup(self, cursor, definition):
+        table = ROLLUP_TABLES[definition.kind]
+        day = "day, " if definition.kind == "daily" else ""
+        cursor.execute(
+            f"SELECT organization_id AS org_id, {day}dimension, value FROM {table} WHERE rollup = %s",
+            (definition.name,),
+        )
+        return {definition.key(row): int(row["value"]) for row in cursor.fetchall()}
+
+    def verify(self):
+        # Compares every rollup with a full aggregate of its source table;
+        # meant for an occasional check, not the dashboard refresh path.
+        mismatches = {}
+        with self.db_connection.cursor() as cursor:
+            for name, definition in self.definitions.items():
+                cursor.execute(definition.aggregate_query())
+                expected = {
+                    definition.key(row): int(row["value"])
+                    for row in cursor.fetchall()
+                    if row["org_id"] is not None
+                }
+                stored = self.stored_rollup(cursor, definition)
+                diff = {
+                    key: (stored.get(key, 0), expected.get(key, 0))
+                    for key in expected.keys() | stored.keys()
+                    if stored.get(key, 0) != expected.get(key, 0)
+                }
+                if diff:
+                    mismatches[name] = diff
+                    logging.warning(
+                        f"Rollup {name} differs from {definition.source_table} in {len(diff)} buckets"
+                    )
+        self.db_connection.rollback()
+
+        if not mismatches:
+            logging.info("Rollups match their source tables")
+        return mismatches
@@ -0,0 +1,274 @@
+import logging
+import threading
+from datetime import datetime, timedelta
+
+import redis
+
+LEASE_TTL = 30
+FIRED_MARKER_TTL = 86400
+MAX_CATCH_UP_RUNS = 100
+MAX_WAIT_SECONDS = 300
+
+CRON_FIELDS = [
+    ("minute", 0, 59),
+    ("hour", 0, 23),
+    ("day", 1, 31),
+    ("month", 1, 12),
+    ("weekday", 0, 6),
+]
+
+
+def parse_cron_field(field, low, high):
+    values = set()
+    for part in field.split(","):
+        step = 1
+        if "/" in part:
+            part, step_text = part.split("/", 1)
+            step = int(step_text)
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start_text, end_text = part.split("-", 1)
+            start, end = int(start_text), int(end_text)
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+        if high == 6 and end == 7:
+            # Cron allows 7 for Sunday as well as 0.
+            if start == 7:
+                start = end = 0
+            else:
+                values.add(0)
+                end = 6
+        if start < low or end > high or start > end or step < 1:
+            raise ValueError(f"Invalid cron field: {field}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSpec:
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expression}")
+        self.expression = expression
+        parsed = [
+            parse_cron_field(field, low, high)
+            for field, (_, low, high) in zip(fields, CRON_FIELDS)
+        ]
+        self.minutes, self.hours, self.days, self.months, self.weekdays = parsed
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    def day_matches(self, moment):
+        weekday = (moment.weekday() + 1) % 7
+        in_days = moment.day in self.days
+        in_weekdays = weekday in self.weekdays
+        # Standard cron: when both day fields are restricted either may match.
+        if not self.any_day and not self.any_weekday:
+            return in_days or in_weekdays
+        return in_days and in_weekdays
+
+    def next_after(self, moment):
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 5)
+        while candidate < limit:
+            if candidate.month not in self.months:
+                month = candidate.month % 12 + 1
+                year = candidate.year + (candidate.month == 12)
+                candidate = candidate.replace(
+                    year=year, month=month, day=1, hour=0, minute=0
+                )
+            elif not self.day_matches(candidate):
+                candidate = (candidate + timedelta(days=1)).replace(hour=0, minute=0)
+            elif candidate.hour not in self.hours:
+                candidate = (candidate + timedelta(hours=1)).replace(minute=0)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f"Cron expression never fires: {self.expression}")
+
+
+class ScheduledTask:
+    def __init__(self, name, cron, job_type, payload=None, catch_up="once"):
+        if catch_up not in ("once", "all", "none"):
+            raise ValueError(f"Unknown catch-up policy: {catch_up}")
+        self.name = name
+        self.spec = CronSpec(cron)
+        self.job_type = job_type
+        self.payload = payload or {}
+        self.catch_up = catch_up
+
+
+class Scheduler:
+    def __init__(
+        self,
+        redis_client,
+        dispatch,
+        worker_id,
+        tasks=None,
+        key_prefix="erp:scheduler",
+        lease_ttl=LEASE_TTL,
+        clock=datetime.now,
+    ):
+        self.redis_client = redis_client
+        self.dispatch = dispatch
+        self.worker_id = worker_id
+        self.tasks = {}
+        self.key_prefix = key_prefix
+        self.lease_ttl = lease_ttl
+        self.clock = clock
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.is_leader = False
+        for task in tasks or []:
+            self.add_task(task)
+
+    @property
+    def leader_key(self):
+        return f"{self.key_prefix}:leader"
+
+    @property
+    def last_run_key(self):
+        return f"{self.key_prefix}:last_run"
+
+    def fired_key(self, task, fire_at):
+        return f"{self.key_prefix}:fired:{task.name}:{fire_at.isoformat()}"
+
+    def add_task(self, task):
+        self.tasks[task.name] = task
+        return task
+
+    def acquire_lease(self):
+        if self.redis_client.set(
+            self.leader_key, self.worker_id, nx=True, ex=self.lease_ttl
+        ):
+            return True
+
+        # Renew only if the lease is still ours; WATCH makes the check and the
+        # expire atomic without server-side scripting.
+        with self.redis_client.pipeline() as pipe:
+            try:
+                pipe.watch(self.leader_key)
+                if pipe.get(self.leader_key) != self.worker_id:
+                    pipe.unwatch()
+                    return False
+                pipe.multi()
+                pipe.expire(self.leader_key, self.lease_ttl)
+                pipe.execute()
+                return True
+            except redis.WatchError:
+                return False
+
+    def release_lease(self):
+        with self.redis_client.pipeline() as pipe:
+            try:
+                pipe.watch(self.leader_key)
+                if pipe.get(self.leader_key) == self.worker_id:
+                    pipe.multi()
+                    pipe.delete(self.leader_key)
+                    pipe.execute()
+                else:
+                    pipe.unwatch()
+            except redis.WatchError:
+                pass
+        self.is_leader = False
+
+    def last_runs(self):
+        stored = self.redis_client.hgetall(self.last_run_key)
+        return {
+            name: datetime.fromisoformat(value)
+            for name, value in stored.items()
+            if name in self.tasks
+        }
+
+    def due_runs(self, task, last_run, now):
+        due = []
+        fire_at = task.spec.next_after(last_run)
+        while fire_at <= now and len(due) < MAX_CATCH_UP_RUNS:
+            due.append(fire_at)
+            fire_at = task.spec.next_after(fire_at)
+        return due
+
+    def fire(self, task, fire_at):
+        # The marker keeps a run from firing twice if leadership changes
+        # hands between dispatching it and recording last_run.
+        claimed = self.redis_client.set(
+            self.fired_key(task, fire_at), self.worker_id, nx=True, ex=FIRED_MARKER_TTL
+        )
+        if claimed:
+            logging.info(f"Scheduler firing {task.name} for {fire_at.isoformat()}")
+            self.dispatch(
+                task.job_type,
+                {**task.payload, "scheduled_for": fire_at.isoformat()},
+            )
+        return bool(claimed)
+
+    def tick(self):
+        now = self.clock()
+        self.is_leader = self.acquire_lease()
+        if not self.is_leader:
+            return []
+
+        fired = []
+        last_runs = self.last_runs()
+        for task in self.tasks.values():
+            last_run = last_runs.get(task.name)
+            if last_run is None:
+                # First sighting: start counting from now instead of
+                # replaying history.
+                self.redis_client.hset(self.last_run_key, task.name, now.isoformat())
+                continue
+
+            due = self.due_runs(task, last_run, now)
+            if not due:
+                continue
+            if task.catch_up == "all":
+                runs, last_run = due, due[-1]
+            elif task.catch_up == "once":
+                runs, last_run = due[-1:], now
+            else:
+                runs, last_run = [], now
+            for fire_at in runs:
+                if self.fire(task, fire_at):
+                    fired.append((task.name, fire_at))
+            self.redis_client.hset(self.last_run_key, task.name, last_run.isoformat())
+        return fired
+
+    def seconds_until_next(self):
+        now = self.clock()
+        last_runs = self.last_runs()
+        next_fire = min(
+            (
+                task.spec.next_after(last_runs.get(task.name, now))
+                for task in self.tasks.values()
+            ),
+            default=now + timedelta(seconds=MAX_WAIT_SECONDS),
+        )
+        wait = max(0.0, (next_fire - now).total_seconds())
+        # Wake in time to renew the lease; followers retry it at the same
+        # cadence so a dead leader is replaced within one lease period.
+        return min(wait, self.lease_ttl / 3, MAX_WAIT_SECONDS)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.tick()
+                wait = self.seconds_until_next()
+            except Exception as e:
+                logging.error(f"Scheduler failed: {e}")
+                wait = self.lease_ttl / 3
+            self.stop_event.wait(wait)
+
+    def start(self):
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+            self.thread = None
+        self.release_lease()
@@ -0,0 +1,299 @@
+import logging
+import time
+from array import array
+from datetime import datetime
+from decimal import Decimal
+
+import pymysql
+
+STOCK_REBUILD_KEY = "erp:stock_rebuild"
+FETCH_ROWS = 10000
+WRITE_BATCH_ROWS = 1000
+# Keys or ids per IN (...) list.
+ID_CHUNK_SIZE = 1000
+# Past this many touched (unit, product) pairs, one ordered pass over the
+# whole ledger is cheaper than replaying each pair's history.
+INCREMENTAL_MAX_KEYS = 2000
+
+# Same rules as StockTransactionController::store: receipts and returns add,
+# issues subtract, an adjustment sets the balance outright and a transfer
+# leaves it unchanged.
+TRANSACTION_SIGNS = {"receipt": 1, "return": 1, "issue": -1}
+
+# Quantities are DECIMAL(15,2); summing them as integer hundredths keeps the
+# running balances exact without paying for Decimal arithmetic per row.
+STOCK_TRANSACTION_QUERY = """
+SELECT id, organization_id, manufacturing_unit_id, product_id, transaction_type,
+       CAST(ROUND(quantity * 100) AS SIGNED) AS quantity_cents
+FROM stock_transactions
+WHERE id <= %s{where}
+ORDER BY transaction_date, id
+"""
+
+INVENTORY_UPSERT_QUERY = """
+INSERT INTO inventory
+(organization_id, manufacturing_unit_id, product_id, quantity_on_hand, quantity_available, created_at, updated_at)
+VALUES (%s, %s, %s, %s, %s, %s, %s)
+ON DUPLICATE KEY UPDATE
+quantity_on_hand = VALUES(quantity_on_hand),
+quantity_available = VALUES(quantity_on_hand) - quantity_reserved,
+updated_at = VALUES(updated_at)
+"""
+
+NEGATIVE_STOCK_ANOMALY_QUERY = """
+INSERT INTO anomalies
+(org_id, unit_id, anomaly_type, severity, detected_at, entity_type, entity_id,
+ anomaly_description, expected_value, actual_value, status, created_at, updated_at)
+VALUES (%s, %s, 'inventory', 'high', %s, 'stock_transaction', %s, %s, 0, %s, 'detected', %s, %s)
+"""
+
+
+def cents_to_decimal(cents):
+    return Decimal(cents).scaleb(-2)
+
+
+class StockBalances:
+    # One slot per (unit, product); the columns live in typed arrays so a
+    # million balances cost tens of megabytes rather than a dict of objects
+    # per key.
+    def __init__(self):
+        self.slots = {}
+        self.orgs = array("q")
+        self.units = array("q")
+        self.products = array("q")
+        self.balances = array("q")
+        # 1 + the index in dips of the slot's current run below zero, or 0
+        # while the balance is not negative.
+        self.open_dips = array("q")
+        # [slot, transaction that took the balance below zero, lowest
+        # balance before it recovered]; one entry per crossing.
+        self.dips = []
+        self.transactions = 0
+
+    def __len__(self):
+        return len(self.balances)
+
+    def add_slot(self, key, org_id):
+        slot = self.slots[key] = len(self.balances)
+        self.orgs.append(org_id)
+        self.units.append(key[0])
+        self.products.append(key[1])
+        self.balances.append(0)
+        self.open_dips.append(0)
+        return slot
+
+    def apply(self, rows):
+        slots = self.slots
+        balances = self.balances
+        open_dips = self.open_dips
+        dips = self.dips
+        signs = TRANSACTION_SIGNS
+        count = 0
+        for transaction_id, org_id, unit_id, product_id, kind, cents in rows:
+            count += 1
+            key = (unit_id, product_id)
+            slot = slots.get(key)
+            if slot is None:
+                slot = self.add_slot(key, org_id)
+            if kind == "adjustment":
+                balance = cents
+            else:
+                sign = signs.get(kind)
+                if sign is None:
+                    continue
+                balance = balances[slot] + sign * cents
+            balances[slot] = balance
+            if balance < 0:
+                dip = open_dips[slot]
+                if not dip:
+                    dips.append([slot, transaction_id, balance])
+                    open_dips[slot] = len(dips)
+                elif balance < dips[dip - 1][2]:
+                    dips[dip - 1][2] = balance
+            elif open_dips[slot]:
+                open_dips[slot] = 0
+        self.transactions += count
+
+    def negative(self):
+        # Yields (slot, transaction_id, lowest) for every dip below zero.
+        for slot, transaction_id, lowest in self.dips:
+            yield slot, transaction_id, lowest
+
+
+class StockLedger:
+    def __init__(
+        self,
+        read_connection,
+        write_connection,
+        redis_client=None,
+        fetch_rows=FETCH_ROWS,
+        cursorclass=pymysql.cursors.SSCursor,
+    ):
+        self.read_connection = read_connection
+        self.write_connection = write_connection
+        self.redis_client = redis_client
+        self.fetch_rows = fetch_rows
+        self.cursorclass = cursorclass
+
+    def last_processed_id(self):
+        if self.redis_client:
+            value = self.redis_client.hget(STOCK_REBUILD_KEY, "last_id")
+            if value:
+                return int(value)
+        return 0
+
+    def max_transaction_id(self):
+        with self.write_connection.cursor() as cursor:
+            cursor.execute("SELECT MAX(id) AS max_id FROM stock_transactions")
+            row = cursor.fetchone()
+        self.write_connection.rollback()
+        return int(row["max_id"] or 0)
+
+    def changed_keys(self, since_id, max_id):
+        with self.write_connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT DISTINCT manufacturing_unit_id, product_id FROM stock_transactions "
+                "WHERE id > %s AND id <= %s",
+                (since_id, max_id),
+            )
+            keys = sorted(
+                (row["manufacturing_unit_id"], row["product_id"])
+                for row in cursor.fetchall()
+            )
+        self.write_connection.rollback()
+        return keys
+
+    def stream(self, balances, max_id, keys=None):
+        # The unbuffered cursor keeps the ledger on the server and hands it
+        # over fetch_rows at a time; it holds read_connection until drained.
+        chunks = [None]
+        if keys is not None:
+            chunks = [
+                keys[start : start + ID_CHUNK_SIZE]
+                for start in range(0, len(keys), ID_CHUNK_SIZE)
+            ]
+        for chunk in chunks:
+            where, params = "", [max_id]
+            if chunk:
+                where = " AND (manufacturing_unit_id, product_id) IN ({})".format(
+                    ", ".join(["(%s, %s)"] * len(chunk))
+                )
+                params += [value for key in chunk for value in key]
+            with self.read_connection.cursor(self.cursorclass) as cursor:
+                cursor.execute(STOCK_TRANSACTION_QUERY.format(where=where), params)
+                while True:
+                    rows = cursor.fetchmany(self.fetch_rows)
+                    if not rows:
+                        break
+                    balances.apply(rows)
+
+    def flagged_transactions(self, cursor, transaction_ids):
+        flagged = set()
+        for start in range(0, len(transaction_ids), ID_CHUNK_SIZE):
+            chunk = transaction_ids[start : start + ID_CHUNK_SIZE]
+            cursor.execute(
+                "SELECT entity_id FROM anomalies WHERE entity_type = 'stock_transaction' "
+                "AND anomaly_type = 'inventory' AND entity_id IN ({})".format(
+                    ", ".join(["%s"] * len(chunk))
+                ),
+                chunk,
+            )
+            flagged.update(row["entity_id"] for row in cursor.fetchall())
+        return flagged
+
+    def write(self, balances):
+        now = datetime.now()
+        rows = []
+        for slot in range(len(balances)):
+            quantity = cents_to_decimal(balances.balances[slot])
+            rows.append(
+                (
+                    balances.orgs[slot],
+                    balances.units[slot],
+                    balances.products[slot],
+                    quantity,
+                    quantity,
+                    now,
+                    now,
+                )
+            )
+
+        anomalies = 0
+        try:
+            with self.write_connection.cursor() as cursor:
+                for start in range(0, len(rows), WRITE_BATCH_ROWS):
+                    cursor.executemany(
+                        INVENTORY_UPSERT_QUERY, rows[start : start + WRITE_BATCH_ROWS]
+                    )
+
+                # Each dip below zero is flagged once, against the transaction
+                # that caused it, so reruns do not pile up duplicates.
+                negative = list(balances.negative())
+                flagged = self.flagged_transactions(
+                    cursor, [transaction_id for _, transaction_id, _ in negative]
+                )
+                anomaly_rows = [
+                    (
+                        balances.orgs[slot],
+                        balances.units[slot],
+                        now,
+                        transaction_id,
+                        f"Stock of product {balances.products[slot]} went negative "
+                        f"(lowest {cents_to_decimal(lowest)})",
+                        cents_to_decimal(lowest),
+                        now,
+                        now,
+                    )
+                    for slot, transaction_id, lowest in negative
+                    if transaction_id not in flagged
+                ]
+                if anomaly_rows:
+                    cursor.executemany(NEGATIVE_STOCK_ANOMALY_QUERY, anomaly_rows)
+                anomalies = len(anomaly_rows)
+            self.write_connection.commit()
+        except Exception:
+            self.write_connection.rollback()
+            raise
+        return anomalies
+
+    def run(self, full=False):
+        started = time.perf_counter()
+        max_id = self.max_transaction_id()
+        since_id = 0 if full else self.last_processed_id()
+        if max_id <= since_id:
+            logging.info("Stock ledger unchanged since the last rebuild")
+            return {"transactions": 0, "balances": 0, "anomalies": 0}
+
+        # Incremental runs replay the whole history of every (unit, product)
+        # touched since the last run, so back-dated transactions and
+        # adjustments still land in the right order.
+        keys = None if since_id == 0 else self.changed_keys(since_id, max_id)
+        if keys is not None and len(keys) > INCREMENTAL_MAX_KEYS:
+            logging.info(
+                f"{len(keys)} stock balances changed, rebuilding the whole ledger"
+            )
+            keys = None
+        balances = StockBalances()
+        self.stream(balances, max_id, keys)
+        streamed = time.perf_counter() - started
+        anomalies = self.write(balances)
+
+        # The watermark only advances once the balances it covers are committed.
+        if self.redis_client:
+            self.redis_client.hset(
+                STOCK_REBUILD_KEY,
+                mapping={"last_id": max_id, "rebuilt_at": datetime.now().isoformat()},
+            )
+
+        elapsed = time.perf_counter() - started
+        rate = balances.transactions / streamed if streamed > 0 else 0.0
+        logging.info(
+            f"Stock ledger rebuilt: {balances.transactions} transactions into "
+            f"{len(balances)} balances, {anomalies} negative stock anomalies in "
+            f"{elapsed * 1000:.1f} ms ({rate:.0f} transactions/sec)"
+        )
+        return {
+            "transactions": balances.transactions,
+            "balances": len(balances),
+            "anomalies": anomalies,
+        }
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The worker runs as a script from this directory and imports its modules as
+# siblings; the tests import them the same way, and borrow the benchmarks'
+# SQLite adapter for anything that needs a database.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
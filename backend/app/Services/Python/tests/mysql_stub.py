@@ -0,0 +1,248 @@
+import socket
+import struct
+import threading
+from datetime import datetime
+
+PROTOCOL_41 = 0x200
+TRANSACTIONS = 0x2000
+SECURE_CONNECTION = 0x8000
+PLUGIN_AUTH = 0x80000
+CAPABILITIES = 0x1 | 0x8 | PROTOCOL_41 | TRANSACTIONS | SECURE_CONNECTION | PLUGIN_AUTH
+SERVER_STATUS_AUTOCOMMIT = 0x2
+
+COM_QUIT = 0x01
+COM_QUERY = 0x03
+
+FIELD_TYPE_LONGLONG = 0x08
+FIELD_TYPE_DATETIME = 0x0C
+FIELD_TYPE_VAR_STRING = 0xFD
+
+
+def packet(seq, payload):
+    return struct.pack("<I", len(payload))[:3] + bytes([seq & 0xFF]) + payload
+
+
+def lenenc(value):
+    if value < 251:
+        return bytes([value])
+    if value < 1 << 16:
+        return b"\xfc" + struct.pack("<H", value)
+    return b"\xfd" + struct.pack("<I", value)[:3]
+
+
+def lenenc_str(value):
+    return lenenc(len(value)) + value
+
+
+def ok_packet(seq, affected_rows=0):
+    return packet(
+        seq,
+        b"\x00"
+        + lenenc(affected_rows)
+        + b"\x00"
+        + struct.pack("<HH", SERVER_STATUS_AUTOCOMMIT, 0),
+    )
+
+
+def eof_packet(seq):
+    return packet(seq, b"\xfe" + struct.pack("<HH", 0, SERVER_STATUS_AUTOCOMMIT))
+
+
+def field_type(value):
+    if isinstance(value, int):
+        return FIELD_TYPE_LONGLONG
+    if isinstance(value, datetime):
+        return FIELD_TYPE_DATETIME
+    return FIELD_TYPE_VAR_STRING
+
+
+def text_value(value):
+    if value is None:
+        return b"\xfb"
+    if isinstance(value, datetime):
+        value = value.isoformat(sep=" ")
+    return lenenc_str(str(value).encode("utf-8"))
+
+
+def result_set(seq, columns, rows):
+    # Column types are taken from the first row, as a text protocol result
+    # set needs them up front.
+    sample = rows[0] if rows else {}
+    packets = [packet(seq, lenenc(len(columns)))]
+    for name in columns:
+        seq += 1
+        packets.append(
+            packet(
+                seq,
+                lenenc_str(b"def")
+                + lenenc_str(b"erp")
+                + lenenc_str(b"t")
+                + lenenc_str(b"t")
+                + lenenc_str(name.encode())
+                + lenenc_str(name.encode())
+                + b"\x0c"
+                + struct.pack("<HIBHB", 33, 255, field_type(sample.get(name)), 0, 0)
+                + b"\x00\x00",
+            )
+        )
+    seq += 1
+    packets.append(eof_packet(seq))
+    for row in rows:
+        seq += 1
+        packets.append(packet(seq, b"".join(text_value(row[c]) for c in columns)))
+    packets.append(eof_packet(seq + 1))
+    return b"".join(packets)
+
+
+def handshake(connection_id):
+    salt = b"abcdefghijklmnopqrst"
+    payload = (
+        b"\x0a"
+        + b"8.0.0-stub\x00"
+        + struct.pack("<I", connection_id)
+        + salt[:8]
+        + b"\x00"
+        + struct.pack("<H", CAPABILITIES & 0xFFFF)
+        + bytes([45])
+        + struct.pack("<H", SERVER_STATUS_AUTOCOMMIT)
+        + struct.pack("<H", CAPABILITIES >> 16)
+        + bytes([len(salt) + 1])
+        + b"\x00" * 10
+        + salt[8:]
+        + b"\x00"
+        + b"mysql_native_password\x00"
+    )
+    return packet(0, payload)
+
+
+def read_packet(sock):
+    header = recv_exact(sock, 4)
+    if header is None:
+        return None, None
+    length = header[0] | header[1] << 8 | header[2] << 16
+    return header[3], recv_exact(sock, length)
+
+
+def recv_exact(sock, size):
+    data = b""
+    while len(data) < size:
+        try:
+            chunk = sock.recv(size - len(data))
+        except OSError:
+            return None
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+class MySQLStub:
+    """A MySQL server that accepts any login and answers every command with OK.
+
+    Just enough of the wire protocol for PyMySQL to connect, query and ping,
+    so the tests can drop connections between or during queries the way a
+    KILL CONNECTION or a server restart would. A handler can answer queries
+    with an affected row count or a (columns, rows) result set instead.
+    """
+
+    def __init__(self):
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(16)
+        self.port = self.listener.getsockname()[1]
+        self.lock = threading.Lock()
+        self.clients = []
+        self.connections = 0
+        self.queries = []
+        self.kill_queries = 0
+        self.kill_prefix = ""
+        self.handler = None
+        self.running = True
+        threading.Thread(target=self.accept, daemon=True).start()
+
+    def accept(self):
+        while self.running:
+            try:
+                sock, _ = self.listener.accept()
+            except OSError:
+                return
+            with self.lock:
+                self.connections += 1
+                self.clients.append(sock)
+                connection_id = self.connections
+            threading.Thread(
+                target=self.serve, args=(sock, connection_id), daemon=True
+            ).start()
+
+    def serve(self, sock, connection_id):
+        try:
+            sock.sendall(handshake(connection_id))
+            seq, _ = read_packet(sock)
+            if seq is None:
+                return
+            sock.sendall(ok_packet(seq + 1))
+            while True:
+                seq, payload = read_packet(sock)
+                if not payload or payload[0] == COM_QUIT:
+                    return
+                if payload[0] == COM_QUERY:
+                    query = payload[1:].decode("utf-8", "replace")
+                    if self.should_kill(query):
+                        # Drop the connection with the query in flight.
+                        return
+                    with self.lock:
+                        self.queries.append(query)
+                    result = self.handler(query) if self.handler else None
+                    if isinstance(result, tuple):
+                        sock.sendall(result_set(seq + 1, *result))
+                        continue
+                    sock.sendall(ok_packet(seq + 1, result or 0))
+                    continue
+                sock.sendall(ok_packet(seq + 1))
+        except OSError:
+            pass
+        finally:
+            self.drop(sock)
+
+    def should_kill(self, query):
+        if query.upper().startswith("SET "):
+            return False
+        if not query.upper().startswith(self.kill_prefix):
+            return False
+        with self.lock:
+            if self.kill_queries:
+                self.kill_queries -= 1
+                return True
+        return False
+
+    def drop(self, sock):
+        with self.lock:
+            if sock in self.clients:
+                self.clients.remove(sock)
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        sock.close()
+
+    def kill_all(self):
+        """Closes every open connection, as KILL CONNECTION would."""
+        with self.lock:
+            clients = list(self.clients)
+        for sock in clients:
+            self.drop(sock)
+
+    def kill_during_next_queries(self, count=1, prefix=""):
+        with self.lock:
+            self.kill_queries += count
+            self.kill_prefix = prefix.upper()
+
+    def executed(self, query):
+        with self.lock:
+            return self.queries.count(query)
+
+    def close(self):
+        self.running = False
+        self.listener.close()
+        self.kill_all()
@@ -0,0 +1,172 @@
+import glob
+import gzip
+import json
+import os
+import re
+from datetime import datetime, timedelta
+
+import pymysql
+import pytest
+from mysql_stub import MySQLStub
+
+import activity_archiver
+from activity_archiver import ActivityArchiveReader, ActivityLogArchiver
+
+COLUMNS = ["id", "log_name", "description", "properties", "created_at", "updated_at"]
+SELECT = re.compile(
+    r"SELECT \* FROM activity_log WHERE id > (\d+) ORDER BY id LIMIT (\d+)"
+)
+DELETE = re.compile(r"DELETE FROM activity_log WHERE id IN \((.*)\)")
+CUTOFF = datetime(2025, 10, 17)
+
+
+def archived_ids(storage_path):
+    ids = []
+    for path in glob.glob(os.path.join(storage_path, "**", "*.gz"), recursive=True):
+        with gzip.open(path, "rt", encoding="utf-8") as fh:
+            ids.extend(json.loads(line)["id"] for line in fh)
+    return ids
+
+
+class ActivityLogTable:
+    """Serves activity_log from memory through the MySQL stub.
+
+    Each DELETE records which of its ids were already readable from a
+    finished archive file at the moment the server received it.
+    """
+
+    def __init__(self, server, storage_path, rows, kill_after_deletes=None):
+        self.server = server
+        self.storage_path = storage_path
+        self.rows = {row["id"]: row for row in rows}
+        self.deletes = []
+        self.kill_after_deletes = kill_after_deletes
+        server.handler = self.handle
+
+    def handle(self, query):
+        match = SELECT.match(query)
+        if match:
+            last_id, limit = map(int, match.groups())
+            ids = sorted(i for i in self.rows if i > last_id)[:limit]
+            return COLUMNS, [self.rows[i] for i in ids]
+        match = DELETE.match(query)
+        if match:
+            ids = [int(i) for i in match.group(1).split(",")]
+            self.deletes.append((ids, set(ids) <= set(archived_ids(self.storage_path))))
+            if len(self.deletes) == self.kill_after_deletes:
+                self.server.kill_during_next_queries(1, prefix="DELETE")
+            return sum(self.rows.pop(i, None) is not None for i in ids)
+        return None
+
+
+def make_rows(count, recent=0):
+    # Two rows a day, the last `recent` of them inside the retention window.
+    start = CUTOFF - timedelta(hours=12 * (count - recent))
+    return [
+        {
+            "id": i,
+            "log_name": "audit",
+            "description": "updated" if i % 2 else "created",
+            "properties": json.dumps({"batch_id": i}),
+            "created_at": start + timedelta(hours=12 * (i - 1)),
+            "updated_at": start + timedelta(hours=12 * (i - 1)),
+        }
+        for i in range(1, count + 1)
+    ]
+
+
+@pytest.fixture
+def server():
+    stub = MySQLStub()
+    yield stub
+    stub.close()
+
+
+def connect(server):
+    return pymysql.connect(
+        host="127.0.0.1",
+        port=server.port,
+        user="erp",
+        password="secret",
+        database="erp",
+        cursorclass=pymysql.cursors.DictCursor,
+        connect_timeout=2,
+        read_timeout=2,
+    )
+
+
+def make_archiver(server, storage_path):
+    return ActivityLogArchiver(connect(server), str(storage_path), chunk_rows=10)
+
+
+def read_back(storage_path):
+    reader = ActivityArchiveReader(str(storage_path))
+    return list(reader.read(CUTOFF - timedelta(days=365), CUTOFF))
+
+
+def test_archive_delete_and_read_back(server, tmp_path):
+    table = ActivityLogTable(server, str(tmp_path), make_rows(25, recent=4))
+
+    totals = make_archiver(server, tmp_path).run(CUTOFF)
+    assert totals["rows"] == 21
+    assert sorted(table.rows) == [22, 23, 24, 25]
+    assert [len(ids) for ids, _ in table.deletes] == [10, 10, 1]
+    assert all(archived for _, archived in table.deletes)
+    assert not glob.glob(os.path.join(tmp_path, "**", "*.part"), recursive=True)
+
+    rows = read_back(tmp_path)
+    assert [row["id"] for row in rows] == list(range(1, 22))
+    assert rows[0]["created_at"] == str(make_rows(25, recent=4)[0]["created_at"])
+    assert rows[0]["properties"] == json.dumps({"batch_id": 1})
+
+    # Filters match on the archived column values.
+    reader = ActivityArchiveReader(str(tmp_path))
+    created = list(
+        reader.read(CUTOFF - timedelta(days=365), CUTOFF, description="created")
+    )
+    assert [row["id"] for row in created] == list(range(2, 22, 2))
+
+
+def test_rows_are_not_deleted_when_the_file_is_not_finished(
+    server, tmp_path, monkeypatch
+):
+    table = ActivityLogTable(server, str(tmp_path), make_rows(5))
+
+    def disk_full(src, dst):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(activity_archiver.os, "replace", disk_full)
+    with pytest.raises(OSError):
+        make_archiver(server, tmp_path).run(CUTOFF)
+
+    assert table.deletes == []
+    assert len(table.rows) == 5
+    assert not server.executed("DELETE FROM activity_log WHERE id IN (1, 2, 3, 4, 5)")
+    assert read_back(tmp_path) == []
+
+
+def test_run_interrupted_during_delete_is_safe_to_rerun(server, tmp_path):
+    # The connection drops with the second chunk's DELETE in flight.
+    table = ActivityLogTable(server, str(tmp_path), make_rows(25), kill_after_deletes=1)
+    with pytest.raises(pymysql.err.Error):
+        make_archiver(server, tmp_path).run(CUTOFF)
+
+    assert server.executed(
+        "DELETE FROM activity_log WHERE id IN (1, 2, 3, 4, 5, 6, 7, 8, 9, 10)"
+    )
+    assert sorted(table.rows) == list(range(11, 26))
+    # The interrupted chunk was archived in full before its delete was sent.
+    assert sorted(archived_ids(tmp_path)) == list(range(1, 21))
+    files = sorted(glob.glob(os.path.join(tmp_path, "**", "*.gz"), recursive=True))
+
+    totals = make_archiver(server, tmp_path).run(CUTOFF)
+    assert totals["rows"] == 15
+    assert table.rows == {}
+    assert all(archived for _, archived in table.deletes)
+
+    # The rerun rewrote the interrupted chunk's files rather than adding copies.
+    assert set(files) <= set(
+        glob.glob(os.path.join(tmp_path, "**", "*.gz"), recursive=True)
+    )
+    assert [row["id"] for row in read_back(tmp_path)] == list(range(1, 26))
+    assert not glob.glob(os.path.join(tmp_path, "**", "*.part"), recursive=True)
@@ -0,0 +1,151 @@
+import json
+import os
+import signal
+from datetime import datetime
+
+from sqlite_db import ACTIVITY_LOG_DDL, SQLiteConnection
+
+import worker
+from audit_batcher import AuditLogBatcher, audit_row
+from db_pool import ConnectionPool
+
+QUEUED_AT = datetime(2026, 10, 17, 9, 30, 15).timestamp()
+
+
+def test_legacy_payload_maps_onto_spatie_columns():
+    row = audit_row(
+        {
+            "org_id": 3,
+            "user_id": 7,
+            "action": "updated",
+            "module": "sales",
+            "record_type": "App\\Models\\SalesOrder",
+            "record_id": 42,
+            "details": {"status": ["draft", "approved"]},
+            "ip_address": "10.0.0.1",
+            "queued_at": QUEUED_AT,
+        }
+    )
+    assert row[:6] == (
+        "sales",
+        "updated",
+        "App\\Models\\SalesOrder",
+        42,
+        "App\\Models\\User",
+        7,
+    )
+    assert json.loads(row[6]) == {
+        "status": ["draft", "approved"],
+        "org_id": 3,
+        "ip_address": "10.0.0.1",
+    }
+    assert row[7:9] == ("updated", None)
+    # Stamped with the time the job was queued, not the time it was read.
+    assert row[9] == row[10] == datetime(2026, 10, 17, 9, 30, 15)
+
+
+def test_spatie_payload_is_kept_as_is():
+    row = audit_row(
+        {
+            "log_name": "inventory",
+            "description": "Stock adjusted",
+            "subject_type": "App\\Models\\Product",
+            "subject_id": 5,
+            "causer_type": "App\\Models\\ApiClient",
+            "causer_id": 9,
+            "properties": {"attributes": {"qty": 4}},
+            "event": "adjusted",
+            "batch_uuid": "6f1c1f8e-7a7d-4c55-9b0e-1d2b3c4d5e6f",
+        }
+    )
+    assert row[:9] == (
+        "inventory",
+        "Stock adjusted",
+        "App\\Models\\Product",
+        5,
+        "App\\Models\\ApiClient",
+        9,
+        json.dumps({"attributes": {"qty": 4}}),
+        "adjusted",
+        "6f1c1f8e-7a7d-4c55-9b0e-1d2b3c4d5e6f",
+    )
+
+
+def test_loose_details_and_bad_timestamps_are_accepted():
+    row = audit_row({"action": "login", "details": "login ok", "queued_at": "soon"})
+    assert json.loads(row[6]) == {"details": "login ok"}
+    assert abs((row[9] - datetime.now()).total_seconds()) < 5
+
+    row = audit_row({"action": "export", "details": ["a", "b"], "queued_at": 1e20})
+    assert json.loads(row[6]) == {"details": ["a", "b"]}
+
+
+def test_malformed_job_fails_alone():
+    db = SQLiteConnection()
+    db.executescript(ACTIVITY_LOG_DDL)
+    pool = ConnectionPool(lambda: db, min_size=1, max_size=1)
+    pool.start()
+    settled = []
+    batcher = AuditLogBatcher(
+        pool, max_rows=10, on_flush=lambda *receipts: settled.append(receipts)
+    )
+    batcher.add_many(
+        [
+            {"action": "created", "user_id": 1},
+            {"action": "created", "details": {"file": object()}},
+            ["not", "a", "job"],
+            {"action": "created", "user_id": 2},
+        ],
+        ["good-1", "unserializable", "not-a-dict", "good-2"],
+    )
+    assert settled == [([], ["unserializable", "not-a-dict"])]
+    assert batcher.stats()["rows_buffered"] == 2
+
+    assert batcher.flush() == 2
+    assert settled[1] == (["good-1", "good-2"], [])
+    assert batcher.stats()["rows_dropped"] == 2
+
+
+def test_flush_writes_spatie_rows():
+    db = SQLiteConnection()
+    db.executescript(ACTIVITY_LOG_DDL)
+    pool = ConnectionPool(lambda: db, min_size=1, max_size=1)
+    pool.start()
+    batcher = AuditLogBatcher(pool, max_rows=10)
+    batcher.add_many(
+        [
+            {"action": "created", "module": "qa", "user_id": i, "queued_at": QUEUED_AT}
+            for i in range(3)
+        ]
+    )
+
+    assert batcher.flush() == 3
+    with db.cursor() as cursor:
+        cursor.execute(
+            "SELECT log_name, description, causer_id, created_at FROM activity_log"
+        )
+        rows = cursor.fetchall()
+    assert [row["causer_id"] for row in rows] == [0, 1, 2]
+    assert {row["created_at"] for row in rows} == {"2026-10-17 09:30:15"}
+
+
+def test_sigterm_stops_the_worker_cleanly(monkeypatch):
+    calls = []
+
+    class FakeWorker:
+        def start(self):
+            calls.append("start")
+            os.kill(os.getpid(), signal.SIGTERM)
+            calls.append("still running")
+
+        def stop(self):
+            calls.append("stop")
+
+    previous = signal.getsignal(signal.SIGTERM), signal.getsignal(signal.SIGINT)
+    monkeypatch.setattr(worker, "ERPWorker", FakeWorker)
+    try:
+        worker.main()
+    finally:
+        signal.signal(signal.SIGTERM, previous[0])
+        signal.signal(signal.SIGINT, previous[1])
+    assert calls == ["start", "stop"]
@@ -0,0 +1,78 @@
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import pytest
+
+from cache_codec import (
+    CODEC_MAGIC,
+    CODEC_VERSION,
+    FLAG_COMPRESSED,
+    HEADER,
+    ColumnarCodec,
+    decode_payload,
+    get_codec,
+)
+
+ROWS = [
+    {
+        "id": i,
+        "name": f"Unit {i}",
+        "standard_cost": Decimal("12.50") * i,
+        "updated_at": datetime(2026, 10, 17, 9, 30, i),
+        "commissioned_on": date(2020, 1, 1 + i),
+        "shift_length": timedelta(hours=8, minutes=i),
+        "settings": {"lines": i},
+        "closed_on": None if i % 2 else date(2026, 1, 1),
+    }
+    for i in range(1, 4)
+]
+
+
+def test_round_trip_keeps_value_types():
+    payload = ColumnarCodec(compress=False).encode(ROWS)
+    magic, version, flags = HEADER.unpack_from(payload)
+    assert (magic, version, flags) == (CODEC_MAGIC, CODEC_VERSION, 0)
+
+    decoded = decode_payload(payload)
+    assert decoded == ROWS
+    assert isinstance(decoded[0]["standard_cost"], Decimal)
+    assert str(decoded[1]["standard_cost"]) == "25.00"
+
+
+def test_large_payloads_are_compressed():
+    rows = ROWS * 200
+    codec = ColumnarCodec(compress_min_bytes=1024)
+    payload = codec.encode(rows)
+    assert HEADER.unpack_from(payload)[2] & FLAG_COMPRESSED
+    assert len(payload) < len(ColumnarCodec(compress=False).encode(rows)) / 5
+    assert codec.decode(payload) == rows
+
+    small = codec.encode(ROWS[:1])
+    assert not HEADER.unpack_from(small)[2] & FLAG_COMPRESSED
+
+
+def test_empty_and_mixed_columns():
+    codec = ColumnarCodec()
+    assert codec.decode(codec.encode([])) == []
+    # A column mixing types falls back to plain JSON values.
+    rows = [{"value": 1}, {"value": "two"}, {"value": None}]
+    assert codec.decode(codec.encode(rows)) == rows
+
+
+def test_unknown_version_and_foreign_payloads_are_rejected():
+    payload = ColumnarCodec().encode(ROWS)
+    newer = HEADER.pack(CODEC_MAGIC, CODEC_VERSION + 1, 0) + payload[HEADER.size :]
+    with pytest.raises(ValueError, match="version"):
+        ColumnarCodec().decode(newer)
+    with pytest.raises(ValueError, match="version"):
+        ColumnarCodec().decode(HEADER.pack(CODEC_MAGIC, 0, 0) + b"{}")
+    with pytest.raises(ValueError, match="not columnar"):
+        ColumnarCodec().decode(b"JSON" + payload[4:])
+    with pytest.raises(ValueError, match="Unknown cache codec"):
+        get_codec("msgpack")
+
+
+def test_legacy_json_payloads_still_decode():
+    legacy = get_codec("json").encode([{"id": 1, "cost": Decimal("1.5")}])
+    assert decode_payload(legacy) == [{"id": 1, "cost": "1.5"}]
+    assert decode_payload(legacy.decode()) == [{"id": 1, "cost": "1.5"}]
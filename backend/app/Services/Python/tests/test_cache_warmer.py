@@ -0,0 +1,115 @@
+import fakeredis
+import pytest
+from sqlite_db import SQLiteConnection
+
+from cache_codec import decode_payload
+from cache_warmer import CacheEntry, CacheWarmer
+
+ENTRY = CacheEntry(
+    "manufacturing_units",
+    "manufacturing_units",
+    ["id", "organization_id", "name", "status"],
+    where="deleted_at IS NULL",
+)
+
+
+@pytest.fixture
+def db():
+    connection = SQLiteConnection()
+    connection.executescript("""
+        CREATE TABLE manufacturing_units (
+            id INTEGER PRIMARY KEY, organization_id INTEGER, name TEXT,
+            status TEXT, updated_at TEXT, deleted_at TEXT
+        );
+        """)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            "INSERT INTO manufacturing_units (id, organization_id, name, status, updated_at) "
+            "VALUES (%s, %s, %s, 'active', '2026-10-17 09:00:00')",
+            [(i, 1 + i % 3, f"Plant {i}") for i in range(1, 10)],
+        )
+    connection.commit()
+    yield connection
+    connection.close()
+
+
+@pytest.fixture
+def redis_client():
+    # Decoded like the worker's client; payloads are read back raw.
+    server = fakeredis.FakeServer()
+    client = fakeredis.FakeRedis(server=server, decode_responses=True)
+    client.raw = fakeredis.FakeRedis(server=server)
+    return client
+
+
+def cached(redis_client, org_id):
+    payload = redis_client.raw.get(f"erp_cache:manufacturing_units:{org_id}")
+    return decode_payload(payload)
+
+
+def make_warmer(db, redis_client):
+    return CacheWarmer(
+        db, redis_client, key_prefix="erp_", entries={ENTRY.name: ENTRY}, chunk_rows=2
+    )
+
+
+def execute(db, query):
+    with db.cursor() as cursor:
+        cursor.execute(query)
+    db.commit()
+
+
+def test_first_run_caches_every_organization_in_chunks(db, redis_client):
+    totals = make_warmer(db, redis_client).run()
+    assert totals["misses"] == 3 and totals["hits"] == 0
+    rows = cached(redis_client, 1)
+    assert [row["id"] for row in rows] == [3, 6, 9]
+    assert redis_client.ttl("erp_cache:manufacturing_units:1") >= 3600
+
+
+def test_entries_that_are_not_stale_are_skipped(db, redis_client):
+    make_warmer(db, redis_client).run()
+    untouched = redis_client.raw.get("erp_cache:manufacturing_units:2")
+
+    execute(
+        db,
+        "UPDATE manufacturing_units SET name = 'Renamed', "
+        "updated_at = '2026-10-17 10:00:00' WHERE id = 3",
+    )
+    warmer = make_warmer(db, redis_client)
+    totals = warmer.run()
+    assert totals["misses"] == 1 and totals["hits"] == 2
+    assert totals["keys_written"] == 1
+    assert redis_client.raw.get("erp_cache:manufacturing_units:2") == untouched
+    rows = cached(redis_client, 1)
+    assert rows[0]["name"] == "Renamed"
+
+    # A soft delete moves the watermark even though the row leaves the set.
+    execute(
+        db,
+        "UPDATE manufacturing_units SET deleted_at = '2026-10-17 11:00:00', "
+        "updated_at = '2026-10-17 11:00:00' WHERE id = 4",
+    )
+    assert warmer.run()["misses"] == 1
+    rows = cached(redis_client, 2)
+    assert [row["id"] for row in rows] == [1, 7]
+
+
+def test_evicted_key_is_rebuilt_even_if_unchanged(db, redis_client):
+    make_warmer(db, redis_client).run()
+    redis_client.delete("erp_cache:manufacturing_units:3")
+    assert make_warmer(db, redis_client).run()["misses"] == 1
+    assert redis_client.exists("erp_cache:manufacturing_units:3")
+
+
+def test_keys_of_removed_organizations_are_evicted(db, redis_client):
+    make_warmer(db, redis_client).run()
+    execute(db, "DELETE FROM manufacturing_units WHERE organization_id = 2")
+
+    make_warmer(db, redis_client).run()
+    assert not redis_client.exists("erp_cache:manufacturing_units:2")
+    assert set(redis_client.hkeys("erp_cache:watermarks:manufacturing_units")) == {
+        "1",
+        "3",
+    }
+    assert redis_client.exists("erp_cache:manufacturing_units:1")
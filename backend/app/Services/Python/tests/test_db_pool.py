@@ -0,0 +1,171 @@
+import os
+
+import pymysql
+import pytest
+from mysql_stub import MySQLStub
+
+import worker
+from db_pool import ConnectionPool, is_disconnect
+
+QUERY = "UPDATE kpi_values SET trend = 'stable' WHERE id = 1"
+
+
+@pytest.fixture
+def server():
+    stub = MySQLStub()
+    yield stub
+    stub.close()
+
+
+def make_pool(server, ping_after=5):
+    def connect():
+        return pymysql.connect(
+            host="127.0.0.1",
+            port=server.port,
+            user="erp",
+            password="secret",
+            database="erp",
+            connect_timeout=2,
+            read_timeout=2,
+        )
+
+    pool = ConnectionPool(connect, min_size=1, max_size=2, ping_after=ping_after)
+    pool.start()
+    return pool
+
+
+def execute(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(QUERY)
+    return True
+
+
+def test_idle_connection_killed_between_queries_is_replaced_on_checkout(server):
+    pool = make_pool(server, ping_after=0)
+    pool.run(execute)
+    server.kill_all()
+
+    assert pool.run(execute)
+    assert pool.stats()["reconnects"] == 1
+    assert server.connections == 2
+    assert server.executed(QUERY) == 2
+    pool.close()
+
+
+def test_connection_killed_between_queries_is_retried_on_a_fresh_one(server):
+    # Inside ping_after the pool trusts the connection, so the first query
+    # on it is what finds the connection gone.
+    pool = make_pool(server, ping_after=60)
+    pool.run(execute)
+    server.kill_all()
+
+    assert pool.run(execute, retry=True)
+    stats = pool.stats()
+    assert stats["retries"] == 1
+    assert stats["discarded"] == 1
+    assert stats["size"] == 1
+    assert server.executed(QUERY) == 2
+    pool.close()
+
+
+def test_connection_killed_during_query_is_retried(server):
+    pool = make_pool(server)
+    server.kill_during_next_queries()
+
+    assert pool.run(execute, retry=True)
+    assert pool.stats()["retries"] == 1
+    assert server.executed(QUERY) == 1
+    pool.close()
+
+
+def test_connection_killed_during_query_is_not_retried_by_default(server):
+    pool = make_pool(server)
+    server.kill_during_next_queries()
+
+    with pytest.raises(pymysql.err.OperationalError) as raised:
+        pool.run(execute)
+    assert is_disconnect(raised.value)
+    stats = pool.stats()
+    assert stats["retries"] == 0
+    assert stats["discarded"] == 1
+    assert stats["size"] == 0
+    # The next checkout opens a fresh connection.
+    assert pool.run(execute)
+    pool.close()
+
+
+def test_only_one_retry(server):
+    pool = make_pool(server)
+    server.kill_during_next_queries(2)
+
+    with pytest.raises(pymysql.err.OperationalError):
+        pool.run(execute, retry=True)
+    assert pool.stats()["retries"] == 1
+    assert server.executed(QUERY) == 0
+    pool.close()
+
+
+def make_worker(server, monkeypatch):
+    erp_worker = worker.ERPWorker()
+    erp_worker.db_pool = make_pool(server)
+    calls = []
+
+    def handle_job(job_type, job_data):
+        calls.append(job_type)
+        execute(erp_worker.db_connection)
+
+    monkeypatch.setattr(erp_worker, "handle_job", handle_job)
+    return erp_worker, calls
+
+
+@pytest.mark.parametrize("job_type", sorted(worker.IDEMPOTENT_JOB_TYPES))
+def test_idempotent_job_is_retried_after_lost_connection(server, monkeypatch, job_type):
+    erp_worker, calls = make_worker(server, monkeypatch)
+    server.kill_during_next_queries()
+
+    assert erp_worker.process_job(job_type, {})
+    assert calls == [job_type, job_type]
+    assert server.executed(QUERY) == 1
+    assert erp_worker.db_pool.stats()["discarded"] == 1
+    assert erp_worker.db_pool.stats()["in_use"] == 0
+    erp_worker.db_pool.close()
+
+
+@pytest.mark.parametrize("job_type", ["audit_log", "email_notification"])
+def test_non_idempotent_job_is_not_retried(server, monkeypatch, job_type):
+    assert job_type not in worker.IDEMPOTENT_JOB_TYPES
+    erp_worker, calls = make_worker(server, monkeypatch)
+    server.kill_during_next_queries()
+
+    assert not erp_worker.process_job(job_type, {})
+    assert calls == [job_type]
+    assert server.executed(QUERY) == 0
+    assert erp_worker.db_pool.stats()["discarded"] == 1
+    assert erp_worker.db_pool.stats()["in_use"] == 0
+    erp_worker.db_pool.close()
+
+
+def test_idempotent_job_fails_on_other_errors_without_retry(server, monkeypatch):
+    erp_worker, calls = make_worker(server, monkeypatch)
+
+    def handle_job(job_type, job_data):
+        calls.append(job_type)
+        raise pymysql.err.IntegrityError(1062, "Duplicate entry")
+
+    monkeypatch.setattr(erp_worker, "handle_job", handle_job)
+    assert not erp_worker.process_job("kpi_calculation", {})
+    assert calls == ["kpi_calculation"]
+    assert erp_worker.db_pool.stats()["discarded"] == 0
+    erp_worker.db_pool.close()
+
+
+def test_grafana_connector_copy_matches():
+    # The Grafana container ships its own copy so it needs nothing from the
+    # backend tree; a change here has to be made there too.
+    services = os.path.dirname(os.path.abspath(worker.__file__))
+    source = os.path.join(services, "db_pool.py")
+    copy = os.path.join(
+        services, "..", "..", "..", "..", "docker", "grafana", "db_pool.py"
+    )
+    with open(source) as a, open(copy) as b:
+        assert a.read() == b.read()
@@ -0,0 +1,62 @@
+from datetime import date
+
+import numpy as np
+from sqlite_db import SQLiteConnection
+
+from forecasting import FORECAST_SPECS, ForecastEngine, SeriesSet, fit_forecast
+
+PREDICTIONS_DDL = """
+CREATE TABLE predictions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    org_id INTEGER, unit_id INTEGER, model_id INTEGER, prediction_type TEXT,
+    entity_type TEXT, entity_id INTEGER, prediction_date TIMESTAMP,
+    prediction_horizon_days INTEGER, predicted_value REAL,
+    confidence_lower REAL, confidence_upper REAL, confidence_percentage REAL,
+    actual_value REAL, status TEXT, created_at TIMESTAMP, updated_at TIMESTAMP
+);
+"""
+
+
+def run_month(engine, spec, start, periods):
+    rng = np.random.default_rng(periods)
+    values = rng.uniform(50, 100, (2, periods))
+    series = SeriesSet([(1, 10), (1, 11)], values, np.ones_like(values), start)
+    result = fit_forecast(values, spec.season_length, spec.horizon)
+    engine.store_predictions(spec, series, result, {1: 7})
+
+
+def rows(db, where=""):
+    with db.cursor() as cursor:
+        cursor.execute(
+            "SELECT entity_id, prediction_date, status FROM predictions " + where
+        )
+        return cursor.fetchall()
+
+
+def test_each_series_keeps_one_prediction_per_period():
+    db = SQLiteConnection()
+    db.executescript(PREDICTIONS_DDL)
+    engine = ForecastEngine(db)
+    spec = FORECAST_SPECS["demand"]
+    history = spec.history
+
+    # A full history window, then a month later with the window moved on.
+    run_month(engine, spec, date(2025, 1, 1), history)
+    run_month(engine, spec, date(2025, 1, 1), history)
+    assert len(rows(db)) == 2 * spec.horizon
+    assert all(row["status"] == "predicted" for row in rows(db))
+
+    run_month(engine, spec, date(2025, 2, 1), history)
+    served = rows(db, "WHERE status = 'predicted'")
+    expired = rows(db, "WHERE status = 'expired'")
+    assert len(served) == 2 * spec.horizon
+    # The forecast for the month that just passed stays for accuracy tracking.
+    assert len(expired) == 2
+    assert {row["prediction_date"][:10] for row in expired} == {"2027-01-01"}
+
+    # Runs long after drop expired rows that fell out of the history window.
+    for month in range(3, 3 + history + 2):
+        start = date(2025 + (month - 1) // 12, (month - 1) % 12 + 1, 1)
+        run_month(engine, spec, start, history)
+    assert len(rows(db)) <= 2 * (spec.horizon + history)
+    db.close()
@@ -0,0 +1,130 @@
+import time
+
+import fakeredis
+
+from job_coalescer import JobCoalescer
+
+PREFIX = "erp_jobs_queue:coalesce"
+
+
+def make_coalescer(ttl=900):
+    requeued = []
+    coalescer = JobCoalescer(
+        fakeredis.FakeRedis(decode_responses=True),
+        key_prefix=PREFIX,
+        ttl=ttl,
+        requeue=requeued.append,
+    )
+    return coalescer, requeued
+
+
+def job(queued_at, **data):
+    return {"job_type": "stock_rebuild", "queued_at": queued_at, **data}
+
+
+def test_collapse_keeps_the_newest_copy():
+    coalescer, _ = make_coalescer()
+    jobs = [
+        (job(10.0), "raw-10"),
+        (job(30.0), "raw-30"),
+        (job(20.0, full=True), "raw-full"),
+        (job(25.0), "raw-25"),
+    ]
+    kept, absorbed = coalescer.collapse("stock_rebuild", jobs)
+    assert [raw for _, raw in kept] == ["raw-full", "raw-30"]
+    assert sorted(raw for _, raw in absorbed) == ["raw-10", "raw-25"]
+
+    # Job types without idempotency keys are never merged.
+    kept, absorbed = coalescer.collapse("report_generation", jobs[:2])
+    assert len(kept) == 2 and absorbed == []
+
+
+def test_claim_while_locked_records_a_rerun_that_release_requeues():
+    coalescer, requeued = make_coalescer()
+    first = coalescer.claim("stock_rebuild", job(time.time() - 5))
+    assert first is not None
+
+    # Queued after the run started, so the run may have missed its changes.
+    late = job(time.time() + 1, reason="late")
+    assert coalescer.claim("stock_rebuild", late) is None
+    rerun_key = f"{PREFIX}:rerun:{first.key}"
+    assert coalescer.redis_client.exists(rerun_key)
+
+    coalescer.release(first, succeeded=True)
+    assert requeued == [{"job_type": "stock_rebuild", "reason": "late"}]
+    assert not coalescer.redis_client.exists(rerun_key)
+    assert not coalescer.redis_client.exists(f"{PREFIX}:lock:{first.key}")
+    assert float(coalescer.redis_client.get(f"{PREFIX}:last_run:{first.key}")) == (
+        first.started_at
+    )
+
+
+def test_claim_while_locked_drops_a_job_the_run_already_covers():
+    coalescer, requeued = make_coalescer()
+    early = job(time.time() - 10)
+    first = coalescer.claim("stock_rebuild", job(time.time() - 5))
+    assert coalescer.claim("stock_rebuild", early) is None
+    coalescer.release(first, succeeded=True)
+    assert requeued == []
+
+
+def test_job_queued_before_last_run_is_dropped():
+    coalescer, _ = make_coalescer()
+    queued_at = time.time() - 60
+    first = coalescer.claim("stock_rebuild", job(queued_at + 1))
+    coalescer.release(first, succeeded=True)
+
+    assert coalescer.claim("stock_rebuild", job(queued_at)) is None
+    # A copy queued after the last run started still runs.
+    second = coalescer.claim("stock_rebuild", job(time.time() + 1))
+    assert second is not None
+    coalescer.release(second, succeeded=False)
+
+
+def test_failed_run_does_not_cover_earlier_jobs():
+    coalescer, _ = make_coalescer()
+    queued_at = time.time() - 60
+    first = coalescer.claim("stock_rebuild", job(queued_at + 1))
+    coalescer.release(first, succeeded=False)
+    assert coalescer.claim("stock_rebuild", job(queued_at)) is not None
+
+
+def test_lock_is_renewed_while_the_job_runs():
+    coalescer, _ = make_coalescer(ttl=30)
+    claim = coalescer.claim("stock_rebuild", job(time.time()))
+    lock_key = f"{PREFIX}:lock:{claim.key}"
+    coalescer.redis_client.expire(lock_key, 2)
+    coalescer.redis_client.set(f"{PREFIX}:rerun:{claim.key}", "{}", ex=2)
+
+    coalescer.renew_all()
+    assert coalescer.redis_client.ttl(lock_key) > 20
+    assert coalescer.redis_client.ttl(f"{PREFIX}:rerun:{claim.key}") > 20
+
+    coalescer.release(claim, succeeded=True)
+    assert coalescer.active == {}
+
+
+def test_renewal_does_not_take_back_a_lock_held_by_another_run():
+    coalescer, _ = make_coalescer()
+    claim = coalescer.claim("stock_rebuild", job(time.time()))
+    lock_key = f"{PREFIX}:lock:{claim.key}"
+    coalescer.redis_client.set(lock_key, "someone-else|0")
+
+    assert not coalescer.renew(claim)
+    coalescer.renew_all()
+    assert coalescer.active == {}
+    assert coalescer.redis_client.get(lock_key) == "someone-else|0"
+    assert coalescer.redis_client.ttl(lock_key) == -1
+
+
+def test_renewer_thread_keeps_a_long_run_locked():
+    coalescer, _ = make_coalescer(ttl=1)
+    coalescer.start()
+    try:
+        claim = coalescer.claim("kpi_analytics", {"kpi_id": 4})
+        time.sleep(2.5)
+        # Without renewal the lock would have expired twice over.
+        assert coalescer.claim("kpi_analytics", {"kpi_id": 4}) is None
+        coalescer.release(claim, succeeded=True)
+    finally:
+        coalescer.stop()
@@ -0,0 +1,143 @@
+import threading
+import time
+
+from job_pool import JobPool, parse_type_limits
+
+
+class Handler:
+    """Runs jobs until released, tracking how many of each type overlap."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.release = threading.Event()
+        self.running = {}
+        self.peak = {}
+        self.done = []
+
+    def __call__(self, job_type, job_id):
+        with self.lock:
+            self.running[job_type] = self.running.get(job_type, 0) + 1
+            self.peak[job_type] = max(
+                self.peak.get(job_type, 0), self.running[job_type]
+            )
+        if job_type != "audit_log":
+            self.release.wait(5)
+        with self.lock:
+            self.running[job_type] -= 1
+            self.done.append(job_id)
+        return job_id != "fail"
+
+
+def wait_until(predicate, timeout=2):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.005)
+    return False
+
+
+def test_parse_type_limits():
+    assert parse_type_limits(" report_generation=2, forecast=1,") == {
+        "report_generation": 2,
+        "forecast": 1,
+    }
+    assert parse_type_limits("") == {}
+
+
+def test_type_limit_caps_concurrency_but_not_other_types():
+    handler = Handler()
+    pool = JobPool(handler, workers=4, type_limits={"report_generation": 2})
+    pool.start()
+    for i in range(5):
+        assert pool.submit("report_generation", i, timeout=1)
+    assert wait_until(lambda: pool.stats()["running"] == {"report_generation": 2})
+    for i in range(2):
+        assert pool.submit("kpi_calculation", f"kpi-{i}", timeout=1)
+    assert wait_until(lambda: handler.running.get("kpi_calculation") == 2)
+    assert pool.stats()["pending"] == 3
+
+    handler.release.set()
+    pool.shutdown()
+    assert handler.peak == {"report_generation": 2, "kpi_calculation": 2}
+    assert pool.stats()["completed"] == 7
+
+
+def test_backlog_of_a_limited_type_does_not_block_other_types():
+    handler = Handler()
+    pool = JobPool(
+        handler, workers=4, type_limits={"report_generation": 2}, max_pending=8
+    )
+    pool.start()
+    for i in range(10):
+        assert pool.submit("report_generation", i, timeout=1)
+    assert wait_until(lambda: handler.running.get("report_generation") == 2)
+
+    started = time.monotonic()
+    assert pool.submit("audit_log", "audit", timeout=2)
+    assert time.monotonic() - started < 0.5
+    assert wait_until(lambda: "audit" in handler.done)
+    assert pool.stats()["backpressure_waits"] == 0
+
+    # The limited type is still bounded: an eleventh report has to wait.
+    assert not pool.submit("report_generation", 10, timeout=0.1)
+    assert pool.stats()["backpressure_waits"] == 1
+
+    handler.release.set()
+    pool.shutdown()
+    assert handler.peak["report_generation"] == 2
+    assert len(handler.done) == 11
+
+
+def test_submit_blocks_when_runnable_backlog_is_full():
+    handler = Handler()
+    pool = JobPool(handler, workers=1, max_pending=2)
+    pool.start()
+    assert pool.submit("kpi_calculation", 0, timeout=1)
+    assert wait_until(lambda: handler.running.get("kpi_calculation") == 1)
+    assert pool.submit("kpi_calculation", 1, timeout=1)
+    assert pool.submit("forecast", 2, timeout=1)
+
+    assert not pool.submit("forecast", 3, timeout=0.1)
+    assert pool.stats()["backpressure_waits"] == 1
+
+    # A slot frees up as soon as the running job finishes.
+    admitted = []
+    submitter = threading.Thread(
+        target=lambda: admitted.append(pool.submit("forecast", 3, timeout=2))
+    )
+    submitter.start()
+    handler.release.set()
+    submitter.join()
+    assert admitted == [True]
+    pool.shutdown()
+    assert sorted(map(str, handler.done)) == ["0", "1", "2", "3"]
+
+
+def test_shutdown_drains_pending_jobs_and_rejects_new_ones():
+    handler = Handler()
+    finalized = []
+    pool = JobPool(
+        handler,
+        workers=2,
+        type_limits={"stock_rebuild": 1},
+        finalizer=lambda: finalized.append(True),
+    )
+    pool.start()
+    for i in range(3):
+        assert pool.submit("stock_rebuild", i, timeout=1)
+    assert pool.submit("stock_rebuild", "fail", timeout=1)
+
+    stopper = threading.Thread(target=pool.shutdown)
+    stopper.start()
+    assert wait_until(lambda: pool.stopping)
+    assert not pool.submit("stock_rebuild", 4, timeout=1)
+    handler.release.set()
+    stopper.join()
+
+    stats = pool.stats()
+    assert handler.done == [0, 1, 2, "fail"]
+    assert stats["completed"] == 3
+    assert stats["failed"] == 1
+    assert stats["pending"] == 0
+    assert finalized == [True, True]
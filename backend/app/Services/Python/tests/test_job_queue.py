@@ -0,0 +1,174 @@
+import json
+import threading
+import time
+
+import fakeredis
+import pytest
+
+from job_queue import PROMOTE_BATCH, PriorityLanes, ReliableJobQueue, SimpleJobQueue
+
+QUEUE = "test_jobs"
+
+
+def make_queue(client, mode, **lanes_options):
+    lanes = PriorityLanes(client, QUEUE, promote_interval=0.01, **lanes_options)
+    if mode == "reliable":
+        return ReliableJobQueue(client, QUEUE, "worker-a", lanes=lanes)
+    return SimpleJobQueue(client, QUEUE, lanes=lanes)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+@pytest.mark.parametrize("mode", ["simple", "reliable"])
+def test_high_lane_latency_holds_under_a_bulk_flood(mode):
+    client = fakeredis.FakeRedis(decode_responses=True)
+    queue = make_queue(client, mode)
+    backlog = 2000
+    for i in range(backlog):
+        queue.push({"job_type": "kpi_analytics", "kpi_id": i})
+    assert client.llen(f"{QUEUE}:bulk") == backlog
+
+    high_jobs = 100
+
+    def produce():
+        for i in range(high_jobs):
+            queue.push({"job_type": "report_generation", "seq": i})
+            time.sleep(0.002)
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    waits, bulk_done = [], 0
+    while len(waits) < high_jobs:
+        raw_job = queue.fetch(timeout=2)
+        assert raw_job is not None
+        queue.ack(raw_job)
+        data = json.loads(raw_job)
+        if data["job_type"] == "report_generation":
+            waits.append(time.time() - data["queued_at"])
+        else:
+            bulk_done += 1
+            # Stand-in for the bulk job's own work.
+            time.sleep(0.001)
+    producer.join()
+
+    # Drained in FIFO order the high jobs would wait behind the whole
+    # backlog, about two seconds of bulk work.
+    assert percentile(waits, 0.99) < 0.1
+    assert bulk_done < backlog / 2
+
+
+def test_lanes_share_fetches_by_weight():
+    client = fakeredis.FakeRedis(decode_responses=True)
+    queue = make_queue(client, "simple")
+    for lane in ("high", "default", "bulk"):
+        for i in range(100):
+            queue.push({"job_type": "test", "priority": lane, "seq": i})
+
+    fetched = [json.loads(queue.fetch(timeout=1))["priority"] for _ in range(100)]
+    assert {lane: fetched.count(lane) for lane in set(fetched)} == {
+        "high": 60,
+        "default": 30,
+        "bulk": 10,
+    }
+
+
+@pytest.mark.parametrize("mode", ["simple", "reliable"])
+def test_delayed_job_runs_once_due(mode):
+    client = fakeredis.FakeRedis(decode_responses=True)
+    queue = make_queue(client, mode)
+    run_at = time.time() + 0.2
+    queue.push({"job_type": "cache_warmup"}, run_at=run_at)
+
+    assert queue.fetch(timeout=0.05) is None
+    assert client.zcard(f"{QUEUE}:delayed") == 1
+
+    raw_job = queue.fetch(timeout=2)
+    assert time.time() >= run_at
+    data = json.loads(raw_job)
+    assert data == {"job_type": "cache_warmup", "queued_at": run_at}
+    assert client.zcard(f"{QUEUE}:delayed") == 0
+    # Promoted onto its own lane.
+    assert queue.fetch(timeout=0.05) is None
+
+
+def test_promote_due_respects_the_interval():
+    client = fakeredis.FakeRedis(decode_responses=True)
+    lanes = PriorityLanes(client, QUEUE, promote_interval=60)
+    assert lanes.promote_due() == 0
+    lanes.push({"job_type": "forecast"}, run_at=time.time() + 0.01)
+    time.sleep(0.02)
+    assert lanes.promote_due() == 0
+    lanes.next_promotion = 0
+    assert lanes.promote_due() == 1
+
+
+def test_contending_worker_loses_the_race_without_duplicating():
+    server = fakeredis.FakeServer()
+    client_a = fakeredis.FakeRedis(server=server, decode_responses=True)
+    client_b = fakeredis.FakeRedis(server=server, decode_responses=True)
+    lanes_a = PriorityLanes(client_a, QUEUE, promote_interval=0)
+    lanes_b = PriorityLanes(client_b, QUEUE, promote_interval=0)
+    for i in range(10):
+        lanes_a.push({"job_type": "forecast", "seq": i}, run_at=time.time() + 0.01)
+    time.sleep(0.02)
+
+    # Worker B promotes everything between worker A's read and its
+    # transaction, so A's MULTI is discarded and its re-read finds nothing.
+    raced = []
+    pipeline = client_a.pipeline
+
+    def interleaved_pipeline(*args, **kwargs):
+        pipe = pipeline(*args, **kwargs)
+        read = pipe.zrangebyscore
+
+        def zrangebyscore(*args, **kwargs):
+            due = read(*args, **kwargs)
+            if not raced:
+                raced.append(lanes_b.promote_due())
+            return due
+
+        pipe.zrangebyscore = zrangebyscore
+        return pipe
+
+    client_a.pipeline = interleaved_pipeline
+
+    assert lanes_a.promote_due() == 0
+    assert raced == [10]
+    bulk = client_a.lrange(f"{QUEUE}:bulk", 0, -1)
+    assert sorted(json.loads(raw_job)["seq"] for raw_job in bulk) == list(range(10))
+    assert client_a.zcard(f"{QUEUE}:delayed") == 0
+
+
+def test_concurrent_promoters_move_each_job_exactly_once():
+    server = fakeredis.FakeServer()
+    jobs = PROMOTE_BATCH * 5 + 7
+    seed = fakeredis.FakeRedis(server=server, decode_responses=True)
+    seed_lanes = PriorityLanes(seed, QUEUE)
+    for i in range(jobs):
+        seed_lanes.push({"job_type": "forecast", "seq": i}, run_at=time.time() + 0.01)
+    time.sleep(0.02)
+
+    promoted = []
+    barrier = threading.Barrier(4)
+
+    def promote():
+        lanes = PriorityLanes(
+            fakeredis.FakeRedis(server=server, decode_responses=True),
+            QUEUE,
+            promote_interval=0,
+        )
+        barrier.wait()
+        promoted.append(lanes.promote_due())
+
+    threads = [threading.Thread(target=promote) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(promoted) == jobs
+    bulk = seed.lrange(f"{QUEUE}:bulk", 0, -1)
+    assert sorted(json.loads(raw_job)["seq"] for raw_job in bulk) == list(range(jobs))
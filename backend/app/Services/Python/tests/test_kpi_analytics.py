@@ -0,0 +1,111 @@
+from datetime import date, timedelta
+
+import pandas as pd
+import pytest
+from sqlite_db import SQLiteConnection
+
+import kpi_analytics
+from kpi_analytics import KpiHistoryAnalyzer, compute_kpi_analytics
+from kpi_engine import derive_kpi_fields
+
+KPI_VALUES_DDL = """
+CREATE TABLE kpi_values (
+    id INTEGER PRIMARY KEY, kpi_id INTEGER, org_id INTEGER, unit_id INTEGER,
+    record_date TEXT, actual_value REAL, target_value REAL, variance REAL,
+    variance_percentage REAL, achievement_percentage REAL, trend TEXT,
+    rolling_trend TEXT
+);
+"""
+
+
+def history(actuals, targets):
+    start = date(2026, 1, 1)
+    return pd.DataFrame(
+        {
+            "id": range(1, len(actuals) + 1),
+            "kpi_id": 1,
+            "org_id": 1,
+            "unit_id": pd.array([pd.NA] * len(actuals), dtype="Int64"),
+            "record_date": [start + timedelta(days=i) for i in range(len(actuals))],
+            "actual_value": actuals,
+            "target_value": targets,
+        }
+    )
+
+
+def test_variance_matches_kpi_engine():
+    actuals = [10.0, 12.345, 0.0, 7.0, 2000.0, 5.0]
+    targets = [8.0, 12.0, 0.0, float("nan"), 1.0, -3.0]
+    frame = compute_kpi_analytics(history(actuals, targets))
+
+    for row, actual, target in zip(frame.itertuples(), actuals, targets):
+        expected = derive_kpi_fields(
+            actual, None if pd.isna(target) else target, 0, None
+        )[:3]
+        got = tuple(
+            None if pd.isna(value) else value
+            for value in (
+                row.variance,
+                row.variance_percentage,
+                row.achievement_percentage,
+            )
+        )
+        assert got == pytest.approx(expected)
+
+
+def test_rolling_trend_leaves_trend_alone():
+    frame = compute_kpi_analytics(history([1.0, 2.0, 3.0, 4.0], [1.0] * 4))
+    assert "trend" not in frame.columns
+    assert pd.isna(frame["rolling_trend"].iloc[0])
+    assert frame["rolling_trend"].iloc[1:].tolist() == ["improving"] * 3
+
+
+@pytest.fixture
+def db(monkeypatch):
+    connection = SQLiteConnection()
+    connection.executescript(KPI_VALUES_DDL)
+    monkeypatch.setattr(
+        kpi_analytics,
+        "KPI_HISTORY_UPDATE_QUERY",
+        "UPDATE kpi_values SET variance = s.variance, "
+        "variance_percentage = s.variance_percentage, "
+        "achievement_percentage = s.achievement_percentage, "
+        "rolling_trend = s.rolling_trend "
+        "FROM kpi_analytics_stage s WHERE s.id = kpi_values.id",
+    )
+    yield connection
+    connection.close()
+
+
+def rows(db):
+    with db.cursor() as cursor:
+        cursor.execute("SELECT * FROM kpi_values ORDER BY id")
+        return cursor.fetchall()
+
+
+def test_write_back_updates_existing_rows_only(db):
+    frame = history([10.0, 11.0, 12.0], [10.0] * 3)
+    with db.cursor() as cursor:
+        cursor.executemany(
+            "INSERT INTO kpi_values (id, kpi_id, org_id, record_date, actual_value, "
+            "target_value, trend) VALUES (%s, 1, 1, %s, %s, %s, 'stable')",
+            [
+                (row.id, row.record_date.isoformat(), row.actual_value, 10.0)
+                for row in frame.itertuples()
+            ],
+        )
+        # Deleted between the read and the write-back.
+        cursor.execute("DELETE FROM kpi_values WHERE id = 2")
+    db.commit()
+
+    analyzer = KpiHistoryAnalyzer(db)
+    assert analyzer.write_chunk(compute_kpi_analytics(frame)) == 3
+    # A second chunk on the same connection starts from an empty stage.
+    assert analyzer.write_chunk(compute_kpi_analytics(frame.iloc[:1])) == 1
+
+    stored = rows(db)
+    assert [row["id"] for row in stored] == [1, 3]
+    assert stored[1]["variance"] == 2.0
+    assert stored[1]["achievement_percentage"] == 120.0
+    assert stored[1]["rolling_trend"] == "improving"
+    assert all(row["trend"] == "stable" for row in stored)
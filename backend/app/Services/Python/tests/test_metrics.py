@@ -0,0 +1,131 @@
+import threading
+from contextlib import contextmanager
+
+import worker
+from audit_batcher import AuditLogBatcher
+from metrics import WorkerMetrics, record_io
+
+
+def label_values(metrics, name):
+    return {
+        sample.labels["job_type"]
+        for family in metrics.registry.collect()
+        if family.name == name
+        for sample in family.samples
+    }
+
+
+def test_job_types_without_a_handler_share_one_label():
+    metrics = WorkerMetrics(job_types={"kpi_calculation", "audit_log"})
+    with metrics.job("kpi_calculation"):
+        pass
+    for i in range(50):
+        with metrics.job(f"made_up_{i}"):
+            pass
+    metrics.coalesced("another_made_up")
+
+    assert label_values(metrics, "erp_jobs") == {"kpi_calculation", "unknown"}
+    assert label_values(metrics, "erp_jobs_coalesced") == {"unknown"}
+    assert set(metrics.children) == {"kpi_calculation", "unknown"}
+    assert (
+        metrics.registry.get_sample_value(
+            "erp_jobs_total", {"job_type": "unknown", "status": "success"}
+        )
+        == 50
+    )
+
+
+def test_worker_labels_only_the_job_types_it_handles(monkeypatch):
+    monkeypatch.setattr(worker, "METRICS_ENABLED", True)
+    erp_worker = worker.ERPWorker()
+    assert erp_worker.metrics.job_types == set(erp_worker.handlers)
+    assert erp_worker.metrics.label("report_generation") == "report_generation"
+    assert erp_worker.metrics.label("drop_tables") == "unknown"
+
+    # Unknown jobs are still logged and skipped rather than failed.
+    assert erp_worker.process_job("drop_tables", {})
+
+
+class RecordingPool:
+    """Stands in for the DB pool; every statement reports db I/O time."""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+
+    @contextmanager
+    def connection(self):
+        yield self
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        record_io("db", 0.25)
+        if self.fail:
+            raise RuntimeError("table is read only")
+
+    def executemany(self, query, rows):
+        self.execute(query)
+
+    def commit(self):
+        pass
+
+
+def sample(metrics, name, **labels):
+    return metrics.registry.get_sample_value(name, labels) or 0
+
+
+def test_buffered_jobs_are_measured_when_flushed():
+    metrics = WorkerMetrics(job_types={"audit_log"})
+    settled = threading.Event()
+    batcher = AuditLogBatcher(
+        RecordingPool(),
+        max_delay=0.02,
+        on_flush=lambda *receipts: settled.set(),
+        metrics=metrics,
+    )
+    batcher.add_many([{"action": "created"}] * 3, ["a", "b", "c"])
+    assert (
+        sample(metrics, "erp_jobs_total", job_type="audit_log", status="success") == 0
+    )
+
+    # Written by the batcher's own flusher thread, not the one that added them.
+    batcher.start()
+    assert settled.wait(2)
+    batcher.close()
+    assert (
+        sample(metrics, "erp_jobs_total", job_type="audit_log", status="success") == 3
+    )
+    assert sample(metrics, "erp_job_duration_seconds_count", job_type="audit_log") == 1
+    assert (
+        sample(metrics, "erp_job_io_seconds_total", job_type="audit_log", backend="db")
+        == 0.25
+    )
+
+
+def test_buffered_jobs_that_fail_to_write_are_counted_as_failures():
+    metrics = WorkerMetrics(job_types={"audit_log"})
+    batcher = AuditLogBatcher(RecordingPool(fail=True), metrics=metrics)
+    batcher.add_many([{"action": "created"}] * 2 + [["malformed"]])
+    assert (
+        sample(metrics, "erp_jobs_total", job_type="audit_log", status="failure") == 1
+    )
+
+    assert batcher.flush() == 0
+    assert (
+        sample(metrics, "erp_jobs_total", job_type="audit_log", status="failure") == 3
+    )
+    assert (
+        sample(metrics, "erp_jobs_total", job_type="audit_log", status="success") == 0
+    )
+    # The batch insert and both row-by-row retries.
+    assert (
+        sample(metrics, "erp_job_io_seconds_total", job_type="audit_log", backend="db")
+        == 0.75
+    )
@@ -0,0 +1,87 @@
+from contextlib import contextmanager
+
+from notification_delivery import NotificationDelivery
+
+
+class FakeSMTPPool:
+    size = 2
+    connections_opened = 1
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, message):
+        self.sent.append(message["To"])
+
+
+class FakeCursor:
+    def __init__(self, executed):
+        self.executed = executed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params):
+        self.executed.append((query.split()[0], list(params)))
+
+    def fetchall(self):
+        return []
+
+
+class FakeConnection:
+    def __init__(self, executed):
+        self.executed = executed
+
+    def cursor(self):
+        return FakeCursor(self.executed)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class FakeDBPool:
+    def __init__(self):
+        self.executed = []
+
+    @contextmanager
+    def connection(self):
+        yield FakeConnection(self.executed)
+
+
+def test_unbuildable_digest_fails_alone_and_statuses_are_recorded():
+    db_pool, smtp_pool = FakeDBPool(), FakeSMTPPool()
+    delivery = NotificationDelivery(db_pool, smtp_pool, "noreply@erp.local")
+    delivery.add_many(
+        [
+            {"notification_id": 1, "to": "a@erp.local", "subject": "Stock low"},
+            {
+                "notification_id": 2,
+                "to": "b@erp.local",
+                "subject": "Injected\r\nBcc: victim@example.com",
+            },
+            {"notification_id": 3, "to": "c@erp.local", "subject": "KPI missed"},
+        ]
+    )
+
+    assert delivery.flush(force=True) == 2
+    assert sorted(smtp_pool.sent) == ["a@erp.local", "c@erp.local"]
+    assert delivery.pending == {}
+
+    sent_update, failed_update = sorted(db_pool.executed, key=lambda q: len(q[1]))[::-1]
+    assert sent_update[1][2:] == [1, 3]
+    error, retries, failed_id = failed_update[1]
+    assert failed_id == 2 and retries == 0
+    assert "linefeed" in error.lower() or "newline" in error.lower()
+    stats = delivery.stats()
+    assert stats["notifications_sent"] == 2
+    assert stats["notifications_failed"] == 1
+
+    # Nothing is left to resend on the next flush.
+    assert delivery.flush(force=True) == 0
+    assert len(smtp_pool.sent) == 2
@@ -0,0 +1,57 @@
+import os
+
+import pytest
+
+from report_engine import REPORTS, ReportEngine
+
+DEFINITION = REPORTS["stock_ledger"]
+
+
+@pytest.fixture
+def engine(tmp_path):
+    return ReportEngine(None, storage_path=str(tmp_path / "reports"))
+
+
+def test_output_path_stays_under_the_storage_root(engine):
+    path = engine.output_path("2026-10_q3", DEFINITION, "csv", "12")
+    assert path == os.path.join(
+        engine.storage_path, "12", "stock_ledger_2026-10_q3.csv"
+    )
+    assert os.path.isdir(os.path.dirname(path))
+
+
+@pytest.mark.parametrize(
+    "report_id", ["../../etc/passwd", "a/b", "..", "", "x" * 65, "r\x00", 5, None]
+)
+def test_unsafe_report_ids_are_rejected(engine, report_id):
+    with pytest.raises(ValueError):
+        engine.output_path(report_id, DEFINITION, "csv", 1)
+
+
+@pytest.mark.parametrize("org_id", ["../1", "1/..", "-1", 0, "1.5", 2.0, True, None])
+def test_non_integer_org_ids_are_rejected(engine, org_id):
+    with pytest.raises(ValueError):
+        engine.output_path("r1", DEFINITION, "csv", org_id)
+
+
+def test_symlinked_org_directory_cannot_escape(engine, tmp_path):
+    outside = tmp_path / "outside"
+    outside.mkdir()
+    os.makedirs(engine.storage_path)
+    os.symlink(outside, os.path.join(engine.storage_path, "7"))
+    with pytest.raises(ValueError):
+        engine.output_path("r1", DEFINITION, "csv", 7)
+
+
+def test_generate_validates_before_touching_anything(engine):
+    with pytest.raises(ValueError, match="report_id"):
+        engine.generate(
+            {
+                "report": "stock_ledger",
+                "org_id": 1,
+                "report_id": "../../escape",
+                "date_from": "2026-01-01",
+                "date_to": "2026-02-01",
+            }
+        )
+    assert not os.path.exists(engine.storage_path)
@@ -0,0 +1,176 @@
+import fakeredis
+import pytest
+from sqlite_db import SQLiteConnection
+
+from rollup_engine import ROLLUP_DEFINITIONS, RollupEngine, day_ranges
+
+DEFINITIONS = {
+    name: ROLLUP_DEFINITIONS[name]
+    for name in ("inspections_result", "inspections_daily")
+}
+
+
+@pytest.fixture
+def db():
+    connection = SQLiteConnection()
+    connection.executescript("""
+        CREATE TABLE inspections (
+            id INTEGER PRIMARY KEY, organization_id INTEGER, result TEXT,
+            inspection_date TEXT, created_at TEXT, updated_at TEXT, deleted_at TEXT
+        );
+        CREATE TABLE rollup_status_counts (
+            id INTEGER PRIMARY KEY, rollup TEXT, organization_id INTEGER,
+            dimension TEXT, value INTEGER, updated_at TEXT,
+            UNIQUE (rollup, organization_id, dimension)
+        );
+        CREATE TABLE rollup_daily_counts (
+            id INTEGER PRIMARY KEY, rollup TEXT, organization_id INTEGER, day TEXT,
+            dimension TEXT, value INTEGER, updated_at TEXT,
+            UNIQUE (rollup, organization_id, day, dimension)
+        );
+        """)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            "INSERT INTO inspections (id, organization_id, result, inspection_date, "
+            "created_at, updated_at) VALUES (%s, %s, %s, %s, %s, '2026-10-01 00:00:00')",
+            [
+                (
+                    i,
+                    1 + i % 2,
+                    "pass" if i % 3 else "fail",
+                    f"2026-09-{1 + i % 10:02d}",
+                    f"2026-09-{1 + i % 10:02d} 08:00:00",
+                )
+                for i in range(1, 61)
+            ],
+        )
+    connection.commit()
+    yield connection
+    connection.close()
+
+
+def make_engine(db):
+    return RollupEngine(db, fakeredis.FakeRedis(decode_responses=True), DEFINITIONS)
+
+
+def update(db, query, params=()):
+    with db.cursor() as cursor:
+        cursor.execute(query, params)
+    db.commit()
+
+
+def stored(db, table):
+    with db.cursor() as cursor:
+        cursor.execute(f"SELECT * FROM {table} ORDER BY id")
+        return cursor.fetchall()
+
+
+class RecordingConnection:
+    def __init__(self, db):
+        self.db = db
+        self.queries = []
+
+    def cursor(self):
+        recording = self
+        cursor = self.db.cursor()
+        execute = cursor.execute
+
+        def record(query, params=()):
+            recording.queries.append(query)
+            return execute(query, params)
+
+        cursor.execute = record
+        return cursor
+
+    def commit(self):
+        self.db.commit()
+
+    def rollback(self):
+        self.db.rollback()
+
+
+def test_day_ranges_merge_consecutive_days():
+    assert day_ranges({"2026-09-03", "2026-09-01", "2026-09-02", "2026-09-07"}) == [
+        ("2026-09-01", "2026-09-04"),
+        ("2026-09-07", "2026-09-08"),
+    ]
+
+
+def test_first_run_matches_the_source(db):
+    engine = make_engine(db)
+    assert engine.run() > 0
+    assert engine.verify() == {}
+
+
+def test_change_recounts_only_its_buckets(db):
+    engine = make_engine(db)
+    engine.run()
+    before = {row["id"]: row for row in stored(db, "rollup_daily_counts")}
+
+    # Inspection 3 (org 2, 2026-09-04) flips from fail to pass.
+    update(
+        db,
+        "UPDATE inspections SET result = 'pass', updated_at = '2026-10-02 00:00:00' "
+        "WHERE id = 3",
+    )
+    recording = RecordingConnection(db)
+    engine.db_connection = recording
+    engine.run()
+    engine.db_connection = db
+
+    assert engine.verify() == {}
+    after = stored(db, "rollup_daily_counts")
+    rewritten = {
+        (row["rollup"], row["organization_id"], row["day"])
+        for row in after
+        if row["id"] not in before
+    }
+    assert rewritten == {
+        ("inspections_result:created", 2, "2026-09-04"),
+        ("inspections_daily", 2, "2026-09-04"),
+    }
+    # Neither the bucket recount nor the status sum aggregates the whole
+    # source table.
+    aggregates = [q for q in recording.queries if "GROUP BY" in q]
+    assert aggregates
+    for query in aggregates:
+        assert "FROM rollup_daily_counts" in query or "organization_id IN" in query
+
+
+def test_soft_delete_and_new_rows_are_counted(db):
+    engine = make_engine(db)
+    engine.run()
+    update(
+        db,
+        "UPDATE inspections SET deleted_at = '2026-10-02 00:00:00', "
+        "updated_at = '2026-10-02 00:00:00' WHERE id IN (1, 2)",
+    )
+    update(
+        db,
+        "INSERT INTO inspections (id, organization_id, result, inspection_date, "
+        "created_at, updated_at) VALUES (100, 3, 'fail', '2026-10-02', "
+        "'2026-10-02 09:00:00', '2026-10-02 09:00:00')",
+    )
+    engine.run()
+    assert engine.verify() == {}
+    status = {
+        (row["organization_id"], row["dimension"]): row["value"]
+        for row in stored(db, "rollup_status_counts")
+    }
+    assert status[(3, "fail")] == 1
+    assert sum(status.values()) == 59
+
+
+def test_row_moved_to_another_day_is_repaired_by_a_full_run(db):
+    engine = make_engine(db)
+    engine.run()
+    update(
+        db,
+        "UPDATE inspections SET inspection_date = '2026-09-20', "
+        "updated_at = '2026-10-02 00:00:00' WHERE id = 5",
+    )
+    engine.run()
+    assert set(engine.verify()) == {"inspections_daily"}
+
+    engine.run(full=True)
+    assert engine.verify() == {}
@@ -0,0 +1,142 @@
+from datetime import datetime, timedelta
+
+import fakeredis
+import pytest
+
+from scheduler import CronSpec, ScheduledTask, Scheduler
+
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, **delta):
+        self.now += timedelta(**delta)
+
+
+@pytest.mark.parametrize(
+    "expression, weekdays",
+    [
+        ("0 0 * * 7", {0}),
+        ("0 0 * * 0", {0}),
+        ("0 0 * * 0,7", {0}),
+        ("0 0 * * 5-7", {0, 5, 6}),
+        ("0 0 * * 1-5", {1, 2, 3, 4, 5}),
+    ],
+)
+def test_sunday_may_be_written_as_7(expression, weekdays):
+    assert CronSpec(expression).weekdays == weekdays
+
+
+@pytest.mark.parametrize("expression", ["0 0 * * 8", "60 * * * *", "0 0 * *"])
+def test_invalid_expressions_are_rejected(expression):
+    with pytest.raises(ValueError):
+        CronSpec(expression)
+
+
+def test_next_after_sunday_midnight():
+    # 2026-10-17 is a Saturday.
+    spec = CronSpec("0 0 * * 7")
+    assert spec.next_after(datetime(2026, 10, 17, 12, 0)) == datetime(2026, 10, 18)
+
+
+def make_scheduler(redis_client, worker_id, clock, dispatched, catch_up="once"):
+    return Scheduler(
+        redis_client,
+        lambda job_type, data: dispatched.append((worker_id, job_type, data)),
+        worker_id,
+        tasks=[
+            ScheduledTask("hourly", "0 * * * *", "kpi_calculation", catch_up=catch_up)
+        ],
+        lease_ttl=30,
+        clock=clock,
+    )
+
+
+@pytest.fixture
+def redis_client():
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+def test_clock_drives_firing(redis_client):
+    clock, dispatched = Clock(datetime(2026, 10, 17, 9, 30)), []
+    scheduler = make_scheduler(redis_client, "worker-a", clock, dispatched)
+
+    # The first tick only records where counting starts.
+    assert scheduler.tick() == []
+    clock.advance(minutes=29)
+    assert scheduler.tick() == []
+    clock.advance(minutes=1)
+    assert scheduler.tick() == [("hourly", datetime(2026, 10, 17, 10, 0))]
+    assert dispatched == [
+        ("worker-a", "kpi_calculation", {"scheduled_for": "2026-10-17T10:00:00"})
+    ]
+    assert scheduler.tick() == []
+    assert scheduler.seconds_until_next() == 10
+
+
+@pytest.mark.parametrize(
+    "catch_up, fired",
+    [
+        ("all", [datetime(2026, 10, 17, hour) for hour in (10, 11, 12)]),
+        ("once", [datetime(2026, 10, 17, 12)]),
+        ("none", []),
+    ],
+)
+def test_catch_up_after_downtime(redis_client, catch_up, fired):
+    clock, dispatched = Clock(datetime(2026, 10, 17, 9, 30)), []
+    scheduler = make_scheduler(redis_client, "worker-a", clock, dispatched, catch_up)
+    scheduler.tick()
+    clock.advance(hours=3)
+    assert [fire_at for _, fire_at in scheduler.tick()] == fired
+
+
+def test_only_the_lease_holder_fires(redis_client):
+    clock, dispatched = Clock(datetime(2026, 10, 17, 9, 59)), []
+    leader = make_scheduler(redis_client, "worker-a", clock, dispatched)
+    follower = make_scheduler(redis_client, "worker-b", clock, dispatched)
+    leader.tick()
+    follower.tick()
+    assert leader.is_leader and not follower.is_leader
+
+    clock.advance(minutes=1)
+    assert follower.tick() == []
+    assert len(leader.tick()) == 1
+    assert [worker_id for worker_id, _, _ in dispatched] == ["worker-a"]
+    # Renewing keeps the lease with its holder.
+    assert leader.acquire_lease()
+    assert redis_client.ttl(leader.leader_key) == 30
+
+
+def test_follower_takes_over_when_the_lease_lapses(redis_client):
+    clock, dispatched = Clock(datetime(2026, 10, 17, 9, 59)), []
+    leader = make_scheduler(redis_client, "worker-a", clock, dispatched)
+    follower = make_scheduler(redis_client, "worker-b", clock, dispatched)
+    leader.tick()
+    follower.tick()
+
+    # The leader dies without releasing; its lease expires.
+    redis_client.delete(leader.leader_key)
+    clock.advance(minutes=1)
+    assert follower.tick() == [("hourly", datetime(2026, 10, 17, 10))]
+    assert follower.is_leader
+    assert not leader.acquire_lease()
+
+
+def test_released_lease_passes_on_and_runs_never_fire_twice(redis_client):
+    clock, dispatched = Clock(datetime(2026, 10, 17, 9, 59)), []
+    leader = make_scheduler(redis_client, "worker-a", clock, dispatched)
+    follower = make_scheduler(redis_client, "worker-b", clock, dispatched)
+    leader.tick()
+    clock.advance(minutes=1)
+    # The leader dispatches the 10:00 run but stops before recording it.
+    leader.fire(leader.tasks["hourly"], datetime(2026, 10, 17, 10))
+    leader.release_lease()
+    assert not leader.is_leader
+
+    assert follower.tick() == []
+    assert follower.is_leader
+    assert [worker_id for worker_id, _, _ in dispatched] == ["worker-a"]
@@ -0,0 +1,37 @@
+from stock_ledger import StockBalances
+
+
+def ledger(*movements):
+    # (transaction id, kind, quantity in cents) for unit 1, product 1.
+    return [(tid, 1, 1, 1, kind, cents) for tid, kind, cents in movements]
+
+
+def test_every_crossing_below_zero_is_recorded():
+    balances = StockBalances()
+    balances.apply(
+        ledger(
+            (1, "receipt", 500),
+            (2, "issue", 800),  # -300: first dip
+            (3, "issue", 200),  # -500: same dip, lower
+            (4, "receipt", 900),  # 400: recovered
+            (5, "issue", 700),  # -300: second dip, not below the first
+            (6, "adjustment", 0),  # 0 counts as recovered
+            (7, "issue", 100),  # -100: third dip
+        )
+    )
+    assert list(balances.negative()) == [(0, 2, -500), (0, 5, -300), (0, 7, -100)]
+    assert balances.balances[0] == -100
+
+
+def test_dips_carry_across_fetch_batches():
+    balances = StockBalances()
+    balances.apply(ledger((1, "issue", 100)))
+    balances.apply(ledger((2, "issue", 100), (3, "return", 50)))
+    assert list(balances.negative()) == [(0, 1, -200)]
+
+
+def test_balances_that_stay_positive_are_not_flagged():
+    balances = StockBalances()
+    balances.apply(ledger((1, "receipt", 100), (2, "transfer", 500), (3, "issue", 100)))
+    assert list(balances.negative()) == []
+    assert balances.transactions == 3
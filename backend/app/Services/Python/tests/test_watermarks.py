@@ -0,0 +1,79 @@
+import pytest
+from sqlite_db import SQLiteConnection
+
+from kpi_engine import KPI_DEFINITIONS, INITIAL_WATERMARK, KpiEngine, parse_watermark
+from rollup_engine import ROLLUP_DEFINITIONS, RollupEngine
+
+
+@pytest.fixture
+def db():
+    connection = SQLiteConnection()
+    connection.executescript("""
+        CREATE TABLE users (
+            id INTEGER PRIMARY KEY, organization_id INTEGER, status TEXT,
+            created_at TEXT, updated_at TEXT, deleted_at TEXT
+        );
+        """)
+    yield connection
+    connection.close()
+
+
+def insert_user(db, user_id, org_id, updated_at):
+    with db.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO users (id, organization_id, status, created_at, updated_at) "
+            "VALUES (%s, %s, 'active', %s, %s)",
+            (user_id, org_id, updated_at, updated_at),
+        )
+    db.commit()
+
+
+@pytest.fixture(
+    params=[
+        lambda db: (KpiEngine(db), KPI_DEFINITIONS[1]),
+        lambda db: (RollupEngine(db), ROLLUP_DEFINITIONS["users_status"]),
+    ],
+    ids=["kpi_engine", "rollup_engine"],
+)
+def scan(request, db):
+    engine, definition = request.param(db)
+
+    def changed(watermark):
+        with db.cursor() as cursor:
+            if isinstance(engine, RollupEngine):
+                buckets, watermark = engine.changed_buckets(
+                    cursor, definition, watermark
+                )
+                return {org_id for org_id, _ in buckets}, watermark
+            return engine.changed_orgs(cursor, definition, watermark)
+
+    return changed
+
+
+def test_latest_row_is_not_picked_up_again(db, scan):
+    insert_user(db, 1, 10, "2026-10-17 09:00:00")
+    insert_user(db, 2, 20, "2026-10-17 09:30:00")
+
+    org_ids, watermark = scan(INITIAL_WATERMARK)
+    assert org_ids == {10, 20}
+    assert parse_watermark(watermark) == ("2026-10-17 09:30:00", 2)
+
+    assert scan(watermark) == (set(), watermark)
+
+
+def test_rows_sharing_the_watermark_second_are_found_by_id(db, scan):
+    insert_user(db, 1, 10, "2026-10-17 09:30:00")
+    _, watermark = scan(INITIAL_WATERMARK)
+
+    insert_user(db, 2, 20, "2026-10-17 09:30:00")
+    org_ids, watermark = scan(watermark)
+    assert org_ids == {20}
+    assert parse_watermark(watermark) == ("2026-10-17 09:30:00", 2)
+
+
+def test_bare_timestamp_watermark_resumes_from_that_second(db, scan):
+    insert_user(db, 1, 10, "2026-10-17 09:00:00")
+    insert_user(db, 2, 20, "2026-10-17 09:30:00")
+
+    org_ids, _ = scan("2026-10-17 09:30:00")
+    assert org_ids == {20}
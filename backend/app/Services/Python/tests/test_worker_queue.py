@@ -0,0 +1,143 @@
+import fakeredis
+import pytest
+from sqlite_db import ACTIVITY_LOG_DDL, SQLiteConnection
+
+import worker
+from db_pool import ConnectionPool
+from job_queue import PriorityLanes, ReliableJobQueue
+from metrics import NullMetrics
+
+QUEUE = "test_jobs"
+
+
+@pytest.fixture
+def redis_client():
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / "erp.db")
+    connection = SQLiteConnection(path)
+    connection.executescript(ACTIVITY_LOG_DDL)
+    connection.close()
+    return path
+
+
+def make_worker(redis_client, db, worker_id, monkeypatch, max_retries=3):
+    # Nothing flushes on a timer; the tests flush when they mean to.
+    monkeypatch.setattr(worker, "AUDIT_BATCH_DELAY_MS", 3600 * 1000)
+    erp_worker = worker.ERPWorker()
+    erp_worker.metrics = NullMetrics()
+    erp_worker.redis_client = redis_client
+    erp_worker.db_pool = ConnectionPool(lambda: SQLiteConnection(db), max_size=2)
+    erp_worker.db_pool.start()
+    erp_worker.job_queue = ReliableJobQueue(
+        redis_client,
+        QUEUE,
+        worker_id,
+        max_retries=max_retries,
+        lanes=PriorityLanes(redis_client, QUEUE, promote_interval=0.01),
+    )
+    # Registered and heartbeating, without the heartbeat thread.
+    redis_client.sadd(erp_worker.job_queue.workers_key, worker_id)
+    erp_worker.job_queue.heartbeat()
+    assert erp_worker.start_audit_batcher()
+    return erp_worker
+
+
+def consume(erp_worker, count):
+    raw_jobs = erp_worker.job_queue.fetch_many(count, timeout=0.1)
+    erp_worker.dispatch_batch(raw_jobs)
+    return len(raw_jobs)
+
+
+def push_audit_jobs(erp_worker, count):
+    for i in range(count):
+        erp_worker.job_queue.push(
+            {"job_type": "audit_log", "action": "updated", "user_id": i}
+        )
+
+
+def audit_rows(db):
+    connection = SQLiteConnection(db)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT causer_id FROM activity_log ORDER BY causer_id")
+        rows = [row["causer_id"] for row in cursor.fetchall()]
+    connection.close()
+    return rows
+
+
+def crash(erp_worker):
+    # The process dies: buffered rows are lost and the heartbeat lapses.
+    erp_worker.audit_batcher.stop_event.set()
+    erp_worker.redis_client.delete(erp_worker.job_queue.heartbeat_key)
+
+
+def test_buffered_jobs_are_acked_only_after_the_flush(redis_client, db, monkeypatch):
+    erp_worker = make_worker(redis_client, db, "worker-a", monkeypatch)
+    push_audit_jobs(erp_worker, 5)
+
+    assert consume(erp_worker, 10) == 5
+    processing = erp_worker.job_queue.processing_key
+    assert redis_client.llen(processing) == 5
+    assert audit_rows(db) == []
+
+    assert erp_worker.audit_batcher.flush() == 5
+    assert audit_rows(db) == [0, 1, 2, 3, 4]
+    assert redis_client.llen(processing) == 0
+    erp_worker.stop()
+
+
+def test_crash_before_flush_is_reclaimed_and_written_once(
+    redis_client, db, monkeypatch
+):
+    crashed = make_worker(redis_client, db, "worker-a", monkeypatch)
+    push_audit_jobs(crashed, 3)
+    assert consume(crashed, 10) == 3
+    crash(crashed)
+
+    survivor = make_worker(redis_client, db, "worker-b", monkeypatch)
+    assert survivor.job_queue.recover() == 3
+    assert redis_client.llen(crashed.job_queue.processing_key) == 0
+    assert consume(survivor, 10) == 3
+    survivor.audit_batcher.flush()
+
+    assert audit_rows(db) == [0, 1, 2]
+    assert redis_client.llen(survivor.job_queue.processing_key) == 0
+    assert redis_client.llen(survivor.job_queue.dead_letter_key) == 0
+    survivor.stop()
+
+
+def test_jobs_that_never_write_end_in_the_dead_letter_list(
+    redis_client, db, monkeypatch
+):
+    erp_worker = make_worker(redis_client, db, "worker-a", monkeypatch, max_retries=1)
+    push_audit_jobs(erp_worker, 2)
+    connection = SQLiteConnection(db)
+    connection.executescript("DROP TABLE activity_log")
+    connection.close()
+
+    for _ in range(2):
+        assert consume(erp_worker, 10) == 2
+        assert erp_worker.audit_batcher.flush() == 0
+
+    queue = erp_worker.job_queue
+    assert redis_client.llen(queue.processing_key) == 0
+    assert consume(erp_worker, 10) == 0
+    dead = queue.dead_letters()
+    assert sorted(job["user_id"] for job in dead) == [0, 1]
+    assert all(job["retry_count"] == 2 for job in dead)
+    assert all(job["error"] == "audit_log failed" for job in dead)
+    erp_worker.stop()
+
+
+def test_stop_flushes_and_acks_before_leaving_the_queue(redis_client, db, monkeypatch):
+    erp_worker = make_worker(redis_client, db, "worker-a", monkeypatch)
+    push_audit_jobs(erp_worker, 4)
+    consume(erp_worker, 10)
+
+    erp_worker.stop()
+    assert audit_rows(db) == [0, 1, 2, 3]
+    assert redis_client.llen(erp_worker.job_queue.processing_key) == 0
+    assert "worker-a" not in redis_client.smembers(erp_worker.job_queue.workers_key)
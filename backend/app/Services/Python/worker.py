@@ -1,12 +1,33 @@
 import os
+import signal
+import socket
 import time
 import redis
 import pymysql
-from datetime import datetime
+from email.utils import formataddr
+from functools import partial
 import json
 import threading
 import logging
 
+from activity_archiver import ActivityLogArchiver
+from audit_batcher import AuditLogBatcher
+from cache_codec import get_codec
+from cache_warmer import CacheWarmer
+from db_pool import ConnectionPool, is_disconnect
+from job_coalescer import Claim, JobCoalescer
+from job_pool import JobPool, parse_type_limits
+from job_queue import PriorityLanes, ReliableJobQueue, SimpleJobQueue
+from forecasting import ForecastEngine
+from kpi_analytics import KpiHistoryAnalyzer
+from kpi_engine import KpiEngine
+from metrics import NullMetrics, TimedDictCursor, TimedRedisConnection, WorkerMetrics
+from notification_delivery import NotificationDelivery, SMTPPool
+from report_engine import ReportEngine
+from rollup_engine import RollupEngine
+from scheduler import ScheduledTask, Scheduler
+from stock_ledger import StockLedger
+
 REDIS_HOST = os.getenv("REDIS_HOST", "general_server_configs")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 REDIS_PASSWORD = os.getenv("REDIS_PASSWORD", "angles")
@@ -15,6 +36,81 @@ DB_PORT = int(os.getenv("DB_PORT", 3306))
 DB_NAME = os.getenv("DB_NAME", "db_erp_drymix_prod")
 DB_USER = os.getenv("DB_USER", "amit")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "angles")
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", 500))
+AUDIT_BATCH_DELAY_MS = int(os.getenv("AUDIT_BATCH_DELAY_MS", 200))
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", 1))
+WORKER_MAX_PENDING = int(os.getenv("WORKER_MAX_PENDING", WORKER_CONCURRENCY * 2))
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 1))
+# One connection per job thread plus one each for the audit log and
+# notification flushers.
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", WORKER_CONCURRENCY + 2))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 10))
+MAIL_HOST = os.getenv("MAIL_HOST", "mailhog")
+MAIL_PORT = int(os.getenv("MAIL_PORT", 1025))
+MAIL_USERNAME = os.getenv("MAIL_USERNAME", "")
+MAIL_PASSWORD = os.getenv("MAIL_PASSWORD", "")
+MAIL_ENCRYPTION = os.getenv("MAIL_ENCRYPTION", "")
+MAIL_FROM_ADDRESS = os.getenv("MAIL_FROM_ADDRESS", "noreply@erpdrymix.local")
+MAIL_FROM_NAME = os.getenv("MAIL_FROM_NAME", "ERP DryMix")
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", 2))
+SMTP_RATE_LIMIT = float(os.getenv("SMTP_RATE_LIMIT", 10))
+NOTIFICATION_DIGEST_WINDOW_MS = int(os.getenv("NOTIFICATION_DIGEST_WINDOW_MS", 5000))
+NOTIFICATION_MAX_RETRIES = int(os.getenv("NOTIFICATION_MAX_RETRIES", 2))
+JOB_QUEUE = os.getenv("JOB_QUEUE", "erp_jobs_queue")
+QUEUE_MODE = os.getenv("QUEUE_MODE", "simple")
+WORKER_ID = os.getenv("WORKER_ID", f"{socket.gethostname()}:{os.getpid()}")
+JOB_VISIBILITY_TIMEOUT = int(os.getenv("JOB_VISIBILITY_TIMEOUT", 300))
+JOB_MAX_RETRIES = int(os.getenv("JOB_MAX_RETRIES", 3))
+QUEUE_REAPER_INTERVAL = int(os.getenv("QUEUE_REAPER_INTERVAL", 60))
+BULK_DEQUEUE_SIZE = int(os.getenv("BULK_DEQUEUE_SIZE", 1))
+QUEUE_LANE_WEIGHTS = parse_type_limits(
+    os.getenv("QUEUE_LANE_WEIGHTS", "high=6,default=3,bulk=1")
+)
+DELAYED_JOB_POLL_INTERVAL = float(os.getenv("DELAYED_JOB_POLL_INTERVAL", 1))
+JOB_COALESCING_ENABLED = os.getenv("JOB_COALESCING_ENABLED", "true").lower() == "true"
+JOB_COALESCE_TTL = int(os.getenv("JOB_COALESCE_TTL", 900))
+BATCH_JOB_TYPES = {"audit_log", "email_notification"}
+# Job types that can safely run twice, so a dropped connection is retried
+# once on a fresh one instead of failing the job.
+IDEMPOTENT_JOB_TYPES = {
+    "kpi_calculation",
+    "kpi_analytics",
+    "forecast",
+    "cache_warmup",
+    "report_generation",
+    "rollup_refresh",
+    "rollup_verify",
+    "stock_rebuild",
+    "activity_archive",
+}
+KPI_ANALYTICS_CHUNK_ROWS = int(os.getenv("KPI_ANALYTICS_CHUNK_ROWS", 200000))
+KPI_TREND_WINDOW = int(os.getenv("KPI_TREND_WINDOW", 7))
+REDIS_PREFIX = os.getenv("REDIS_PREFIX", "erp_drymix_products_database_")
+FORECAST_CACHE_TTL = int(os.getenv("FORECAST_CACHE_TTL", 21600))
+CACHE_CODEC = os.getenv("CACHE_CODEC", "columnar")
+CACHE_WARMUP_CHUNK_ROWS = int(os.getenv("CACHE_WARMUP_CHUNK_ROWS", 1000))
+REPORT_STORAGE_PATH = os.getenv("REPORT_STORAGE_PATH", "storage/app/reports")
+ACTIVITY_ARCHIVE_PATH = os.getenv(
+    "ACTIVITY_ARCHIVE_PATH", "storage/app/archive/activity_log"
+)
+ACTIVITY_LOG_RETENTION_DAYS = int(os.getenv("ACTIVITY_LOG_RETENTION_DAYS", 365))
+ACTIVITY_ARCHIVE_CHUNK_ROWS = int(os.getenv("ACTIVITY_ARCHIVE_CHUNK_ROWS", 1000))
+KPI_CALCULATION_CRON = os.getenv("KPI_CALCULATION_CRON", "0 * * * *")
+CACHE_WARMUP_CRON = os.getenv("CACHE_WARMUP_CRON", "30 * * * *")
+ROLLUP_REFRESH_CRON = os.getenv("ROLLUP_REFRESH_CRON", "* * * * *")
+ROLLUP_VERIFY_CRON = os.getenv("ROLLUP_VERIFY_CRON", "15 3 * * *")
+STOCK_REBUILD_CRON = os.getenv("STOCK_REBUILD_CRON", "*/10 * * * *")
+ACTIVITY_ARCHIVE_CRON = os.getenv("ACTIVITY_ARCHIVE_CRON", "45 2 * * *")
+SCHEDULER_LEASE_TTL = int(os.getenv("SCHEDULER_LEASE_TTL", 30))
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9108))
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+JOB_TYPE_LIMITS = parse_type_limits(
+    os.getenv(
+        "JOB_TYPE_LIMITS",
+        "report_generation=2,kpi_calculation=1,kpi_analytics=1,forecast=1,cache_warmup=1,rollup_refresh=1,rollup_verify=1,stock_rebuild=1,activity_archive=1",
+    )
+)
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
@@ -24,16 +120,62 @@ logging.basicConfig(
 class ERPWorker:
     def __init__(self):
         self.redis_client = None
-        self.db_connection = None
+        self.thread_state = threading.local()
+        self.db_pool = None
+        self.audit_batcher = None
+        self.notification_delivery = None
+        self.job_pool = None
+        self.job_queue = None
+        self.coalescer = None
+        self.scheduler = None
+        self.handlers = {
+            "kpi_calculation": lambda data: self.calculate_kpis(),
+            "email_notification": self.send_email_notification,
+            "report_generation": self.generate_report,
+            "cache_warmup": lambda data: self.warmup_cache(),
+            "audit_log": self.create_audit_log,
+            "kpi_analytics": self.analyze_kpi_history,
+            "forecast": self.generate_forecasts,
+            "rollup_refresh": self.refresh_rollups,
+            "rollup_verify": self.verify_rollups,
+            "stock_rebuild": self.rebuild_stock,
+            "activity_archive": self.archive_activity_log,
+        }
+        self.metrics = (
+            WorkerMetrics(tracing=TRACING_ENABLED, job_types=self.handlers)
+            if METRICS_ENABLED
+            else NullMetrics()
+        )
         self.running = False
 
+    # Each job checks a connection out of db_pool the first time it touches
+    # the database and hands it back in release_db_connection().
+    @property
+    def db_connection(self):
+        connection = getattr(self.thread_state, "db_connection", None)
+        if connection is None:
+            connection = self.db_pool.acquire()
+            self.thread_state.db_connection = connection
+        return connection
+
+    def release_db_connection(self, error=None):
+        connection = getattr(self.thread_state, "db_connection", None)
+        if connection is not None:
+            del self.thread_state.db_connection
+            self.db_pool.release(connection, error=error)
+
     def connect_redis(self):
         try:
             self.redis_client = redis.Redis(
-                host=REDIS_HOST,
-                port=REDIS_PORT,
-                password=REDIS_PASSWORD,
-                decode_responses=True,
+                connection_pool=redis.ConnectionPool(
+                    host=REDIS_HOST,
+                    port=REDIS_PORT,
+                    password=REDIS_PASSWORD,
+                    decode_responses=True,
+                    connection_class=(
+                        TimedRedisConnection if METRICS_ENABLED else redis.Connection
+                    ),
+                )
             )
             self.redis_client.ping()
             logging.info(f"Connected to Redis at {REDIS_HOST}:{REDIS_PORT}")
@@ -42,165 +184,409 @@ class ERPWorker:
             logging.error(f"Redis connection failed: {e}")
             return False
 
+    def create_db_connection(self):
+        return pymysql.connect(
+            host=DB_HOST,
+            port=DB_PORT,
+            user=DB_USER,
+            password=DB_PASSWORD,
+            database=DB_NAME,
+            cursorclass=(
+                TimedDictCursor if METRICS_ENABLED else pymysql.cursors.DictCursor
+            ),
+        )
+
     def connect_db(self):
         try:
-            self.db_connection = pymysql.connect(
-                host=DB_HOST,
-                port=DB_PORT,
-                user=DB_USER,
-                password=DB_PASSWORD,
-                database=DB_NAME,
-                cursorclass=pymysql.cursors.DictCursor,
+            self.db_pool = ConnectionPool(
+                self.create_db_connection,
+                min_size=DB_POOL_MIN_SIZE,
+                max_size=DB_POOL_MAX_SIZE,
+                checkout_timeout=DB_POOL_TIMEOUT,
+                name="worker",
             )
+            self.db_pool.start()
             logging.info(f"Connected to database at {DB_HOST}:{DB_PORT}")
             return True
         except Exception as e:
             logging.error(f"Database connection failed: {e}")
             return False
 
-    def process_job(self, job_type, job_data):
-        logging.info(f"Processing job: {job_type}")
+    def create_job_queue(self):
+        lanes = PriorityLanes(
+            self.redis_client,
+            JOB_QUEUE,
+            weights=QUEUE_LANE_WEIGHTS,
+            promote_interval=DELAYED_JOB_POLL_INTERVAL,
+        )
+        if QUEUE_MODE == "reliable":
+            return ReliableJobQueue(
+                self.redis_client,
+                JOB_QUEUE,
+                WORKER_ID,
+                visibility_timeout=JOB_VISIBILITY_TIMEOUT,
+                max_retries=JOB_MAX_RETRIES,
+                lanes=lanes,
+            )
+        return SimpleJobQueue(self.redis_client, JOB_QUEUE, lanes=lanes)
+
+    def start_job_pool(self):
+        if WORKER_CONCURRENCY <= 1:
+            return
+        self.job_pool = JobPool(
+            self.run_jobs,
+            workers=WORKER_CONCURRENCY,
+            type_limits=JOB_TYPE_LIMITS,
+            max_pending=WORKER_MAX_PENDING,
+        )
+        self.job_pool.start()
+
+    def dispatch_job(self, job_type, job_data, raw_job=None):
+        return self.dispatch_jobs(job_type, [(job_data, raw_job)])
+
+    def dispatch_jobs(self, job_type, jobs):
+        if self.job_pool:
+            return self.job_pool.submit(job_type, jobs)
+        return self.run_jobs(job_type, jobs)
+
+    def dispatch_batch(self, raw_jobs):
+        grouped = {}
+        for raw_job in raw_jobs:
+            try:
+                data = json.loads(raw_job)
+            except ValueError as e:
+                logging.error(f"Discarding malformed job: {e}")
+                self.job_queue.fail(raw_job, error=e)
+                continue
+            job_type = data.get("job_type", "unknown")
+            grouped.setdefault(job_type, []).append((data, raw_job))
+
+        for job_type, jobs in grouped.items():
+            if job_type in BATCH_JOB_TYPES:
+                self.dispatch_jobs(job_type, jobs)
+                continue
+            if self.coalescer:
+                jobs, absorbed = self.coalescer.collapse(job_type, jobs)
+                if absorbed:
+                    self.absorb_jobs(job_type, absorbed)
+            for job in jobs:
+                self.dispatch_jobs(job_type, [job])
+
+    def absorb_jobs(self, job_type, jobs):
+        logging.info(f"Coalesced {len(jobs)} duplicate {job_type} jobs")
+        self.metrics.coalesced(job_type, len(jobs))
+        raw_jobs = [raw_job for _, raw_job in jobs if raw_job is not None]
+        if raw_jobs:
+            self.job_queue.ack_many(raw_jobs)
+
+    def run_jobs(self, job_type, jobs):
+        if job_type in BATCH_JOB_TYPES:
+            # Buffered jobs are acknowledged by settle_jobs once flushed.
+            return self.process_job_batch(job_type, jobs)
+
+        results = [self.run_coalesced(job_type, data) for data, _ in jobs]
+        self.settle_jobs(
+            job_type,
+            [raw_job for (_, raw_job), ok in zip(jobs, results) if ok],
+            [raw_job for (_, raw_job), ok in zip(jobs, results) if not ok],
+        )
+        return all(results)
+
+    def run_coalesced(self, job_type, job_data):
+        if not self.coalescer:
+            return self.process_job(job_type, job_data)
 
         try:
-            if job_type == "kpi_calculation":
-                self.calculate_kpis()
-            elif job_type == "email_notification":
-                self.send_email_notification(job_data)
-            elif job_type == "report_generation":
-                self.generate_report(job_data)
-            elif job_type == "cache_warmup":
-                self.warmup_cache()
-            elif job_type == "audit_log":
-                self.create_audit_log(job_data)
-            else:
-                logging.warning(f"Unknown job type: {job_type}")
+            claim = self.coalescer.claim(job_type, job_data)
+        except Exception as e:
+            # Coalescing only saves work; without Redis the job still runs.
+            logging.warning(f"Job coalescing unavailable, running {job_type}: {e}")
+            claim = Claim(job_type, job_data)
+        if claim is None:
+            logging.info(f"Coalesced duplicate {job_type} job")
+            self.metrics.coalesced(job_type)
+            return True
 
+        succeeded = False
+        try:
+            succeeded = self.process_job(job_type, job_data)
+        finally:
+            try:
+                self.coalescer.release(claim, succeeded)
+            except Exception as e:
+                logging.error(f"Releasing {job_type} coalescing lock failed: {e}")
+        return succeeded
+
+    def process_job_batch(self, job_type, jobs):
+        logging.info(f"Processing {len(jobs)} {job_type} jobs")
+
+        if job_type not in BATCH_JOB_TYPES:
+            logging.warning(f"Job type {job_type} cannot be batched")
+            return False
+
+        jobs_data = [data for data, _ in jobs]
+        raw_jobs = [raw_job for _, raw_job in jobs]
+        # Buffered jobs are timed and counted by the batchers when they are
+        # written, not here when they are only handed over.
+        try:
+            if job_type == "audit_log":
+                self.audit_batcher.add_many(jobs_data, raw_jobs)
+            elif job_type == "email_notification":
+                self.notification_delivery.add_many(jobs_data, raw_jobs)
             return True
         except Exception as e:
-            logging.error(f"Job processing failed: {e}")
+            logging.error(f"Batch job processing failed: {e}")
+            self.metrics.settled(job_type, failed=len(jobs))
+            self.settle_jobs(job_type, [], raw_jobs)
             return False
 
-    def calculate_kpis(self):
-        queries = [
-            "INSERT INTO kpi_values (kpi_id, org_id, unit_id, record_date, actual_value, target_value, status, calculated_at) SELECT 1, org_id, NULL, CURDATE(), COUNT(*), NULL, 'on_target', NOW() FROM users WHERE is_active = 1",
-            "INSERT INTO kpi_values (kpi_id, org_id, unit_id, record_date, actual_value, target_value, status, calculated_at) SELECT 2, org_id, NULL, CURDATE(), COUNT(*), NULL, 'on_target', NOW() FROM manufacturing_units WHERE is_active = 1",
-        ]
-
+    def settle_jobs(self, job_type, succeeded, failed):
+        # Buffered audit logs and notifications arrive here from their
+        # flushers, so they stay in the processing list until written and a
+        # crash before the flush leaves them to be reclaimed.
         try:
-            with self.db_connection.cursor() as cursor:
-                for query in queries:
-                    cursor.execute(query)
-                self.db_connection.commit()
-            logging.info("KPIs calculated successfully")
+            acked = [raw_job for raw_job in succeeded if raw_job is not None]
+            if acked:
+                self.job_queue.ack_many(acked)
+            for raw_job in failed:
+                if raw_job is not None:
+                    self.job_queue.fail(raw_job, error=f"{job_type} failed")
         except Exception as e:
-            logging.error(f"KPI calculation failed: {e}")
+            logging.error(f"Job acknowledgement failed: {e}")
+
+    def process_job(self, job_type, job_data):
+        logging.info(f"Processing job: {job_type}")
+
+        attempts = 2 if job_type in IDEMPOTENT_JOB_TYPES else 1
+        for attempt in range(1, attempts + 1):
+            try:
+                with self.metrics.job(job_type):
+                    self.handle_job(job_type, job_data)
+                self.release_db_connection()
+                return True
+            except Exception as e:
+                self.release_db_connection(error=e)
+                if attempt < attempts and is_disconnect(e):
+                    logging.warning(
+                        f"Retrying {job_type} after lost database connection: {e}"
+                    )
+                    continue
+                logging.error(f"Job processing failed: {e}")
+                return False
+
+    def handle_job(self, job_type, job_data):
+        handler = self.handlers.get(job_type)
+        if handler is None:
+            logging.warning(f"Unknown job type: {job_type}")
+            return
+        handler(job_data)
+
+    def calculate_kpis(self):
+        KpiEngine(self.db_connection, self.redis_client).run()
+
+    def analyze_kpi_history(self, data):
+        # Failures propagate to process_job so the reliable queue can retry.
+        KpiHistoryAnalyzer(
+            self.db_connection,
+            chunk_rows=data.get("chunk_rows", KPI_ANALYTICS_CHUNK_ROWS),
+            window=data.get("window", KPI_TREND_WINDOW),
+        ).run(kpi_id=data.get("kpi_id"))
+
+    def generate_forecasts(self, data):
+        ForecastEngine(
+            self.db_connection,
+            self.redis_client,
+            cache_prefix=REDIS_PREFIX,
+            cache_ttl=FORECAST_CACHE_TTL,
+        ).run(kinds=data.get("kinds"))
 
     def send_email_notification(self, data):
-        logging.info(f"Email notification: {data}")
+        self.notification_delivery.add(data)
+
+    def refresh_rollups(self, data):
+        RollupEngine(self.db_connection, self.redis_client).run(
+            full=data.get("full", False)
+        )
+
+    def verify_rollups(self, data):
+        engine = RollupEngine(self.db_connection, self.redis_client)
+        if engine.verify() and data.get("repair", True):
+            logging.warning("Rebuilding rollups after failed verification")
+            engine.run(full=True)
+
+    def rebuild_stock(self, data):
+        # The ledger streams through an unbuffered cursor on its own
+        # connection while balances are written through the pooled one.
+        connection = self.create_db_connection()
+        try:
+            StockLedger(connection, self.db_connection, self.redis_client).run(
+                full=data.get("full", False)
+            )
+        finally:
+            connection.close()
+
+    def archive_activity_log(self, data):
+        ActivityLogArchiver(
+            self.db_connection,
+            ACTIVITY_ARCHIVE_PATH,
+            self.redis_client,
+            retention_days=data.get("retention_days", ACTIVITY_LOG_RETENTION_DAYS),
+            chunk_rows=ACTIVITY_ARCHIVE_CHUNK_ROWS,
+        ).run()
 
     def generate_report(self, data):
         logging.info(f"Generating report: {data}")
+        # Reports stream through an unbuffered cursor, which holds its
+        # connection until the last row is read, so each gets its own.
+        connection = self.create_db_connection()
+        try:
+            ReportEngine(
+                connection,
+                self.redis_client,
+                storage_path=REPORT_STORAGE_PATH,
+                key_prefix=REDIS_PREFIX,
+            ).generate(data)
+        finally:
+            connection.close()
 
     def warmup_cache(self):
+        # Failures propagate to process_job so the reliable queue can retry.
+        CacheWarmer(
+            self.db_connection,
+            self.redis_client,
+            key_prefix=REDIS_PREFIX,
+            chunk_rows=CACHE_WARMUP_CHUNK_ROWS,
+            codec=get_codec(CACHE_CODEC),
+        ).run()
+
+    def start_audit_batcher(self):
         try:
-            cache_keys = [
-                "organizations:all",
-                "manufacturing_units:all",
-                "users:active",
-            ]
-
-            with self.db_connection.cursor() as cursor:
-                for key in cache_keys:
-                    if "organizations" in key:
-                        cursor.execute("SELECT * FROM organizations LIMIT 100")
-                        data = cursor.fetchall()
-                        self.redis_client.setex(key, 3600, json.dumps(data))
-                    elif "units" in key:
-                        cursor.execute("SELECT * FROM manufacturing_units LIMIT 100")
-                        data = cursor.fetchall()
-                        self.redis_client.setex(key, 3600, json.dumps(data))
-                    elif "users" in key:
-                        cursor.execute(
-                            "SELECT id, username, email, full_name, role FROM users WHERE is_active = 1 LIMIT 100"
-                        )
-                        data = cursor.fetchall()
-                        self.redis_client.setex(key, 3600, json.dumps(data))
-
-            logging.info("Cache warmed up successfully")
+            self.audit_batcher = AuditLogBatcher(
+                self.db_pool,
+                max_rows=AUDIT_BATCH_SIZE,
+                max_delay=AUDIT_BATCH_DELAY_MS / 1000,
+                on_flush=partial(self.settle_jobs, "audit_log"),
+                metrics=self.metrics,
+            )
+            self.audit_batcher.start()
+            return True
         except Exception as e:
-            logging.error(f"Cache warmup failed: {e}")
+            logging.error(f"Audit log batcher failed to start: {e}")
+            return False
 
-    def create_audit_log(self, data):
+    def start_notification_delivery(self):
         try:
-            with self.db_connection.cursor() as cursor:
-                insert_query = """
-                INSERT INTO activity_log 
-                (org_id, user_id, action, module, record_type, record_id, details, ip_address, user_agent, created_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())
-                """
-                cursor.execute(
-                    insert_query,
-                    (
-                        data.get("org_id"),
-                        data.get("user_id"),
-                        data.get("action"),
-                        data.get("module"),
-                        data.get("record_type"),
-                        data.get("record_id"),
-                        json.dumps(data.get("details", {})),
-                        data.get("ip_address"),
-                        data.get("user_agent"),
-                    ),
-                )
-                self.db_connection.commit()
-            logging.info(f"Audit log created: {data.get('action')}")
+            self.notification_delivery = NotificationDelivery(
+                self.db_pool,
+                SMTPPool(
+                    MAIL_HOST,
+                    MAIL_PORT,
+                    username=MAIL_USERNAME,
+                    password=MAIL_PASSWORD,
+                    encryption=MAIL_ENCRYPTION,
+                    size=SMTP_POOL_SIZE,
+                ),
+                formataddr((MAIL_FROM_NAME, MAIL_FROM_ADDRESS)),
+                digest_window=NOTIFICATION_DIGEST_WINDOW_MS / 1000,
+                rate_limit=SMTP_RATE_LIMIT,
+                max_retries=NOTIFICATION_MAX_RETRIES,
+                on_flush=partial(self.settle_jobs, "email_notification"),
+                metrics=self.metrics,
+            )
+            self.notification_delivery.start()
+            return True
         except Exception as e:
-            logging.error(f"Audit log creation failed: {e}")
+            logging.error(f"Notification delivery failed to start: {e}")
+            return False
+
+    def create_audit_log(self, data):
+        self.audit_batcher.add(data)
 
     def listen_for_jobs(self):
         logging.info("Listening for jobs...")
         self.running = True
+        last_recovery = 0
 
         while self.running:
             try:
-                job = self.redis_client.brpop("erp_jobs_queue", timeout=30)
-                if job:
-                    queue_name, job_data = job
-                    data = json.loads(job_data)
-                    job_type = data.get("job_type", "unknown")
-                    self.process_job(job_type, data)
+                if time.monotonic() - last_recovery >= QUEUE_REAPER_INTERVAL:
+                    self.job_queue.recover()
+                    last_recovery = time.monotonic()
+
+                raw_jobs = self.job_queue.fetch_many(BULK_DEQUEUE_SIZE, timeout=30)
+                if raw_jobs:
+                    self.dispatch_batch(raw_jobs)
             except Exception as e:
                 logging.error(f"Job listening failed: {e}")
                 time.sleep(5)
 
-    def schedule_periodic_tasks(self):
-        def task_scheduler():
-            while self.running:
-                try:
-                    current_minute = datetime.now().minute
-
-                    if current_minute == 0:
-                        logging.info("Running hourly KPI calculation")
-                        self.process_job("kpi_calculation", {})
-
-                    if current_minute == 30:
-                        logging.info("Running cache warmup")
-                        self.process_job("cache_warmup", {})
+    def enqueue_job(self, job_type, data, run_at=None):
+        # Scheduled runs go through the shared queue so whichever replica is
+        # free picks them up, not only the one holding the scheduler lease.
+        # A delayed job is not pending yet, so it never blocks one due now.
+        if (
+            run_at is None
+            and self.coalescer
+            and not self.coalescer.mark_pending(job_type, data)
+        ):
+            logging.info(f"Skipped enqueueing {job_type}: an identical job is pending")
+            self.metrics.coalesced(job_type)
+            return
+        self.job_queue.push({"job_type": job_type, **data}, run_at=run_at)
 
-                    time.sleep(60)
-                except Exception as e:
-                    logging.error(f"Scheduler failed: {e}")
-                    time.sleep(60)
-
-        scheduler_thread = threading.Thread(target=task_scheduler, daemon=True)
-        scheduler_thread.start()
+    def schedule_periodic_tasks(self):
+        self.scheduler = Scheduler(
+            self.redis_client,
+            self.enqueue_job,
+            WORKER_ID,
+            tasks=[
+                ScheduledTask(
+                    "hourly_kpi_calculation", KPI_CALCULATION_CRON, "kpi_calculation"
+                ),
+                ScheduledTask("cache_warmup", CACHE_WARMUP_CRON, "cache_warmup"),
+                ScheduledTask("rollup_refresh", ROLLUP_REFRESH_CRON, "rollup_refresh"),
+                ScheduledTask("rollup_verify", ROLLUP_VERIFY_CRON, "rollup_verify"),
+                ScheduledTask("stock_rebuild", STOCK_REBUILD_CRON, "stock_rebuild"),
+                ScheduledTask(
+                    "activity_archive", ACTIVITY_ARCHIVE_CRON, "activity_archive"
+                ),
+            ],
+            lease_ttl=SCHEDULER_LEASE_TTL,
+        )
+        self.scheduler.start()
+
+    def start_metrics(self):
+        self.metrics.watch_queues(
+            self.redis_client,
+            list(self.job_queue.lanes.keys.values()) + [f"{JOB_QUEUE}:dead"],
+        )
+        if METRICS_PORT:
+            self.metrics.serve(METRICS_PORT)
+            logging.info(f"Serving metrics on :{METRICS_PORT}/metrics")
 
     def start(self):
-        if not self.connect_redis() or not self.connect_db():
+        if (
+            not self.connect_redis()
+            or not self.connect_db()
+            or not self.start_audit_batcher()
+            or not self.start_notification_delivery()
+        ):
             logging.error("Failed to connect to required services")
             return False
 
         logging.info("Starting ERP Worker...")
+        self.job_queue = self.create_job_queue()
+        self.job_queue.start()
+        if JOB_COALESCING_ENABLED:
+            self.coalescer = JobCoalescer(
+                self.redis_client,
+                key_prefix=f"{JOB_QUEUE}:coalesce",
+                ttl=JOB_COALESCE_TTL,
+                requeue=self.job_queue.push,
+            )
+            self.coalescer.start()
+        self.start_metrics()
+        self.start_job_pool()
         self.schedule_periodic_tasks()
         self.listen_for_jobs()
 
@@ -209,18 +595,42 @@ class ERPWorker:
     def stop(self):
         logging.info("Stopping ERP Worker...")
         self.running = False
+        if self.scheduler:
+            self.scheduler.stop()
+        if self.job_pool:
+            self.job_pool.shutdown()
+        if self.coalescer:
+            self.coalescer.stop()
+        # The final flushes acknowledge their jobs, so they run while the
+        # queue is still up.
+        if self.audit_batcher:
+            self.audit_batcher.close()
+        if self.notification_delivery:
+            self.notification_delivery.close()
+        if self.job_queue:
+            self.job_queue.stop()
         if self.redis_client:
             self.redis_client.close()
-        if self.db_connection:
-            self.db_connection.close()
+        if self.db_pool:
+            self.db_pool.close()
+
+
+def handle_sigterm(signum, frame):
+    # docker stop sends SIGTERM; unwind the same way as Ctrl-C so stop()
+    # flushes the buffered audit logs and notifications.
+    raise KeyboardInterrupt
 
 
 def main():
     worker = ERPWorker()
+    signal.signal(signal.SIGTERM, handle_sigterm)
 
     try:
         worker.start()
     except KeyboardInterrupt:
+        # A second signal must not cut the final flush short.
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
         worker.stop()
         logging.info("Worker stopped")
 
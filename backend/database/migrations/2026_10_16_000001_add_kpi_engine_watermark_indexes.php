@@ -0,0 +1,33 @@
+<?php
+
+use Illuminate\Database\Migrations\Migration;
+use Illuminate\Database\Schema\Blueprint;
+use Illuminate\Support\Facades\Schema;
+
+return new class extends Migration
+{
+    /**
+     * Index the updated_at watermarks the worker's KPI engine scans incrementally
+     */
+    public function up(): void
+    {
+        Schema::table('users', function (Blueprint $table) {
+            $table->index('updated_at', 'idx_users_updated_at');
+        });
+
+        Schema::table('manufacturing_units', function (Blueprint $table) {
+            $table->index('updated_at', 'idx_manufacturing_units_updated_at');
+        });
+    }
+
+    public function down(): void
+    {
+        Schema::table('users', function (Blueprint $table) {
+            $table->dropIndex('idx_users_updated_at');
+        });
+
+        Schema::table('manufacturing_units', function (Blueprint $table) {
+            $table->dropIndex('idx_manufacturing_units_updated_at');
+        });
+    }
+};
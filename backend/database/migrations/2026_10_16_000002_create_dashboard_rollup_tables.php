@@ -0,0 +1,76 @@
+<?php
+
+use Illuminate\Database\Migrations\Migration;
+use Illuminate\Database\Schema\Blueprint;
+use Illuminate\Support\Facades\Schema;
+
+return new class extends Migration
+{
+    /**
+     * Summary tables the worker's rollup engine maintains for the Grafana dashboards
+     */
+    public function up(): void
+    {
+        Schema::create('rollup_status_counts', function (Blueprint $table) {
+            $table->id();
+            $table->string('rollup', 64);
+            $table->unsignedBigInteger('organization_id');
+            $table->string('dimension', 100)->default('');
+            $table->unsignedBigInteger('value')->default(0);
+            $table->timestamp('updated_at')->nullable();
+
+            $table->unique(['rollup', 'organization_id', 'dimension'], 'rollup_status_unique');
+        });
+
+        Schema::create('rollup_daily_counts', function (Blueprint $table) {
+            $table->id();
+            $table->string('rollup', 64);
+            $table->unsignedBigInteger('organization_id');
+            $table->date('day');
+            $table->string('dimension', 100)->default('');
+            $table->unsignedBigInteger('value')->default(0);
+            $table->timestamp('updated_at')->nullable();
+
+            $table->unique(['rollup', 'organization_id', 'day', 'dimension'], 'rollup_daily_unique');
+            $table->index(['rollup', 'day'], 'rollup_daily_rollup_day_idx');
+        });
+
+        Schema::table('organizations', function (Blueprint $table) {
+            $table->index('updated_at', 'idx_organizations_updated_at');
+        });
+
+        Schema::table('production_orders', function (Blueprint $table) {
+            $table->index('updated_at', 'idx_production_orders_updated_at');
+        });
+
+        Schema::table('inspections', function (Blueprint $table) {
+            $table->index('updated_at', 'idx_inspections_updated_at');
+        });
+
+        Schema::table('ncrs', function (Blueprint $table) {
+            $table->index('updated_at', 'idx_ncrs_updated_at');
+        });
+    }
+
+    public function down(): void
+    {
+        Schema::table('ncrs', function (Blueprint $table) {
+            $table->dropIndex('idx_ncrs_updated_at');
+        });
+
+        Schema::table('inspections', function (Blueprint $table) {
+            $table->dropIndex('idx_inspections_updated_at');
+        });
+
+        Schema::table('production_orders', function (Blueprint $table) {
+            $table->dropIndex('idx_production_orders_updated_at');
+        });
+
+        Schema::table('organizations', function (Blueprint $table) {
+            $table->dropIndex('idx_organizations_updated_at');
+        });
+
+        Schema::dropIfExists('rollup_daily_counts');
+        Schema::dropIfExists('rollup_status_counts');
+    }
+};
@@ -0,0 +1,25 @@
+<?php
+
+use Illuminate\Database\Migrations\Migration;
+use Illuminate\Database\Schema\Blueprint;
+use Illuminate\Support\Facades\Schema;
+
+return new class extends Migration
+{
+    /**
+     * Lets the worker's incremental stock rebuild replay one unit/product history in date order
+     */
+    public function up(): void
+    {
+        Schema::table('stock_transactions', function (Blueprint $table) {
+            $table->index(['manufacturing_unit_id', 'product_id', 'transaction_date'], 'stock_trans_unit_prod_date_idx');
+        });
+    }
+
+    public function down(): void
+    {
+        Schema::table('stock_transactions', function (Blueprint $table) {
+            $table->dropIndex('stock_trans_unit_prod_date_idx');
+        });
+    }
+};
@@ -0,0 +1,25 @@
+<?php
+
+use Illuminate\Database\Migrations\Migration;
+use Illuminate\Database\Schema\Blueprint;
+use Illuminate\Support\Facades\Schema;
+
+return new class extends Migration
+{
+    /**
+     * Gives the worker's windowed KPI trend its own column, apart from the day-over-day trend
+     */
+    public function up(): void
+    {
+        Schema::table('kpi_values', function (Blueprint $table) {
+            $table->enum('rolling_trend', ['improving', 'stable', 'declining'])->nullable()->after('trend');
+        });
+    }
+
+    public function down(): void
+    {
+        Schema::table('kpi_values', function (Blueprint $table) {
+            $table->dropColumn('rolling_trend');
+        });
+    }
+};
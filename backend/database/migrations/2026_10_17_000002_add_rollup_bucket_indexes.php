@@ -0,0 +1,67 @@
+<?php
+
+use Illuminate\Database\Migrations\Migration;
+use Illuminate\Database\Schema\Blueprint;
+use Illuminate\Support\Facades\Schema;
+
+return new class extends Migration
+{
+    /**
+     * Lets the worker's rollup engine recount one organization's rows for a few days instead of all of them
+     */
+    public function up(): void
+    {
+        Schema::table('organizations', function (Blueprint $table) {
+            $table->index('created_at', 'idx_organizations_created_at');
+        });
+
+        Schema::table('manufacturing_units', function (Blueprint $table) {
+            $table->index(['organization_id', 'created_at'], 'idx_manufacturing_units_org_created');
+        });
+
+        Schema::table('users', function (Blueprint $table) {
+            $table->index(['organization_id', 'created_at'], 'idx_users_org_created');
+        });
+
+        Schema::table('production_orders', function (Blueprint $table) {
+            $table->index(['organization_id', 'created_at'], 'idx_production_orders_org_created');
+        });
+
+        Schema::table('inspections', function (Blueprint $table) {
+            $table->index(['organization_id', 'created_at'], 'idx_inspections_org_created');
+            $table->index(['organization_id', 'inspection_date'], 'idx_inspections_org_date');
+        });
+
+        Schema::table('ncrs', function (Blueprint $table) {
+            $table->index(['organization_id', 'created_at'], 'idx_ncrs_org_created');
+        });
+    }
+
+    public function down(): void
+    {
+        Schema::table('ncrs', function (Blueprint $table) {
+            $table->dropIndex('idx_ncrs_org_created');
+        });
+
+        Schema::table('inspections', function (Blueprint $table) {
+            $table->dropIndex('idx_inspections_org_date');
+            $table->dropIndex('idx_inspections_org_created');
+        });
+
+        Schema::table('production_orders', function (Blueprint $table) {
+            $table->dropIndex('idx_production_orders_org_created');
+        });
+
+        Schema::table('users', function (Blueprint $table) {
+            $table->dropIndex('idx_users_org_created');
+        });
+
+        Schema::table('manufacturing_units', function (Blueprint $table) {
+            $table->dropIndex('idx_manufacturing_units_org_created');
+        });
+
+        Schema::table('organizations', function (Blueprint $table) {
+            $table->dropIndex('idx_organizations_created_at');
+        });
+    }
+};
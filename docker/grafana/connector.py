@@ -1,10 +1,18 @@
+import argparse
 import os
+import signal
+import threading
 import time
 import pymysql
 import requests
 from datetime import datetime, timedelta
 import json
 
+# db_pool.py is a copy of the worker's pool in backend/app/Services/Python,
+# vendored so this container needs nothing from the backend tree.
+from db_pool import ConnectionPool
+from dashboard_sync import DashboardSync
+
 GRAFANA_URL = os.getenv("GRAFANA_URL", "http://general_server_configs:3000")
 GRAFANA_USER = os.getenv("GRAFANA_USER", "admin")
 GRAFANA_PASSWORD = os.getenv("GRAFANA_PASSWORD", "angles")
@@ -13,24 +21,45 @@ DB_PORT = int(os.getenv("DB_PORT", 3306))
 DB_NAME = os.getenv("DB_NAME", "db_erp_drymix_prod")
 DB_USER = os.getenv("DB_USER", "amit")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "angles")
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 2))
+GRAFANA_DASHBOARDS_PATH = os.getenv(
+    "GRAFANA_DASHBOARDS_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "dashboards"),
+)
+GRAFANA_SYNC_WORKERS = int(os.getenv("GRAFANA_SYNC_WORKERS", 8))
+GRAFANA_WATCH = os.getenv("GRAFANA_WATCH", "false").lower() == "true"
+GRAFANA_WATCH_INTERVAL = float(os.getenv("GRAFANA_WATCH_INTERVAL", 5))
 
 
 class GrafanaConnector:
     def __init__(self):
         self.api_base = f"{GRAFANA_URL}/api"
         self.auth = (GRAFANA_USER, GRAFANA_PASSWORD)
-        self.db_connection = None
+        # Every Grafana call goes through one session so connections are kept
+        # alive instead of reopened per request.
+        self.session = requests.Session()
+        self.session.auth = self.auth
+        self.db_pool = None
+
+    def create_db_connection(self):
+        return pymysql.connect(
+            host=DB_HOST,
+            port=DB_PORT,
+            user=DB_USER,
+            password=DB_PASSWORD,
+            database=DB_NAME,
+            cursorclass=pymysql.cursors.DictCursor,
+        )
 
     def connect_db(self):
         try:
-            self.db_connection = pymysql.connect(
-                host=DB_HOST,
-                port=DB_PORT,
-                user=DB_USER,
-                password=DB_PASSWORD,
-                database=DB_NAME,
-                cursorclass=pymysql.cursors.DictCursor,
+            self.db_pool = ConnectionPool(
+                self.create_db_connection,
+                min_size=1,
+                max_size=DB_POOL_MAX_SIZE,
+                name="grafana",
             )
+            self.db_pool.start()
             print(f"Connected to database at {DB_HOST}:{DB_PORT}")
             return True
         except Exception as e:
@@ -39,9 +68,7 @@ class GrafanaConnector:
 
     def test_connection(self):
         try:
-            response = requests.get(
-                f"{self.api_base}/health", auth=self.auth, timeout=5
-            )
+            response = self.session.get(f"{self.api_base}/health", timeout=5)
             return response.status_code == 200
         except:
             return False
@@ -58,8 +85,8 @@ class GrafanaConnector:
         }
 
         try:
-            response = requests.post(
-                f"{self.api_base}/datasources", json=datasource, auth=self.auth
+            response = self.session.post(
+                f"{self.api_base}/datasources", json=datasource, timeout=10
             )
             if response.status_code in [200, 409]:
                 print(
@@ -72,216 +99,43 @@ class GrafanaConnector:
             print(f"Error creating datasource: {e}")
             return False
 
-    def create_dashboard(self, dashboard_data):
-        try:
-            response = requests.post(
-                f"{self.api_base}/dashboards/db", json=dashboard_data, auth=self.auth
-            )
-            if response.status_code == 200:
-                print(
-                    f"Dashboard '{dashboard_data['dashboard']['title']}' created successfully"
-                )
-                return True
-            print(f"Dashboard creation failed: {response.text}")
-            return False
-        except Exception as e:
-            print(f"Error creating dashboard: {e}")
-            return False
-
     def get_kpi_data(self, query):
-        if not self.db_connection:
+        if not self.db_pool:
             return None
 
-        try:
-            with self.db_connection.cursor() as cursor:
+        def fetch(connection):
+            with connection.cursor() as cursor:
                 cursor.execute(query)
-                result = cursor.fetchone()
-                return result
+                return cursor.fetchone()
+
+        try:
+            # Read-only, so a dropped connection is retried once.
+            return self.db_pool.run(fetch, retry=True)
         except Exception as e:
             print(f"Query failed: {e}")
             return None
 
-    def create_organization_dashboard(self):
-        dashboard = {
-            "dashboard": {
-                "id": None,
-                "title": "ERP DryMix - Organization Overview",
-                "tags": ["erp", "organization"],
-                "timezone": "browser",
-                "schemaVersion": 36,
-                "version": 0,
-                "refresh": "30s",
-                "panels": [
-                    {
-                        "id": 1,
-                        "title": "Total Organizations",
-                        "type": "stat",
-                        "gridPos": {"h": 4, "w": 6, "x": 0, "y": 0},
-                        "targets": [
-                            {
-                                "datasource": "ERP DryMix MySQL",
-                                "format": "table",
-                                "rawSql": "SELECT COUNT(*) as value FROM organizations",
-                            }
-                        ],
-                    },
-                    {
-                        "id": 2,
-                        "title": "Total Manufacturing Units",
-                        "type": "stat",
-                        "gridPos": {"h": 4, "w": 6, "x": 6, "y": 0},
-                        "targets": [
-                            {
-                                "datasource": "ERP DryMix MySQL",
-                                "format": "table",
-                                "rawSql": "SELECT COUNT(*) as value FROM manufacturing_units",
-                            }
-                        ],
-                    },
-                    {
-                        "id": 3,
-                        "title": "Active Users",
-                        "type": "stat",
-                        "gridPos": {"h": 4, "w": 6, "x": 12, "y": 0},
-                        "targets": [
-                            {
-                                "datasource": "ERP DryMix MySQL",
-                                "format": "table",
-                                "rawSql": "SELECT COUNT(*) as value FROM users WHERE is_active = 1",
-                            }
-                        ],
-                    },
-                    {
-                        "id": 4,
-                        "title": "Total Production Orders",
-                        "type": "stat",
-                        "gridPos": {"h": 4, "w": 6, "x": 18, "y": 0},
-                        "targets": [
-                            {
-                                "datasource": "ERP DryMix MySQL",
-                                "format": "table",
-                                "rawSql": "SELECT COUNT(*) as value FROM production_orders",
-                            }
-                        ],
-                    },
-                    {
-                        "id": 5,
-                        "title": "Organizations by Status",
-                        "type": "piechart",
-                        "gridPos": {"h": 8, "w": 12, "x": 0, "y": 4},
-                        "targets": [
-                            {
-                                "datasource": "ERP DryMix MySQL",
-                                "format": "table",
-                                "rawSql": "SELECT is_active, COUNT(*) as count FROM organizations GROUP BY is_active",
-                            }
-                        ],
-                    },
-                    {
-                        "id": 6,
-                        "title": "User Growth",
-                        "type": "graph",
-                        "gridPos": {"h": 8, "w": 12, "x": 12, "y": 4},
-                        "targets": [
-                            {
-                                "datasource": "ERP DryMix MySQL",
-                                "format": "time_series",
-                                "rawSql": "SELECT DATE(created_at) as time, COUNT(*) as value FROM users GROUP BY DATE(created_at) ORDER BY time",
-                            }
-                        ],
-                    },
-                ],
-            },
-            "overwrite": True,
-        }
-
-        return self.create_dashboard(dashboard)
-
-    def create_qa_qc_dashboard(self):
-        dashboard = {
-            "dashboard": {
-                "id": None,
-                "title": "ERP DryMix - QA/QC Overview",
-                "tags": ["erp", "qaqc"],
-                "timezone": "browser",
-                "schemaVersion": 36,
-                "version": 0,
-                "refresh": "30s",
-                "panels": [
-                    {
-                        "id": 1,
-                        "title": "Total Inspections",
-                        "type": "stat",
-                        "gridPos": {"h": 4, "w": 4, "x": 0, "y": 0},
-                        "targets": [
-                            {
-                                "datasource": "ERP DryMix MySQL",
-                                "format": "table",
-                                "rawSql": "SELECT COUNT(*) as value FROM inspections",
-                            }
-                        ],
-                    },
-                    {
-                        "id": 2,
-                        "title": "Pass Rate (%)",
-                        "type": "stat",
-                        "gridPos": {"h": 4, "w": 4, "x": 4, "y": 0},
-                        "targets": [
-                            {
-                                "datasource": "ERP DryMix MySQL",
-                                "format": "table",
-                                "rawSql": "SELECT ROUND((SUM(CASE WHEN test_result = 'pass' THEN 1 ELSE 0 END) * 100.0 / COUNT(*)), 2) as value FROM inspections",
-                            }
-                        ],
-                    },
-                    {
-                        "id": 3,
-                        "title": "Open NCs",
-                        "type": "stat",
-                        "gridPos": {"h": 4, "w": 4, "x": 8, "y": 0},
-                        "targets": [
-                            {
-                                "datasource": "ERP DryMix MySQL",
-                                "format": "table",
-                                "rawSql": "SELECT COUNT(*) as value FROM ncr WHERE status IN ('open', 'investigation', 'action_in_progress')",
-                            }
-                        ],
-                    },
-                    {
-                        "id": 4,
-                        "title": "NCs by Category",
-                        "type": "piechart",
-                        "gridPos": {"h": 8, "w": 8, "x": 0, "y": 4},
-                        "targets": [
-                            {
-                                "datasource": "ERP DryMix MySQL",
-                                "format": "table",
-                                "rawSql": "SELECT nc_category, COUNT(*) as count FROM ncr GROUP BY nc_category",
-                            }
-                        ],
-                    },
-                    {
-                        "id": 5,
-                        "title": "Test Results Trend",
-                        "type": "graph",
-                        "gridPos": {"h": 8, "w": 8, "x": 8, "y": 4},
-                        "targets": [
-                            {
-                                "datasource": "ERP DryMix MySQL",
-                                "format": "time_series",
-                                "rawSql": "SELECT test_date as time, COUNT(*) as value FROM inspections GROUP BY test_date ORDER BY test_date",
-                            }
-                        ],
-                    },
-                ],
-            },
-            "overwrite": True,
-        }
-
-        return self.create_dashboard(dashboard)
+    def dashboard_sync(self, dashboards_path=GRAFANA_DASHBOARDS_PATH):
+        return DashboardSync(
+            GRAFANA_URL,
+            self.auth,
+            dashboards_path,
+            session=self.session,
+            workers=GRAFANA_SYNC_WORKERS,
+        )
 
 
 def main():
+    parser = argparse.ArgumentParser(description="ERP DryMix Grafana connector")
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        default=GRAFANA_WATCH,
+        help="keep running and re-sync dashboards when a definition changes",
+    )
+    parser.add_argument("--dashboards", default=GRAFANA_DASHBOARDS_PATH)
+    args = parser.parse_args()
+
     print("Starting Grafana Connector for ERP DryMix...")
     connector = GrafanaConnector()
 
@@ -299,12 +153,20 @@ def main():
     print("Creating datasource...")
     connector.create_datasource()
 
-    print("Creating dashboards...")
-    connector.create_organization_dashboard()
-    connector.create_qa_qc_dashboard()
+    print(f"Syncing dashboards from {args.dashboards}...")
+    sync = connector.dashboard_sync(args.dashboards)
+    print(f"Dashboards synced: {sync.sync()}")
 
     print("Grafana Connector initialized successfully")
-    print("Monitoring for changes...")
+    if not args.watch:
+        return
+
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop_event.set())
+    print(f"Watching {args.dashboards} for changes...")
+    sync.watch(GRAFANA_WATCH_INTERVAL, stop_event)
+    print("Grafana Connector stopped")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,227 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+DEFINITION_SUFFIXES = (".json", ".yaml", ".yml")
+
+# Stored inside each pushed dashboard so the next sync can tell whether
+# Grafana already holds this exact definition.
+HASH_FIELD = "erpProvisioningHash"
+
+# Fields Grafana assigns itself; they are never part of the definition.
+SERVER_FIELDS = ("id", "version", HASH_FIELD)
+
+
+class DashboardDefinition:
+    def __init__(self, path, dashboard):
+        self.path = path
+        stem = os.path.splitext(os.path.basename(path))[0]
+        self.dashboard = {
+            key: value for key, value in dashboard.items() if key not in SERVER_FIELDS
+        }
+        self.dashboard.setdefault("uid", f"erp-{stem.replace('_', '-')}"[:40])
+        self.dashboard.setdefault("title", stem)
+        self.uid = self.dashboard["uid"]
+        self.title = self.dashboard["title"]
+        canonical = json.dumps(self.dashboard, sort_keys=True, separators=(",", ":"))
+        self.content_hash = hashlib.sha256(canonical.encode()).hexdigest()
+
+    def payload(self):
+        return {
+            "dashboard": {**self.dashboard, "id": None, HASH_FIELD: self.content_hash},
+            "overwrite": True,
+            "message": f"Provisioned from {os.path.basename(self.path)}",
+        }
+
+
+def load_definition(path):
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".json"):
+            data = json.load(f)
+        elif yaml is None:
+            raise RuntimeError(f"PyYAML is required to load {path}")
+        else:
+            data = yaml.safe_load(f)
+    if not isinstance(data, dict):
+        raise ValueError(f"{path} does not define a dashboard object")
+    return DashboardDefinition(path, data)
+
+
+class DashboardSync:
+    def __init__(
+        self,
+        grafana_url,
+        auth,
+        dashboards_path,
+        session=None,
+        workers=8,
+        timeout=10,
+    ):
+        self.api_base = f"{grafana_url.rstrip('/')}/api"
+        self.dashboards_path = dashboards_path
+        self.workers = workers
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        self.session.auth = auth
+        # One keep-alive connection per provisioning thread.
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.signatures = {}
+        self.definitions = {}
+        # uid -> hash Grafana is known to hold; None when it holds nothing.
+        self.remote_hashes = {}
+        self.stale_uids = set()
+        self.failed = set()
+
+    def scan(self):
+        signatures = {}
+        for name in sorted(os.listdir(self.dashboards_path)):
+            if not name.endswith(DEFINITION_SUFFIXES):
+                continue
+            path = os.path.join(self.dashboards_path, name)
+            stat = os.stat(path)
+            signatures[path] = (stat.st_mtime_ns, stat.st_size)
+        return signatures
+
+    def has_changes(self):
+        return bool(self.failed or self.stale_uids) or self.scan() != self.signatures
+
+    def reload(self):
+        # Only files whose mtime or size moved are parsed again. A file that
+        # fails to parse keeps its last good definition rather than being
+        # treated as removed.
+        signatures = self.scan()
+        removed = [
+            self.definitions.pop(path)
+            for path in list(self.definitions)
+            if path not in signatures
+        ]
+        for path, signature in signatures.items():
+            if self.signatures.get(path) == signature:
+                continue
+            try:
+                self.definitions[path] = load_definition(path)
+            except Exception as e:
+                print(f"Skipping dashboard definition {path}: {e}")
+        self.signatures = signatures
+        return removed
+
+    def remote_hash(self, uid):
+        response = self.session.get(
+            f"{self.api_base}/dashboards/uid/{uid}", timeout=self.timeout
+        )
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json().get("dashboard", {}).get(HASH_FIELD)
+
+    def push(self, definition):
+        response = self.session.post(
+            f"{self.api_base}/dashboards/db",
+            json=definition.payload(),
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+
+    def delete(self, uid):
+        response = self.session.delete(
+            f"{self.api_base}/dashboards/uid/{uid}", timeout=self.timeout
+        )
+        if response.status_code != 404:
+            response.raise_for_status()
+
+    def provision(self, definition):
+        # Dashboards not seen since start-up are compared with what Grafana
+        # holds; after that the cached hash answers without a request.
+        if definition.uid in self.remote_hashes:
+            remote = self.remote_hashes[definition.uid]
+        else:
+            remote = self.remote_hash(definition.uid)
+        if remote == definition.content_hash:
+            return "unchanged", remote
+        self.push(definition)
+        return "pushed", definition.content_hash
+
+    def sync(self):
+        started = time.perf_counter()
+        removed = self.reload()
+        result = {"pushed": 0, "unchanged": 0, "deleted": 0, "failed": 0}
+
+        definitions = {}
+        for definition in self.definitions.values():
+            if definition.uid in definitions:
+                print(
+                    f"Dashboard uid {definition.uid} in {definition.path} is already "
+                    f"defined in {definitions[definition.uid].path}; skipping"
+                )
+                continue
+            definitions[definition.uid] = definition
+
+        # A removed file only deletes a dashboard this process provisioned,
+        # and only if no other file still defines that uid.
+        self.stale_uids.update(
+            definition.uid
+            for definition in removed
+            if self.remote_hashes.get(definition.uid)
+        )
+        self.stale_uids -= definitions.keys()
+        pending = [
+            definition
+            for definition in definitions.values()
+            if self.remote_hashes.get(definition.uid, "") != definition.content_hash
+        ]
+
+        failed = set()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            provisioned = {
+                definition.uid: executor.submit(self.provision, definition)
+                for definition in pending
+            }
+            deleted = {
+                uid: executor.submit(self.delete, uid) for uid in self.stale_uids
+            }
+
+            for uid, future in provisioned.items():
+                try:
+                    outcome, self.remote_hashes[uid] = future.result()
+                    result[outcome] += 1
+                except Exception as e:
+                    print(f"Dashboard '{definitions[uid].title}' sync failed: {e}")
+                    failed.add(uid)
+            for uid, future in deleted.items():
+                try:
+                    future.result()
+                    self.remote_hashes.pop(uid, None)
+                    self.stale_uids.discard(uid)
+                    result["deleted"] += 1
+                except Exception as e:
+                    print(f"Dashboard {uid} delete failed: {e}")
+
+        result["unchanged"] += len(definitions) - len(pending)
+        result["failed"] = len(failed) + len(self.stale_uids)
+        result["seconds"] = round(time.perf_counter() - started, 3)
+        self.failed = failed
+        return result
+
+    def watch(self, interval=5, stop_event=None):
+        # Polls mtimes rather than relying on inotify, which does not fire
+        # for files changed on a bind-mounted host directory.
+        stop_event = stop_event or threading.Event()
+        while not stop_event.wait(interval):
+            if not self.has_changes():
+                continue
+            result = self.sync()
+            print(f"Dashboards re-synced: {result}")